@@ -148,6 +148,25 @@ Analysis: Based on the extracted birth certificate information, I need to verify
 
 reflection_llm = ChatOpenAI(model=reflection_model, temperature=0, max_tokens=1000, api_key=reflection_model_key, base_url=reflection_model_url)
 
+# Constrain the reflection to this schema so the serving backend (vLLM guided decoding or
+# llama.cpp grammars) returns valid JSON on the first call instead of free text.
+reflection_response_format = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "reflection",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "confidence_score": {"type": "number", "minimum": 0, "maximum": 1},
+                "message": {"type": "string"}
+            },
+            "required": ["confidence_score", "message"],
+            "additionalProperties": False
+        }
+    }
+}
+
 # Prompt for Reflection
 reflection_prompt = ChatPromptTemplate.from_messages(
     [
@@ -173,10 +192,26 @@ reflection_prompt = ChatPromptTemplate.from_messages(
 )
 
 # Bind the prompt to the LLM
-reflect_on_report = reflection_prompt | reflection_llm
+reflect_on_report = reflection_prompt | reflection_llm.bind(response_format=reflection_response_format)
+# Same prompt without response_format, for backends that reject it
+reflect_on_report_plain = reflection_prompt | reflection_llm
+# Cleared the first time the backend rejects response_format, so later reflections skip it
+structured_reflection = True
+
+
+def parse_reflection(content: str):
+    """Return the reflection dict if content is exactly the constrained JSON, else None."""
+    try:
+        result = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(result, dict) and "confidence_score" in result and "message" in result:
+        return result
+    return None
 
 # Reflection Node
 async def reflection_node(state: State) -> State:
+    global structured_reflection
     # Swap message roles for reflection
     cls_map = {"ai": HumanMessage, "human": AIMessage}
     print("***********************")
@@ -192,11 +227,25 @@ async def reflection_node(state: State) -> State:
         try:
             # Create proper input for the prompt template
             prompt_input = {"messages": translated}
-            res = await reflect_on_report.ainvoke(prompt_input)
+            if structured_reflection:
+                try:
+                    res = await reflect_on_report.ainvoke(prompt_input)
+                except openai.BadRequestError as e:
+                    print(f"⚠ Backend rejected response_format ({e}), falling back to the plain prompt")
+                    structured_reflection = False
+                    res = await reflect_on_report_plain.ainvoke(prompt_input)
+            else:
+                res = await reflect_on_report_plain.ainvoke(prompt_input)
             response_content = res.content.strip()
             
             print(f"Reflection attempt {attempt + 1}: {response_content[:200]}...")
-            
+
+            # Constrained decoding makes the whole response the JSON object.
+            if parse_reflection(response_content) is not None:
+                print(f"✓ Valid JSON on attempt {attempt + 1}")
+                return {"messages": [HumanMessage(content=response_content)]}
+
+            # Backends without response_format support may still wrap the JSON in text.
             # Check if response contains valid JSON structure
             import re
             if '"confidence_score"' in response_content and '"message"' in response_content:
@@ -237,6 +237,8 @@ if [ $? -eq 0 ]; then
             export AWS_REGION="$REGION"
             export VECTOR_INDEX_NAME="knowledge-embeddings"
             export EMBEDDING_DIMENSION="384"
+            # Optional k-NN profile (see src/utils/index_profiles.py); unset keeps the built-in mapping
+            export VECTOR_INDEX_PROFILE="${VECTOR_INDEX_PROFILE:-}"
             export SERVICE_ACCOUNT_ROLE_ARN="$SERVICE_ACCOUNT_ROLE_ARN"
             
             # Run the index setup script
@@ -13,6 +13,19 @@ from opensearchpy.exceptions import ConnectionError, ConnectionTimeout
 import boto3
 from requests_aws4auth import AWS4Auth
 
+def load_index_body():
+    """Load index_body from src/utils/index_profiles.py by path.
+
+    Importing it through the src package would pull in the app's config and
+    its dependencies, which this standalone script does not install.
+    """
+    import importlib.util
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "utils", "index_profiles.py")
+    spec = importlib.util.spec_from_file_location("index_profiles", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.index_body
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -227,7 +240,7 @@ def create_opensearch_client(endpoint, region, service_account_role_arn=None):
         logger.error(f"Failed to create OpenSearch client: {e}")
         raise
 
-def create_opensearch_index(endpoint, region, index_name, dimension=384, service_account_role_arn=None):
+def create_opensearch_index(endpoint, region, index_name, dimension=384, service_account_role_arn=None, profile=None):
     """Create OpenSearch index with vector mapping"""
     max_retries = 3
     retry_delay = 10
@@ -290,6 +303,12 @@ def create_opensearch_index(endpoint, region, index_name, dimension=384, service
                 }
             }
             
+            # A named profile replaces the mapping above, keeping the single-shard layout
+            if profile:
+                index_mapping = load_index_body()(profile, dimension)
+                index_mapping["settings"]["index"].update({"number_of_shards": 1, "number_of_replicas": 0})
+                logger.info(f"Using index profile '{profile}'")
+            
             logger.info(f"Creating index '{index_name}' with {dimension}-dimensional vectors...")
             response = client.indices.create(index=index_name, body=index_mapping)
             logger.info(f"Index created successfully: {response}")
@@ -315,6 +334,7 @@ def main():
     index_name = os.getenv('VECTOR_INDEX_NAME', 'knowledge-embeddings')
     dimension = int(os.getenv('EMBEDDING_DIMENSION', '384'))
     service_account_role_arn = os.getenv('SERVICE_ACCOUNT_ROLE_ARN')
+    profile = os.getenv('VECTOR_INDEX_PROFILE')
     
     if not endpoint:
         logger.error("OPENSEARCH_ENDPOINT environment variable is required")
@@ -325,6 +345,8 @@ def main():
     print(f"   Region: {region}")
     print(f"   Index: {index_name}")
     print(f"   Dimension: {dimension}")
+    if profile:
+        print(f"   Profile: {profile}")
     if service_account_role_arn:
         print(f"   Using Role: {service_account_role_arn}")
         
@@ -362,7 +384,7 @@ def main():
     print()
     
     try:
-        success = create_opensearch_index(endpoint, region, index_name, dimension, service_account_role_arn)
+        success = create_opensearch_index(endpoint, region, index_name, dimension, service_account_role_arn, profile)
         if success:
             print("✅ OpenSearch index created successfully!")
             print(f"   Index name: {index_name}")
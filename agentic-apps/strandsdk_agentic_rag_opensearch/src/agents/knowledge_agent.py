@@ -91,8 +91,8 @@ def embed_knowledge_files() -> str:
                             df = pd.read_csv(file_path)
                             logger.info(f"CSV file has {len(df)} rows and {len(df.columns)} columns")
                             
-                            # Process each row
-                            csv_success_count = 0
+                            # Collect the rows, then embed and index them in batches
+                            documents = []
                             for index, row in df.iterrows():
                                 try:
                                     # Check if the CSV has question and context columns
@@ -121,20 +121,16 @@ def embed_knowledge_files() -> str:
                                     if 'question' in df.columns:
                                         metadata['question'] = row['question'][:100]  # First 100 chars
                                     
-                                    # Add to retriever
-                                    row_success = retriever.add_document(
-                                        content=document,
-                                        metadata=metadata
-                                    )
-                                    
-                                    if row_success:
-                                        csv_success_count += 1
-                                    
+                                    documents.append({"content": document, "metadata": metadata})
                                     total_rows += 1
                                     
                                 except Exception as e:
                                     logger.error(f"Error processing CSV row {index}: {e}")
                             
+                            # Add to retriever
+                            index_result = retriever.index_documents(documents)
+                            csv_success_count = index_result["indexed"]
+                            
                             logger.info(f"Successfully embedded {csv_success_count} out of {len(df)} rows from {file_path}")
                             
                             if csv_success_count > 0:
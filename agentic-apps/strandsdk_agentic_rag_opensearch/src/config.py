@@ -19,6 +19,14 @@ class Config:
     EMBEDDING_API_KEY: str = os.getenv("EMBEDDING_API_KEY", os.getenv("OPENAI_API_KEY", ""))
     EMBEDDING_BASE_URL: str = os.getenv("EMBEDDING_BASE_URL", os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"))
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "llamacpp-embedding")
+    EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "384"))
+    # float (JSON lists), base64 (float32) or float16 (base64 half precision, llama.cpp embedding service only)
+    EMBEDDING_ENCODING_FORMAT: str = os.getenv("EMBEDDING_ENCODING_FORMAT", "base64")
+    # Texts per /embeddings request and requests in flight for batch embedding
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+    EMBEDDING_TIMEOUT: float = float(os.getenv("EMBEDDING_TIMEOUT", "30"))
     
     # Legacy OpenAI Configuration (for backward compatibility)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
@@ -28,6 +36,10 @@ class Config:
     # AWS Configuration
     AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
     OPENSEARCH_ENDPOINT: str = os.getenv("OPENSEARCH_ENDPOINT", "")
+    # SigV4 service name: es for managed domains, aoss for OpenSearch Serverless
+    OPENSEARCH_SERVICE: str = os.getenv("OPENSEARCH_SERVICE", "es")
+    # Keep-alive connections held by the shared OpenSearch client
+    OPENSEARCH_POOL_MAXSIZE: int = int(os.getenv("OPENSEARCH_POOL_MAXSIZE", "16"))
     
     # Tavily MCP Configuration
     TAVILY_MCP_SERVICE_URL: str = os.getenv("TAVILY_MCP_SERVICE_URL", "http://localhost:8001/mcp")
@@ -43,8 +55,22 @@ class Config:
     EMBEDDING_ENDPOINT: str = os.getenv("EMBEDDING_ENDPOINT", "")
     
     # Vector Search Configuration
+    # opensearch, or memory for the in-process stand-in used by the async server path
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "opensearch")
     VECTOR_INDEX_NAME: str = os.getenv("VECTOR_INDEX_NAME", "knowledge-embeddings")
+    # k-NN engine/method profile for new indexes, see src/utils/index_profiles.py
+    VECTOR_INDEX_PROFILE: str = os.getenv("VECTOR_INDEX_PROFILE", "default")
     TOP_K_RESULTS: int = int(os.getenv("TOP_K_RESULTS", "5"))
+    # Per-query k-NN defaults; 0 keeps the index's own setting
+    VECTOR_SEARCH_EF_SEARCH: int = int(os.getenv("VECTOR_SEARCH_EF_SEARCH", "0"))
+    VECTOR_SEARCH_NPROBES: int = int(os.getenv("VECTOR_SEARCH_NPROBES", "0"))
+    VECTOR_SEARCH_OVERSAMPLE_FACTOR: float = float(os.getenv("VECTOR_SEARCH_OVERSAMPLE_FACTOR", "0"))
+    
+    # Bulk Indexing Configuration
+    BULK_CHUNK_SIZE: int = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+    BULK_MAX_CHUNK_BYTES: int = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+    BULK_THREAD_COUNT: int = int(os.getenv("BULK_THREAD_COUNT", "4"))
+    BULK_MAX_RETRIES: int = int(os.getenv("BULK_MAX_RETRIES", "3"))
     
     @classmethod
     def is_langfuse_enabled(cls) -> bool:
@@ -56,8 +82,9 @@ class Config:
         """Validate required configuration."""
         required_vars = [
             ("LITELLM_API_KEY", cls.LITELLM_API_KEY),
-            ("OPENSEARCH_ENDPOINT", cls.OPENSEARCH_ENDPOINT),
         ]
+        if cls.VECTOR_STORE_BACKEND != "memory":
+            required_vars.append(("OPENSEARCH_ENDPOINT", cls.OPENSEARCH_ENDPOINT))
         
         missing_vars = [name for name, value in required_vars if not value]
         
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+k-NN Recall / Latency Benchmark
+
+Loads every vector from the index, computes exact cosine ground truth
+with NumPy, then replays the same queries against OpenSearch for each
+combination of search parameters and reports recall@k next to p50/p95
+latency. Queries are indexed vectors with Gaussian noise added, so each
+has real near neighbours in the corpus.
+
+Usage:
+    python -m src.scripts.benchmark_knn_recall --ef-search 0 32 64 128 256
+    python -m src.scripts.benchmark_knn_recall --k 10 --oversample-factor 0 2 3
+"""
+
+import argparse
+import itertools
+import time
+import numpy as np
+from opensearchpy.helpers import scan
+from ..config import config
+from ..tools.opensearch_vector_store import OpenSearchVectorStore, build_similarity_query
+from ..utils.vector_ops import normalize_rows
+
+
+def load_vectors(vector_store):
+    """All (ids, vectors) in the index, streamed with scroll."""
+    ids, vectors = [], []
+    for hit in scan(vector_store.client, index=vector_store.index_name, _source=["embedding"], size=1000):
+        ids.append(hit["_id"])
+        vectors.append(hit["_source"]["embedding"])
+    return np.array(ids), np.asarray(vectors, dtype=np.float32)
+
+
+def exact_neighbours(corpus, queries, k):
+    """Exact top-k by cosine similarity, as row indices into corpus."""
+    scores = normalize_rows(queries) @ normalize_rows(corpus).T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def run_setting(vector_store, queries, k, warmup, **search_params):
+    """Run every query with one parameter setting; returns (retrieved ids, latencies in ms)."""
+    def search(vector):
+        body = build_similarity_query(vector.tolist(), k, **search_params)
+        body["_source"] = False
+        return vector_store.client.search(index=vector_store.index_name, body=body)
+
+    for vector in queries[:warmup]:
+        search(vector)
+
+    retrieved, latencies = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        response = search(vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        retrieved.append([hit["_id"] for hit in response["hits"]["hits"]])
+    return retrieved, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark k-NN recall against latency")
+    parser.add_argument("--index", default=config.VECTOR_INDEX_NAME)
+    parser.add_argument("--k", type=int, default=config.TOP_K_RESULTS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="Std of the noise added to sampled vectors")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[0], help="0 = index default")
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[0], help="0 = index default")
+    parser.add_argument("--oversample-factor", type=float, nargs="+", default=[0], help="0 = no rescoring")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vector_store = OpenSearchVectorStore(args.index)
+    ids, corpus = load_vectors(vector_store)
+    if len(ids) < args.k:
+        raise SystemExit(f"{args.index} holds {len(ids)} vectors, fewer than k={args.k}")
+
+    rng = np.random.default_rng(args.seed)
+    sample = corpus[rng.choice(len(corpus), size=args.queries, replace=len(corpus) < args.queries)]
+    queries = sample + rng.normal(0, args.noise, sample.shape).astype(np.float32)
+    truth = [set(row) for row in ids[exact_neighbours(corpus, queries, args.k)]]
+    print(f"{args.index}: {len(ids)} vectors x {corpus.shape[1]} dims, {args.queries} queries, k={args.k}")
+
+    print(f"{'ef_search':>9} {'nprobes':>7} {'oversample':>10} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for ef_search, nprobes, oversample_factor in itertools.product(args.ef_search, args.nprobes,
+                                                                  args.oversample_factor):
+        try:
+            retrieved, latencies = run_setting(
+                vector_store, queries, args.k, args.warmup,
+                ef_search=ef_search, nprobes=nprobes, oversample_factor=oversample_factor
+            )
+        except Exception as e:
+            print(f"{ef_search:>9} {nprobes:>7} {oversample_factor:>10} failed: {e}")
+            continue
+        recall = np.mean([len(expected.intersection(found)) / args.k for expected, found in zip(truth, retrieved)])
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"{ef_search:>9} {nprobes:>7} {oversample_factor:>10} {recall:>9.4f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
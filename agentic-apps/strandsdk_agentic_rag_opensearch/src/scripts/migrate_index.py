@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Vector Index Migration Script
+
+Rebuilds the vector index with another k-NN profile and moves the
+VECTOR_INDEX_NAME alias to the new index once every document has been
+copied, so searches keep working throughout; writes are blocked only for
+the final catch-up pass. Profiles that need a trained model (large-scale
+IVF-PQ) are trained on the current index first. The first migration of a
+plain index replaces it with the alias and needs --delete-old.
+
+Usage:
+    python -m src.scripts.migrate_index --profile memory-optimized --delete-old
+    python -m src.scripts.migrate_index --list
+"""
+
+import argparse
+import json
+import sys
+from ..config import config
+from ..tools.opensearch_vector_store import OpenSearchVectorStore
+from ..utils.index_profiles import INDEX_PROFILES
+from ..utils.logging import setup_logging, log_title
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the vector index to another k-NN profile")
+    parser.add_argument("--profile", choices=list(INDEX_PROFILES), help="Target index profile")
+    parser.add_argument("--index", default=config.VECTOR_INDEX_NAME, help="Index or alias to migrate")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete the previous index after the swap (required while it is not behind an alias)")
+    parser.add_argument("--list", action="store_true", help="Print the available profiles and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, profile in INDEX_PROFILES.items():
+            print(f"{name}: {json.dumps(profile)}")
+        return
+    if not args.profile:
+        parser.error("--profile is required")
+
+    setup_logging()
+    config.validate_config()
+    log_title("VECTOR INDEX MIGRATION")
+
+    vector_store = OpenSearchVectorStore(args.index)
+    try:
+        target = vector_store.migrate_index(args.profile, delete_old=args.delete_old)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+    print(f"✅ {args.index} now serves from {target} ({args.profile})")
+    print(f"Documents: {vector_store.get_document_count()}")
+
+
+if __name__ == "__main__":
+    main()
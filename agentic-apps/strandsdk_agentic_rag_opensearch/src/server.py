@@ -90,9 +90,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import uvicorn
+from opensearchpy import RequestError
 
 from src.config import config
 from src.utils.logging import setup_logging, log_title
+from src.utils.vector_ops import resize_rows
+from src.tools.async_opensearch_vector_store import create_async_vector_store
+from src.tools.embedding_client import get_embedding_client
 from src.agents.supervisor_agent import supervisor_agent, create_fresh_supervisor_agent
 from src.agents.knowledge_agent import knowledge_agent
 from src.agents.mcp_agent import mcp_agent
@@ -116,8 +120,16 @@ class HealthResponse(BaseModel):
 class EmbedRequest(BaseModel):
     force_refresh: bool = Field(default=False, description="Force refresh of all embeddings")
 
+class SearchRequest(BaseModel):
+    query: str = Field(..., description="Text to search the knowledge base for", max_length=1000)
+    top_k: int = Field(default=3, ge=1, le=50, description="Number of results to return")
+    ef_search: Optional[int] = Field(default=None, ge=0, description="HNSW ef_search override (0 = index default)")
+    nprobes: Optional[int] = Field(default=None, ge=0, description="IVF nprobes override (0 = index default)")
+    oversample_factor: Optional[float] = Field(default=None, ge=0, description="Rescoring oversample factor for quantized indexes")
+
 # Global variables for service status
 tavily_server_process = None
+vector_store = None  # Async vector store used by /search
 service_status = {
     "tavily_mcp_server": "starting",
     "opensearch": "unknown",
@@ -127,7 +139,7 @@ service_status = {
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
-    global tavily_server_process, service_status
+    global tavily_server_process, service_status, vector_store
     
     # Startup
     logger = logging.getLogger(__name__)
@@ -176,6 +188,12 @@ async def lifespan(app: FastAPI):
             service_status["knowledge_base"] = "error"
             logger.warning(f"Knowledge base check failed: {e}")
         
+        # Async vector store for the non-blocking search path
+        try:
+            vector_store = create_async_vector_store()
+        except Exception as e:
+            logger.warning(f"Async vector store initialization failed: {e}")
+        
         # Initialize MCP client during startup to avoid blocking during requests
         try:
             from src.agents.supervisor_agent import get_tavily_mcp_client
@@ -208,6 +226,13 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down FastAPI server...")
+    from src.tools.embedding_client import close_embedding_clients
+    from src.utils.opensearch_client import close_async_opensearch_clients, close_opensearch_clients
+    if vector_store is not None:
+        await vector_store.close()
+    await close_async_opensearch_clients()
+    close_embedding_clients()
+    close_opensearch_clients()
     # No need to terminate Tavily server as it's running in a separate Kubernetes service
 
 async def check_tavily_server():
@@ -291,6 +316,7 @@ async def root():
         "endpoints": {
             "health": "/health",
             "query": "/query",
+            "search": "/search",
             "embed": "/embed",
             "status": "/status",
             "docs": "/docs"
@@ -319,8 +345,9 @@ async def process_query(request: QueryRequest, background_tasks: BackgroundTasks
         # Create a fresh agent instance for each query to avoid context accumulation
         fresh_agent = create_fresh_supervisor_agent()
         
-        # Process the query
-        response = fresh_agent(query)
+        # The agent and its tools are synchronous; run them on a worker thread
+        # so other requests keep being served while this one is processed
+        response = await asyncio.to_thread(fresh_agent, query)
         
         # Ensure response is properly formatted
         if response is None:
@@ -367,6 +394,34 @@ async def process_query(request: QueryRequest, background_tasks: BackgroundTasks
             status="error"
         )
 
+@app.post("/search")
+async def search_knowledge(request: SearchRequest):
+    """Vector search over the knowledge base without blocking the event loop."""
+    if vector_store is None:
+        raise HTTPException(status_code=503, detail="Vector store is not initialized")
+    
+    try:
+        embedding = await get_embedding_client().embed_async(request.query)
+        query_vector = resize_rows(embedding[None, :], config.EMBEDDING_DIMENSION)[0].tolist()
+        results = await vector_store.similarity_search(
+            query_vector,
+            k=request.top_k,
+            ef_search=request.ef_search,
+            nprobes=request.nprobes,
+            oversample_factor=request.oversample_factor
+        )
+        return {
+            "query": request.query,
+            "results": results,
+            "total_results": len(results)
+        }
+    except RequestError as e:
+        logger.warning(f"Search rejected by OpenSearch: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid search request: {e.error}")
+    except Exception as e:
+        logger.error(f"Error searching knowledge base: {e}")
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
 @app.post("/embed")
 async def embed_knowledge(request: EmbedRequest, background_tasks: BackgroundTasks):
     """Embed knowledge documents into the vector database."""
@@ -0,0 +1,185 @@
+"""Async vector stores for the FastAPI request path."""
+
+import itertools
+import json
+import logging
+from typing import List, Dict, Any, Optional
+import numpy as np
+from opensearchpy import AsyncOpenSearch, JSONSerializer, RequestError
+from opensearchpy.helpers import async_bulk
+from .opensearch_vector_store import build_similarity_query, document_actions, parse_similarity_hits
+from ..config import config
+from ..utils.opensearch_client import get_async_opensearch_client
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOpenSearchVectorStore:
+    """Vector store on AsyncOpenSearch, so searches never block the event loop."""
+
+    def __init__(self, index_name: str = None, client: Optional[AsyncOpenSearch] = None):
+        self.index_name = index_name or config.VECTOR_INDEX_NAME
+        # Shared per process; SigV4-signed with refreshable credentials
+        self.client = client or get_async_opensearch_client()
+
+    async def similarity_search(
+        self,
+        query_vector: List[float],
+        k: int = None,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        **search_params
+    ) -> List[Dict[str, Any]]:
+        """Perform similarity search; search_params as in OpenSearchVectorStore.similarity_search."""
+        k = k or config.TOP_K_RESULTS
+
+        try:
+            response = await self.client.search(
+                index=self.index_name,
+                body=build_similarity_query(query_vector, k, filter_dict, **search_params)
+            )
+            results = parse_similarity_hits(response)
+            logger.info(f"Found {len(results)} similar documents")
+            return results
+
+        except RequestError:
+            # Rejected query, e.g. method_parameters on an nmslib index; not the same as no results
+            raise
+        except Exception as e:
+            logger.error(f"Failed to perform similarity search: {e}")
+            return []
+
+    async def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
+        """Add multiple documents with embeddings to the vector store."""
+        try:
+            # Items rejected with 429 are retried with backoff by the bulk helper
+            indexed, errors = await async_bulk(
+                self.client,
+                document_actions(self.index_name, documents),
+                chunk_size=config.BULK_CHUNK_SIZE,
+                max_chunk_bytes=config.BULK_MAX_CHUNK_BYTES,
+                max_retries=config.BULK_MAX_RETRIES,
+                raise_on_error=False
+            )
+            await self.client.indices.refresh(index=self.index_name)
+
+            if errors:
+                logger.error(f"Bulk indexing errors: {errors[:10]}")
+                return False
+
+            logger.info(f"Successfully indexed {indexed} documents")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to add documents: {e}")
+            return False
+
+    async def get_document_count(self) -> int:
+        """Get the number of documents in the index."""
+        try:
+            response = await self.client.count(index=self.index_name)
+            return response["count"]
+        except Exception as e:
+            logger.error(f"Failed to get document count: {e}")
+            return 0
+
+    async def close(self) -> None:
+        """Release this store; the shared client is closed by close_async_opensearch_clients()."""
+        self.client = None
+
+
+class _InMemoryIndices:
+    def __init__(self, client: "InMemoryAsyncOpenSearch"):
+        self.client = client
+
+    async def refresh(self, index: str = None, **kwargs) -> Dict[str, Any]:
+        return {"_shards": {"failed": 0}}
+
+
+class _InMemoryTransport:
+    serializer = JSONSerializer()
+
+
+class InMemoryAsyncOpenSearch:
+    """
+    In-process stand-in for the AsyncOpenSearch client.
+
+    Implements the calls AsyncOpenSearchVectorStore makes (search, bulk,
+    count, indices.refresh, close) over exact NumPy cosine similarity,
+    scored as the Lucene engine scores cosinesimil ((1 + cosine) / 2). k-NN
+    queries may be wrapped in a bool query with term filters on dotted
+    fields, e.g. {"metadata.source": "q_c_data.csv"}; search parameters such
+    as method_parameters are accepted and ignored since the search is exact.
+    Inject it through the store's client parameter for local runs without a
+    cluster (VECTOR_STORE_BACKEND=memory) and in tests.
+    """
+
+    def __init__(self):
+        self.indices = _InMemoryIndices(self)
+        self.transport = _InMemoryTransport()
+        self._documents: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._ids = itertools.count()
+
+    @staticmethod
+    def _field(source: Dict[str, Any], path: str) -> Any:
+        value: Any = source
+        for part in path.split("."):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+
+    async def bulk(self, body: str = None, *args, **kwargs) -> Dict[str, Any]:
+        """Apply an NDJSON bulk body of index actions."""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            op_type, meta = next(iter(action.items()))
+            doc_id = str(meta.get("_id") or next(self._ids))
+            self._documents.setdefault(meta["_index"], {})[doc_id] = source
+            items.append({op_type: {"_index": meta["_index"], "_id": doc_id, "status": 201, "result": "created"}})
+        return {"took": 0, "errors": False, "items": items}
+
+    async def search(self, index: str, body: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        """Exact k-NN search for the query bodies build_similarity_query produces."""
+        query = body["query"]
+        filters = []
+        if "bool" in query:
+            filters = [clause["term"] for clause in query["bool"].get("filter", [])]
+            query = query["bool"]["must"][0]
+        knn = query["knn"]["embedding"]
+
+        documents = [
+            (doc_id, source) for doc_id, source in self._documents.get(index, {}).items()
+            if all(self._field(source, key) == value for term in filters for key, value in term.items())
+        ]
+        hits = []
+        if documents:
+            vectors = np.asarray([source["embedding"] for _, source in documents], dtype=np.float32)
+            query_vector = np.asarray(knn["vector"], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+            cosine = np.divide(vectors @ query_vector, norms, out=np.zeros(len(documents), dtype=np.float32),
+                               where=norms != 0)
+            scores = (1.0 + cosine) / 2.0
+            fields = body.get("_source")
+            for i in np.argsort(-scores, kind="stable")[:min(knn["k"], body.get("size", knn["k"]))]:
+                doc_id, source = documents[i]
+                if isinstance(fields, list):
+                    source = {field: source[field] for field in fields if field in source}
+                hits.append({"_index": index, "_id": doc_id, "_score": float(scores[i]), "_source": source})
+        return {"hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+    async def count(self, index: str, **kwargs) -> Dict[str, Any]:
+        return {"count": len(self._documents.get(index, {}))}
+
+    async def close(self) -> None:
+        """Nothing to release."""
+
+
+def create_async_vector_store(index_name: str = None):
+    """Build the async vector store selected by VECTOR_STORE_BACKEND."""
+    if config.VECTOR_STORE_BACKEND == "memory":
+        logger.info("Using in-memory vector store")
+        return AsyncOpenSearchVectorStore(index_name, client=InMemoryAsyncOpenSearch())
+    return AsyncOpenSearchVectorStore(index_name)
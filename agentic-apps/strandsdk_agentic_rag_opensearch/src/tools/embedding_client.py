@@ -0,0 +1,260 @@
+"""Pooled async client for the OpenAI-compatible embedding endpoint."""
+
+import asyncio
+import base64
+import importlib.util
+import logging
+import random
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Union
+import httpx
+import numpy as np
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Little-endian dtype of base64 embeddings for each binary encoding_format
+EMBEDDING_DTYPES = {"base64": "<f4", "float16": "<f2"}
+
+# Responses worth retrying; other errors are returned to the caller immediately
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# httpx negotiates HTTP/2 over TLS only when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class EmbeddingRequestError(Exception):
+    """Raised when an embedding request still fails after its retries."""
+
+
+def decode_embedding(embedding: Union[str, List[float]], encoding_format: str) -> np.ndarray:
+    """Decode an embedding returned as base64 bytes or as a JSON float list.
+
+    Base64 payloads are viewed in place with np.frombuffer; servers that
+    ignore encoding_format and answer with floats are handled as well.
+    """
+    if isinstance(embedding, str):
+        dtype = EMBEDDING_DTYPES.get(encoding_format, "<f4")
+        return np.frombuffer(base64.b64decode(embedding), dtype=dtype)
+    return np.asarray(embedding, dtype=np.float32)
+
+
+class AsyncEmbeddingClient:
+    """Async embedding client over one keep-alive httpx connection pool."""
+
+    def __init__(
+        self,
+        model: str = None,
+        base_url: str = None,
+        api_key: str = None,
+        encoding_format: str = None,
+        batch_size: int = None,
+        max_concurrency: int = None,
+        max_retries: int = None,
+        timeout: float = None
+    ):
+        self.model = model or config.EMBEDDING_MODEL
+        self.encoding_format = encoding_format or config.EMBEDDING_ENCODING_FORMAT
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.max_concurrency = max_concurrency or config.EMBEDDING_MAX_CONCURRENCY
+        self.max_retries = config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or config.EMBEDDING_TIMEOUT
+        self.api_key = api_key or config.EMBEDDING_API_KEY
+
+        # Check if the endpoint already ends with /embeddings
+        endpoint = base_url or config.EMBEDDING_BASE_URL
+        if endpoint.endswith('/embeddings'):
+            self.request_url = endpoint
+        else:
+            self.request_url = f"{endpoint}/embeddings"
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60.0
+                ),
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {self.api_key}'
+                }
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _request_body(self, texts: List[str]) -> Dict[str, Any]:
+        data = {
+            'model': self.model,
+            'input': texts
+        }
+        if self.encoding_format != 'float':
+            data['encoding_format'] = self.encoding_format
+        return data
+
+    def _parse(self, response_data: Dict[str, Any], count: int) -> List[np.ndarray]:
+        items = (response_data or {}).get('data') or []
+        if len(items) != count:
+            raise ValueError(f"Embedding API returned {len(items)} embeddings for {count} inputs")
+
+        embeddings = [None] * count
+        for position, item in enumerate(items):
+            if not item or not item.get('embedding'):
+                raise ValueError("Embedding API didn't return a valid embedding")
+            embeddings[item.get('index', position)] = decode_embedding(item['embedding'], self.encoding_format)
+        return embeddings
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After when it sends one."""
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return random.uniform(0, min(10.0, 0.25 * 2 ** attempt))
+
+    async def _post(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts with one request, retrying transport errors and overload responses."""
+        client = self._get_client()
+        body = self._request_body(texts)
+        error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    response = await client.post(self.request_url, json=body)
+            except httpx.TransportError as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return self._parse(response.json(), len(texts))
+                error = EmbeddingRequestError(f"HTTP {response.status_code}: {response.text[:200]}")
+                retry_after = response.headers.get('retry-after')
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(f"Embedding request failed ({error}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        raise EmbeddingRequestError(
+            f"Embedding request failed after {self.max_retries + 1} attempts: {error}"
+        ) from error
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed a single text."""
+        return (await self._post([text]))[0]
+
+    async def _embed_chunk(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], List[Optional[str]]]:
+        """Embed one chunk, retrying its texts one by one if the chunk request fails."""
+        try:
+            return await self._post(texts), [None] * len(texts)
+        except Exception as e:
+            if len(texts) == 1:
+                return [None], [str(e)]
+            logger.warning(f"Embedding batch of {len(texts)} failed ({e}), retrying texts individually")
+
+        results = await asyncio.gather(*(self._post([text]) for text in texts), return_exceptions=True)
+        embeddings = [None if isinstance(result, Exception) else result[0] for result in results]
+        errors = [str(result) if isinstance(result, Exception) else None for result in results]
+        return embeddings, errors
+
+    async def embed_many(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], Dict[int, str]]:
+        """
+        Embed texts with array requests of batch_size inputs, max_concurrency at a time.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            The embeddings in input order (None where a text failed) and the
+            error message for each failed index
+        """
+        chunks = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        embeddings: List[Optional[np.ndarray]] = []
+        errors: Dict[int, str] = {}
+        if chunks:
+            logger.info(f"Embedding {len(texts)} texts in {len(chunks)} batches of up to {self.batch_size}")
+        for chunk_embeddings, chunk_errors in await asyncio.gather(*(self._embed_chunk(chunk) for chunk in chunks)):
+            for embedding, error in zip(chunk_embeddings, chunk_errors):
+                if error is not None:
+                    errors[len(embeddings)] = error
+                embeddings.append(embedding)
+        return embeddings, errors
+
+    async def close(self) -> None:
+        """Close the pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class EmbeddingClient:
+    """
+    Blocking facade over AsyncEmbeddingClient for synchronous callers such as the Strands tools.
+
+    The async client lives on a private event loop thread, so its pooled
+    connections survive across calls and callers may themselves be running
+    inside another event loop.
+    """
+
+    def __init__(self, async_client: AsyncEmbeddingClient = None):
+        self.async_client = async_client or AsyncEmbeddingClient()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="embedding-client", daemon=True)
+        self._thread.start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text."""
+        return self._run(self.async_client.embed(text))
+
+    def embed_many(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], Dict[int, str]]:
+        """Embed texts in batches; see AsyncEmbeddingClient.embed_many."""
+        return self._run(self.async_client.embed_many(texts))
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        """Embed a single text from another event loop without blocking it."""
+        future = asyncio.run_coroutine_threadsafe(self.async_client.embed(text), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        """Close the connections and stop the event loop thread."""
+        self._run(self.async_client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+# Process-wide clients by model, shared by every EmbeddingRetriever
+_clients: Dict[str, EmbeddingClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_embedding_client(model: str = None) -> EmbeddingClient:
+    """Return the shared client for a model, creating it on first use."""
+    model = model or config.EMBEDDING_MODEL
+    with _clients_lock:
+        client = _clients.get(model)
+        if client is None:
+            client = _clients[model] = EmbeddingClient(AsyncEmbeddingClient(model=model))
+            logger.info(f"Embedding client created for {model} at {client.async_client.request_url} "
+                        f"(http2={HTTP2_AVAILABLE}, pool={client.async_client.max_concurrency})")
+        return client
+
+
+def close_embedding_clients() -> None:
+    """Close every shared embedding client."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -1,13 +1,14 @@
 """Embedding retriever for RAG functionality."""
 
 import logging
-import math
 import random
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from .embedding_client import get_embedding_client
 from .opensearch_vector_store import OpenSearchVectorStore
 from ..config import config
 from ..utils.logging import log_title
+from ..utils.vector_ops import normalize_rows, resize_rows
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +19,9 @@ class EmbeddingRetriever:
         self.embedding_model = embedding_model or config.EMBEDDING_MODEL
         self.vector_store = OpenSearchVectorStore()
         self.embedding_endpoint = config.EMBEDDING_BASE_URL
-        self.api_key = config.EMBEDDING_API_KEY
-        self.target_dimension = 384  # Target dimension for embeddings
+        self.target_dimension = config.EMBEDDING_DIMENSION  # Target dimension for embeddings
+        # Shared per process so every retriever reuses the same pooled connections
+        self.client = get_embedding_client(self.embedding_model)
     
     def embed_document(self, document: str) -> List[float]:
         """Embed a document and add it to the vector store."""
@@ -39,30 +41,38 @@ class EmbeddingRetriever:
     
     def normalize_vector(self, vector: List[float]) -> List[float]:
         """Normalize a vector to unit length."""
-        magnitude = math.sqrt(sum(val * val for val in vector))
-        if magnitude == 0:
-            return vector
-        return [val / magnitude for val in vector]
+        return normalize_rows(np.asarray([vector], dtype=np.float64))[0].tolist()
     
     def resize_embedding(self, embedding: List[float]) -> List[float]:
         """Resize embedding to target dimension."""
         if len(embedding) == self.target_dimension:
             return embedding
+        return resize_rows(np.asarray([embedding], dtype=np.float64), self.target_dimension)[0].tolist()
+    
+    def embed_batch(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        """
+        Embed texts with batched requests through the shared embedding client.
         
-        result = [0.0] * self.target_dimension
-        ratio = len(embedding) / self.target_dimension
-        
-        for i in range(self.target_dimension):
-            start = int(i * ratio)
-            end = int((i + 1) * ratio)
-            if end > len(embedding):
-                end = len(embedding)
+        Args:
+            texts: Texts to embed
             
-            if start < end:
-                sum_val = sum(embedding[j] for j in range(start, end))
-                result[i] = sum_val / (end - start)
+        Returns:
+            The embeddings in input order (None where a text failed) and the
+            error message for each failed index
+        """
+        embeddings, errors = self.client.embed_many(texts)
+        resized: List[Optional[List[float]]] = [None] * len(embeddings)
         
-        return self.normalize_vector(result)
+        # Resize all embeddings of the same width as one (n, d) batch
+        by_dimension: Dict[int, List[int]] = {}
+        for index, embedding in enumerate(embeddings):
+            if embedding is not None:
+                by_dimension.setdefault(len(embedding), []).append(index)
+        for indices in by_dimension.values():
+            batch = resize_rows(np.stack([embeddings[index] for index in indices]), self.target_dimension)
+            for index, row in zip(indices, batch.tolist()):
+                resized[index] = row
+        return resized, errors
     
     def embed(self, text: str) -> List[float]:
         """Generate embedding for text."""
@@ -71,50 +81,8 @@ class EmbeddingRetriever:
             logger.info(f"Using model: {self.embedding_model}")
             logger.info(f"Text length: {len(text)} characters")
             
-            # Prepare request
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            
-            data = {
-                'model': self.embedding_model,
-                'input': text
-            }
-            
-            # Make request
-            # Check if the endpoint already ends with /embeddings
-            endpoint = self.embedding_endpoint
-            if endpoint.endswith('/embeddings'):
-                request_url = endpoint
-            else:
-                request_url = f"{endpoint}/embeddings"
-                
-            response = requests.post(
-                request_url,
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if not response.ok:
-                logger.warning(f"HTTP error! Status: {response.status_code}")
-                logger.warning(f"Error response: {response.text}")
-                return self.generate_random_embedding()
-            
-            response_data = response.json()
-            
-            # Check if we got a valid embedding in the expected OpenAI format
-            if (not response_data or 
-                not response_data.get('data') or 
-                not response_data['data'][0] or 
-                not response_data['data'][0].get('embedding')):
-                logger.warning("Warning: Embedding API didn't return a valid embedding")
-                logger.warning(f"Response: {response_data}")
-                return self.generate_random_embedding()
-            
-            # Get the embedding array from the OpenAI-compatible format
-            embedding = response_data['data'][0]['embedding']
+            # Pooled, retried request through the shared client
+            embedding = self.client.embed(text).tolist()
             
             # Ensure we have the target dimensional vector
             resized_embedding = self.resize_embedding(embedding)
@@ -132,33 +100,68 @@ class EmbeddingRetriever:
     
     def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for a batch of texts."""
-        embeddings = []
-        for text in texts:
-            embedding = self.embed(text)
-            embeddings.append(embedding)
+        embeddings, errors = self.embed_batch(texts)
+        for index, error in errors.items():
+            logger.warning(f"Embedding failed for text {index}, using random embedding: {error}")
+            embeddings[index] = self.generate_random_embedding()
         return embeddings
     
+    def index_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Embed documents in batches and add them to the vector store.
+        
+        Documents whose embedding fails are skipped rather than indexed with
+        a placeholder vector.
+        
+        Args:
+            documents: Documents with content and optional id, metadata and timestamp
+            
+        Returns:
+            Dictionary with the number of indexed documents and the error for
+            each failed document index
+        """
+        texts = [doc["content"] for doc in documents]
+        embeddings, failed = self.embed_batch(texts)
+        for index, error in failed.items():
+            logger.error(f"Failed to embed document {index}: {error}")
+        
+        # Prepare documents with embeddings
+        embedded_docs = []
+        positions = []
+        for i, doc in enumerate(documents):
+            if i in failed:
+                continue
+            embedded_doc = {
+                "id": doc.get("id"),
+                "content": doc["content"],
+                "vector": embeddings[i],
+                "metadata": doc.get("metadata", {})
+            }
+            # The vector store stamps documents that arrive without a timestamp
+            if doc.get("timestamp"):
+                embedded_doc["timestamp"] = doc["timestamp"]
+            embedded_docs.append(embedded_doc)
+            positions.append(i)
+        
+        if not embedded_docs:
+            return {"indexed": 0, "failed": failed}
+        
+        # Add to vector store; refresh is deferred for loads of at least one bulk chunk
+        result = self.vector_store.bulk_index(
+            embedded_docs,
+            defer_refresh=len(embedded_docs) >= self.vector_store.bulk_chunk_size
+        )
+        for failure in result["failed"]:
+            index = positions[failure["position"]]
+            failed[index] = f"indexing failed ({failure['status']}): {failure['error']}"
+            logger.error(f"Failed to index document {index}: {failed[index]}")
+        return {"indexed": result["indexed"], "failed": failed}
+    
     def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
         """Add documents with embeddings to the vector store."""
         try:
-            # Generate embeddings for documents
-            texts = [doc["content"] for doc in documents]
-            embeddings = self.generate_embeddings_batch(texts)
-            
-            # Prepare documents with embeddings
-            embedded_docs = []
-            for i, doc in enumerate(documents):
-                embedded_doc = {
-                    "id": doc.get("id"),
-                    "content": doc["content"],
-                    "vector": embeddings[i],
-                    "metadata": doc.get("metadata", {}),
-                    "timestamp": doc.get("timestamp")
-                }
-                embedded_docs.append(embedded_doc)
-            
-            # Add to vector store
-            return self.vector_store.add_documents(embedded_docs)
+            result = self.index_documents(documents)
+            return not result["failed"]
             
         except Exception as e:
             logger.error(f"Failed to add documents: {e}")
@@ -1,15 +1,150 @@
+from collections import deque
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+import itertools
 import json
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import random
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import numpy as np
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from aws_requests_auth.aws_auth import AWSRequestsAuth
-import boto3
+from opensearchpy import ConnectionError as OpenSearchConnectionError, ConnectionTimeout, OpenSearch, RequestError
+from opensearchpy.helpers import parallel_bulk
 from ..config import config
+from ..utils.index_profiles import index_body, requires_training, training_body
+from ..utils.opensearch_client import get_opensearch_client
 
 logger = logging.getLogger(__name__)
 
+# Bulk item statuses that mean the node rejected the write and it is safe to resend
+RETRYABLE_BULK_STATUSES = {429}
+
+# Loads inside deferred_refresh per concrete index, with the refresh interval
+# to restore when the last one finishes
+_deferred_refresh: Dict[str, Tuple[int, Optional[str]]] = {}
+_deferred_refresh_lock = threading.Lock()
+
+
+def document_actions(index_name: str, documents: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Bulk index actions for documents with vector, content and optional id, metadata and timestamp."""
+    for doc in documents:
+        action = {
+            "_op_type": "index",
+            "_index": index_name,
+            "_source": {
+                "embedding": doc["vector"],
+                "document": doc["content"],
+                "metadata": doc.get("metadata", {}),
+                "timestamp": doc.get("timestamp") or datetime.now().isoformat()
+            }
+        }
+        if doc.get("id") is not None:
+            action["_id"] = doc["id"]
+        yield action
+
+
+def search_parameters(
+    ef_search: Optional[int] = None,
+    nprobes: Optional[int] = None,
+    oversample_factor: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Resolve per-query k-NN search parameters against the configured defaults.
+    
+    None falls back to the VECTOR_SEARCH_* setting and 0 leaves the index
+    default in place.
+    
+    Returns:
+        The knn query clause fields for the parameters that are set
+    """
+    ef_search = config.VECTOR_SEARCH_EF_SEARCH if ef_search is None else ef_search
+    nprobes = config.VECTOR_SEARCH_NPROBES if nprobes is None else nprobes
+    oversample_factor = config.VECTOR_SEARCH_OVERSAMPLE_FACTOR if oversample_factor is None else oversample_factor
+    
+    fields: Dict[str, Any] = {}
+    # method_parameters apply to faiss and lucene indexes (OpenSearch 2.16+), not nmslib
+    method_parameters = {}
+    if ef_search:
+        method_parameters["ef_search"] = ef_search
+    if nprobes:
+        method_parameters["nprobes"] = nprobes
+    if method_parameters:
+        fields["method_parameters"] = method_parameters
+    # Rescore oversampled candidates with full-precision vectors (quantized indexes, 2.17+)
+    if oversample_factor:
+        fields["rescore"] = {"oversample_factor": oversample_factor}
+    return fields
+
+
+def build_similarity_query(
+    query_vector: List[float],
+    k: int,
+    filter_dict: Optional[Dict[str, Any]] = None,
+    **search_params
+) -> Dict[str, Any]:
+    """
+    k-NN query body shared by the sync and async vector stores.
+    
+    Args:
+        query_vector: Query embedding
+        k: Number of neighbours to return
+        filter_dict: Term filters on document fields
+        **search_params: ef_search, nprobes and oversample_factor, see search_parameters
+        
+    Returns:
+        The search request body
+    """
+    # Build query with source filtering to reduce response size
+    query = {
+        "size": k,
+        "query": {
+            "knn": {
+                "embedding": {
+                    "vector": query_vector,
+                    "k": k,
+                    **search_parameters(**search_params)
+                }
+            }
+        },
+        "_source": ["document", "metadata"]  # Only return necessary fields
+    }
+    
+    # Add filters if provided
+    if filter_dict:
+        query["query"] = {
+            "bool": {
+                "must": [query["query"]],
+                "filter": [
+                    {"term": {key: value}} for key, value in filter_dict.items()
+                ]
+            }
+        }
+    return query
+
+
+def parse_similarity_hits(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn search hits into result dicts - keep metadata minimal."""
+    results = []
+    for hit in response["hits"]["hits"]:
+        # Extract only essential metadata to reduce token usage
+        metadata = {}
+        if "metadata" in hit["_source"]:
+            source_metadata = hit["_source"]["metadata"]
+            # Only keep essential metadata fields
+            if isinstance(source_metadata, dict):
+                metadata = {
+                    "source": source_metadata.get("source", "Unknown")
+                }
+        
+        results.append({
+            "content": hit["_source"]["document"],
+            "metadata": metadata,
+            "score": hit["_score"],
+            "id": hit["_id"]
+        })
+    return results
+
 class OpenSearchVectorStore:
     """Vector store implementation using OpenSearch."""
     
@@ -17,114 +152,245 @@ class OpenSearchVectorStore:
         self.index_name = index_name or config.VECTOR_INDEX_NAME
         self.client: Optional[OpenSearch] = None
         self.dimension = 384  # Default dimension for embeddings
+        self.bulk_chunk_size = config.BULK_CHUNK_SIZE
+        self.bulk_max_chunk_bytes = config.BULK_MAX_CHUNK_BYTES
+        self.bulk_thread_count = config.BULK_THREAD_COUNT
+        self.bulk_max_retries = config.BULK_MAX_RETRIES
         self._initialize_client()
     
     def _initialize_client(self) -> None:
-        """Initialize OpenSearch client with AWS authentication."""
+        """Attach to the process-wide OpenSearch client."""
         try:
-            # Get AWS credentials
-            session = boto3.Session()
-            credentials = session.get_credentials()
-            
-            if not credentials:
-                raise ValueError("AWS credentials not found")
-            
-            # Parse endpoint to get host
-            endpoint_url = config.OPENSEARCH_ENDPOINT
-            if endpoint_url.startswith('https://'):
-                host = endpoint_url.replace('https://', '')
-            else:
-                host = endpoint_url
-            
-            # Create AWS auth
-            awsauth = AWSRequestsAuth(
-                aws_access_key=credentials.access_key,
-                aws_secret_access_key=credentials.secret_key,
-                aws_token=credentials.token,
-                aws_host=host,
-                aws_region=config.AWS_REGION,
-                aws_service='es'
-            )
-            
-            # Initialize OpenSearch client
-            self.client = OpenSearch(
-                hosts=[{'host': host, 'port': 443}],
-                http_auth=awsauth,
-                use_ssl=True,
-                verify_certs=True,
-                connection_class=RequestsHttpConnection
-            )
-            
-            logger.info("OpenSearch client initialized successfully")
-            
+            self.client = get_opensearch_client()
         except Exception as e:
             logger.error(f"Failed to initialize OpenSearch client: {e}")
             raise
     
-    def create_index(self, dimension: int = 384) -> bool:
-        """Create the vector index if it doesn't exist."""
+    def create_index(
+        self,
+        dimension: int = 384,
+        profile: str = None,
+        index_name: str = None,
+        model_id: Optional[str] = None
+    ) -> bool:
+        """
+        Create the vector index if it doesn't exist.
+        
+        Args:
+            dimension: Vector dimension
+            profile: Index profile from INDEX_PROFILES, defaults to VECTOR_INDEX_PROFILE
+            index_name: Index to create, defaults to this store's index
+            model_id: Trained k-NN model, for profiles that need one
+            
+        Returns:
+            True if the index exists or was created, False otherwise
+        """
         if not self.client:
             raise RuntimeError("OpenSearch client not initialized")
         
         self.dimension = dimension
+        profile = profile or config.VECTOR_INDEX_PROFILE
+        index_name = index_name or self.index_name
         
         try:
             # Check if index exists
-            if self.client.indices.exists(index=self.index_name):
-                logger.info(f"Index {self.index_name} already exists")
+            if self.client.indices.exists(index=index_name):
+                logger.info(f"Index {index_name} already exists")
                 return True
             
-            # Create index with vector mapping
-            index_body = {
-                "settings": {
-                    "index": {
-                        "knn": True,
-                        "knn.space_type": "cosinesimil"
-                    }
-                },
-                "mappings": {
-                    "properties": {
-                        "embedding": {
-                            "type": "knn_vector",
-                            "dimension": dimension,
-                            "method": {
-                                "name": "hnsw",
-                                "space_type": "cosinesimil",
-                                "engine": "nmslib",
-                                "parameters": {
-                                    "ef_construction": 128,
-                                    "m": 16
-                                }
-                            }
-                        },
-                        "document": {
-                            "type": "text",
-                            "store": True
-                        },
-                        "metadata": {
-                            "type": "object"
-                        },
-                        "timestamp": {
-                            "type": "date"
-                        }
-                    }
-                }
-            }
-            
             response = self.client.indices.create(
-                index=self.index_name,
-                body=index_body
+                index=index_name,
+                body=index_body(profile, dimension, model_id)
             )
             
-            logger.info(f"Created index {self.index_name}: {response}")
+            logger.info(f"Created index {index_name} with profile {profile}: {response}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to create index: {e}")
             return False
     
-    def add_embedding(self, embedding: List[float], document: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
-        """Add a single document with embedding to the vector store."""
+    def _wait_for(self, description: str, check, timeout: float, poll_interval: float = 5.0):
+        """Poll check() until it returns a result other than None."""
+        deadline = time.time() + timeout
+        while True:
+            result = check()
+            if result is not None:
+                return result
+            if time.time() > deadline:
+                raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for {description}")
+            time.sleep(poll_interval)
+    
+    def train_model(self, model_id: str, profile: str, dimension: int, training_index: str, timeout: float = 1800) -> None:
+        """
+        Train the k-NN model a profile needs on the vectors of an existing index.
+        
+        Args:
+            model_id: Id for the new model
+            profile: Profile with a training step
+            dimension: Vector dimension
+            training_index: Index whose vectors train the model
+            timeout: Seconds to wait for training to finish
+        """
+        body = training_body(profile, dimension, training_index)
+        nlist = body["method"]["parameters"].get("nlist", 0)
+        count = self.client.count(index=training_index)["count"]
+        if count < nlist:
+            raise ValueError(f"Training {profile} needs at least {nlist} vectors, {training_index} has {count}")
+        
+        logger.info(f"Training model {model_id} for profile {profile} on {count} vectors from {training_index}")
+        self.client.transport.perform_request("POST", f"/_plugins/_knn/models/{model_id}/_train", body=body)
+        
+        def trained():
+            model = self.client.transport.perform_request("GET", f"/_plugins/_knn/models/{model_id}")
+            if model.get("state") == "failed":
+                raise RuntimeError(f"Training model {model_id} failed: {model.get('error')}")
+            return True if model.get("state") == "created" else None
+        
+        self._wait_for(f"model {model_id}", trained, timeout)
+        logger.info(f"Model {model_id} trained")
+    
+    def _reindex(self, source: str, dest: str, timeout: float = 3600) -> int:
+        """
+        Copy documents between indexes as a background task and wait for it.
+        
+        Versions are carried over as external versions, so running it again
+        only rewrites documents changed in source since the previous copy.
+        
+        Returns:
+            The number of documents created or updated in dest
+        """
+        body = {
+            "conflicts": "proceed",
+            "source": {"index": source},
+            "dest": {"index": dest, "version_type": "external"}
+        }
+        task = self.client.reindex(body=body, params={"wait_for_completion": "false", "slices": "auto"})
+        
+        def finished():
+            status = self.client.tasks.get(task_id=task["task"])
+            if not status.get("completed"):
+                return None
+            response = status.get("response", {})
+            if status.get("error") or response.get("failures"):
+                raise RuntimeError(f"Reindex {source} -> {dest} failed: {status.get('error') or response['failures'][:5]}")
+            return response.get("created", 0) + response.get("updated", 0)
+        
+        return self._wait_for(f"reindex {source} -> {dest}", finished, timeout)
+    
+    def _set_write_block(self, index_name: str, blocked: bool) -> None:
+        self.client.indices.put_settings(index=index_name, body={"index": {"blocks.write": blocked}})
+    
+    def migrate_index(self, profile: str, delete_old: bool = False) -> str:
+        """
+        Rebuild the index with another profile and switch readers over without downtime.
+        
+        This store's index name becomes (or already is) an alias. Documents are
+        reindexed into a new index named after the profile while the old one
+        keeps serving. Writes to the old index are then blocked for a final
+        pass that copies everything changed since, the document counts are
+        compared, and the alias is moved to the new index in one atomic
+        update. Searches never stop; writes are rejected only during the final
+        pass, and the block is lifted again if anything fails.
+        
+        A concrete index with the alias name cannot survive the switch, since
+        an alias cannot share its name. Converting it is therefore refused
+        unless delete_old is set.
+        
+        Args:
+            profile: Target profile from INDEX_PROFILES
+            delete_old: Delete the previous index once the alias has moved
+            
+        Returns:
+            The name of the new index
+        """
+        if not self.client:
+            raise RuntimeError("OpenSearch client not initialized")
+        
+        alias = self.index_name
+        if self.client.indices.exists_alias(name=alias):
+            sources = list(self.client.indices.get_alias(name=alias))
+            if len(sources) != 1:
+                raise RuntimeError(f"Alias {alias} points to {len(sources)} indexes, expected one")
+            source = sources[0]
+        elif self.client.indices.exists(index=alias):
+            source = alias
+            if not delete_old:
+                raise RuntimeError(
+                    f"{alias} is a concrete index; turning it into an alias deletes it once its documents "
+                    f"are copied. Run this one-time conversion with delete_old (--delete-old); later "
+                    f"migrations can keep the previous index"
+                )
+        else:
+            raise RuntimeError(f"Index {alias} does not exist")
+        
+        mapping = self.client.indices.get_mapping(index=source)[source]["mappings"]["properties"]["embedding"]
+        dimension = mapping.get("dimension") or self.client.transport.perform_request(
+            "GET", f"/_plugins/_knn/models/{mapping['model_id']}"
+        )["dimension"]
+        target = f"{alias}-{profile}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        
+        model_id = None
+        if requires_training(profile):
+            model_id = target
+            self.train_model(model_id, profile, dimension, source)
+        
+        if not self.create_index(dimension, profile=profile, index_name=target, model_id=model_id):
+            raise RuntimeError(f"Failed to create index {target}")
+        
+        with self.deferred_refresh(target):
+            copied = self._reindex(source, target)
+        logger.info(f"Reindexed {copied} documents into {target}")
+        
+        # Freeze writes so the final pass sees every change; reads keep going to source
+        self._set_write_block(source, True)
+        try:
+            self.client.indices.refresh(index=source)
+            caught_up = self._reindex(source, target)
+            self.client.indices.refresh(index=target)
+            logger.info(f"Caught up {caught_up} documents changed during the copy")
+            
+            source_count = self.client.count(index=source)["count"]
+            target_count = self.client.count(index=target)["count"]
+            if target_count != source_count:
+                # Documents deleted from source during the copy are still in target
+                raise RuntimeError(
+                    f"{target} holds {target_count} documents, {source} holds {source_count}; alias not moved, "
+                    f"delete {target} and retry"
+                )
+            
+            if source == alias:
+                actions = [{"remove_index": {"index": source}}]
+            else:
+                actions = [{"remove": {"index": source, "alias": alias}}]
+            actions.append({"add": {"index": target, "alias": alias}})
+            self.client.indices.update_aliases(body={"actions": actions})
+        except Exception:
+            self._set_write_block(source, False)
+            raise
+        logger.info(f"Alias {alias} now points to {target} (profile {profile})")
+        
+        if source != alias:
+            if delete_old:
+                self.client.indices.delete(index=source)
+                logger.info(f"Deleted previous index {source}")
+            else:
+                self._set_write_block(source, False)
+        return target
+    
+    def add_embedding(
+        self,
+        embedding: List[float],
+        document: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        refresh: bool = False
+    ) -> bool:
+        """
+        Add a single document with embedding to the vector store.
+        
+        The document becomes searchable at the next scheduled refresh; pass
+        refresh=True only when it must be searchable immediately.
+        """
         if not self.client:
             raise RuntimeError("OpenSearch client not initialized")
         
@@ -141,7 +407,7 @@ class OpenSearchVectorStore:
             response = self.client.index(
                 index=self.index_name,
                 body=doc_body,
-                refresh=True  # Make immediately searchable
+                refresh=refresh
             )
             
             logger.debug(f"Document added to OpenSearch: {response['_id']}")
@@ -151,38 +417,168 @@ class OpenSearchVectorStore:
             logger.error(f"Failed to add embedding: {e}")
             return False
     
+    @contextmanager
+    def deferred_refresh(self, index_name: str = None):
+        """
+        Turn off periodic refresh while loading, then restore it and refresh once.
+        
+        Segments are not rebuilt every second during the load, and all
+        documents become searchable together when it finishes. Nested and
+        concurrent loads in this process share one deferral; the interval is
+        restored when the last of them exits. OpenSearch Serverless manages
+        refresh itself, so this is a no-op there.
+        """
+        if config.OPENSEARCH_SERVICE == "aoss":
+            yield
+            return
+
+        index_name = index_name or self.index_name
+        with _deferred_refresh_lock:
+            settings = self.client.indices.get_settings(
+                index=index_name, name="index.refresh_interval", flat_settings=True
+            )
+            # Keyed by the concrete index, which differs from index_name when it is an alias
+            concrete, index_settings = next(iter(settings.items()), (index_name, {}))
+            loads, previous = _deferred_refresh.get(concrete, (0, None))
+            if not loads:
+                previous = index_settings.get("settings", {}).get("index.refresh_interval")
+                # A "-1" left behind by an interrupted load is not the interval to go back to
+                if previous == "-1":
+                    previous = None
+                self.client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1"}})
+            _deferred_refresh[concrete] = (loads + 1, previous)
+        try:
+            yield
+        finally:
+            with _deferred_refresh_lock:
+                loads, previous = _deferred_refresh.pop(concrete)
+                if loads > 1:
+                    _deferred_refresh[concrete] = (loads - 1, previous)
+                else:
+                    # None resets the interval to the cluster default when none was set
+                    self.client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": previous}})
+                    self.client.indices.refresh(index=index_name)
+    
+    def _run_bulk(
+        self,
+        actions: Iterable[Dict[str, Any]],
+        positions: Iterable[int]
+    ) -> Tuple[int, List[Dict[str, Any]], List[Tuple[int, Dict[str, Any]]]]:
+        """
+        Stream actions through parallel_bulk.
+        
+        Returns:
+            The number of indexed documents, the failures that should not be
+            retried, and the (position, action) pairs rejected with a retryable status
+        """
+        # Actions handed to parallel_bulk but not yet answered; results come back in order
+        in_flight = deque()
+        
+        def feed():
+            for position, action in zip(positions, actions):
+                in_flight.append((position, action))
+                yield action
+        
+        indexed = 0
+        failed: List[Dict[str, Any]] = []
+        rejected: List[Tuple[int, Dict[str, Any]]] = []
+        for ok, item in parallel_bulk(
+            self.client,
+            feed(),
+            thread_count=self.bulk_thread_count,
+            chunk_size=self.bulk_chunk_size,
+            max_chunk_bytes=self.bulk_max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False
+        ):
+            position, action = in_flight.popleft()
+            if ok:
+                indexed += 1
+                continue
+            result = next(iter(item.values()))
+            status = result.get("status")
+            if status in RETRYABLE_BULK_STATUSES:
+                rejected.append((position, action))
+            else:
+                failed.append({
+                    "position": position,
+                    "id": result.get("_id", action.get("_id")),
+                    "status": status,
+                    "error": str(result.get("error"))
+                })
+        return indexed, failed, rejected
+    
+    def bulk_index(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        refresh: bool = True,
+        defer_refresh: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Index documents with concurrent, size- and byte-bounded bulk requests.
+        
+        Documents are streamed from the iterable, so it may be a generator.
+        Only items the cluster rejected as overloaded (HTTP 429) are resent,
+        with exponential backoff, up to bulk_max_retries times.
+        
+        Args:
+            documents: Documents with vector, content and optional id, metadata and timestamp
+            refresh: Make the documents searchable when the load finishes
+            defer_refresh: Disable the refresh interval during the load (implies refresh)
+            
+        Returns:
+            Dictionary with the number of indexed documents and a list of
+            failures, each with the document position, id, status and error
+        """
+        if not self.client:
+            raise RuntimeError("OpenSearch client not initialized")
+        
+        start_time = time.time()
+        indexed = 0
+        failed: List[Dict[str, Any]] = []
+        with self.deferred_refresh() if defer_refresh else nullcontext():
+            count, errors, rejected = self._run_bulk(document_actions(self.index_name, documents), itertools.count())
+            indexed += count
+            failed.extend(errors)
+            
+            for attempt in range(self.bulk_max_retries):
+                if not rejected:
+                    break
+                delay = random.uniform(0.5, 1.0) * min(30.0, 2 ** attempt)
+                logger.warning(f"Bulk indexing: {len(rejected)} documents rejected, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                positions = [position for position, _ in rejected]
+                count, errors, rejected = self._run_bulk([action for _, action in rejected], positions)
+                indexed += count
+                failed.extend(errors)
+            
+            for position, action in rejected:
+                failed.append({
+                    "position": position,
+                    "id": action.get("_id"),
+                    "status": 429,
+                    "error": f"rejected after {self.bulk_max_retries} retries"
+                })
+        
+        if refresh and not defer_refresh:
+            self.client.indices.refresh(index=self.index_name)
+        
+        failed.sort(key=lambda failure: failure["position"])
+        logger.info(f"Bulk indexed {indexed} documents ({len(failed)} failed) in {time.time() - start_time:.2f}s")
+        return {"indexed": indexed, "failed": failed}
+    
     def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
         """Add multiple documents with embeddings to the vector store."""
         if not self.client:
             raise RuntimeError("OpenSearch client not initialized")
         
         try:
-            # Prepare bulk operations
-            bulk_body = []
-            
-            for doc in documents:
-                # Index operation
-                bulk_body.append({
-                    "index": {
-                        "_index": self.index_name,
-                        "_id": doc.get("id", None)
-                    }
-                })
-                
-                # Document data
-                bulk_body.append({
-                    "embedding": doc["vector"],
-                    "document": doc["content"],
-                    "metadata": doc.get("metadata", {}),
-                    "timestamp": doc.get("timestamp", datetime.now().isoformat())
-                })
-            
-            # Execute bulk operation
-            response = self.client.bulk(body=bulk_body, refresh=True)
+            # Toggling the refresh interval only pays off for loads of at least one chunk
+            result = self.bulk_index(documents, defer_refresh=len(documents) >= self.bulk_chunk_size)
             
             # Check for errors
-            if response.get("errors"):
-                logger.error(f"Bulk indexing errors: {response}")
+            if result["failed"]:
+                logger.error(f"Bulk indexing errors: {result['failed'][:10]}")
                 return False
             
             logger.info(f"Successfully indexed {len(documents)} documents")
@@ -231,70 +627,50 @@ class OpenSearchVectorStore:
         self, 
         query_vector: List[float], 
         k: int = None, 
-        filter_dict: Optional[Dict[str, Any]] = None
+        filter_dict: Optional[Dict[str, Any]] = None,
+        ef_search: Optional[int] = None,
+        nprobes: Optional[int] = None,
+        oversample_factor: Optional[float] = None
     ) -> List[Dict[str, Any]]:
-        """Perform similarity search using vector with detailed results."""
+        """
+        Perform similarity search using vector with detailed results.
+        
+        Args:
+            query_vector: Query embedding
+            k: Number of results, defaults to TOP_K_RESULTS
+            filter_dict: Term filters on document fields
+            ef_search: HNSW candidate list size; higher trades latency for recall
+            nprobes: IVF lists to scan; higher trades latency for recall
+            oversample_factor: Candidates per result to rescore on quantized indexes
+            
+        Returns:
+            List of documents with content, metadata, score and id
+        """
         if not self.client:
             raise RuntimeError("OpenSearch client not initialized")
         
         k = k or config.TOP_K_RESULTS
         
         try:
-            # Build query with source filtering to reduce response size
-            query = {
-                "size": k,
-                "query": {
-                    "knn": {
-                        "embedding": {
-                            "vector": query_vector,
-                            "k": k
-                        }
-                    }
-                },
-                "_source": ["document", "metadata"]  # Only return necessary fields
-            }
-            
-            # Add filters if provided
-            if filter_dict:
-                query["query"] = {
-                    "bool": {
-                        "must": [query["query"]],
-                        "filter": [
-                            {"term": {key: value}} for key, value in filter_dict.items()
-                        ]
-                    }
-                }
-            
             # Execute search
             response = self.client.search(
                 index=self.index_name,
-                body=query
+                body=build_similarity_query(
+                    query_vector, k, filter_dict,
+                    ef_search=ef_search, nprobes=nprobes, oversample_factor=oversample_factor
+                )
             )
             
-            # Process results - keep metadata minimal
-            results = []
-            for hit in response["hits"]["hits"]:
-                # Extract only essential metadata to reduce token usage
-                metadata = {}
-                if "metadata" in hit["_source"]:
-                    source_metadata = hit["_source"]["metadata"]
-                    # Only keep essential metadata fields
-                    if isinstance(source_metadata, dict):
-                        metadata = {
-                            "source": source_metadata.get("source", "Unknown")
-                        }
-                
-                results.append({
-                    "content": hit["_source"]["document"],
-                    "metadata": metadata,
-                    "score": hit["_score"],
-                    "id": hit["_id"]
-                })
+            results = parse_similarity_hits(response)
             
             logger.info(f"Found {len(results)} similar documents")
             return results
             
-        except Exception as e:
+        except RequestError as e:
+            # Rejected query, e.g. method_parameters on an nmslib index; not the same as no results
+            logger.error(f"Similarity search rejected: {e}")
+            raise
+        except (OpenSearchConnectionError, ConnectionTimeout) as e:
             logger.error(f"Failed to perform similarity search: {e}")
             return []
     
@@ -329,11 +705,5 @@ class OpenSearchVectorStore:
             return 0
     
     def close(self) -> None:
-        """Close the OpenSearch connection."""
-        if self.client:
-            try:
-                # OpenSearch client doesn't have explicit close method
-                # Connection will be closed automatically
-                logger.info("OpenSearch connection closed")
-            except Exception as e:
-                logger.error(f"Error closing OpenSearch connection: {e}")
+        """Release this store; the shared client stays open for other stores."""
+        self.client = None
@@ -0,0 +1,156 @@
+"""Named k-NN index profiles for the vector index."""
+
+import copy
+from typing import Dict, Any, Optional
+
+# Every profile scores with cosine similarity, so results stay comparable
+# across profiles. faiss supports cosinesimil from OpenSearch 2.19.
+SPACE_TYPE = "cosinesimil"
+
+# "method" profiles build their graph at index time; "train" profiles need a
+# k-NN model trained on existing vectors first (see training_body).
+INDEX_PROFILES: Dict[str, Dict[str, Any]] = {
+    # The original mapping: nmslib HNSW
+    "default": {
+        "method": {
+            "name": "hnsw",
+            "engine": "nmslib",
+            "parameters": {"ef_construction": 128, "m": 16}
+        }
+    },
+    # faiss HNSW with a denser graph; faiss distance kernels use NEON/SVE on Graviton
+    "latency-optimized": {
+        "method": {
+            "name": "hnsw",
+            "engine": "faiss",
+            "parameters": {"ef_construction": 256, "m": 32, "ef_search": 128}
+        }
+    },
+    # faiss HNSW over fp16 scalar-quantized vectors, about half the memory of float32
+    "memory-optimized": {
+        "method": {
+            "name": "hnsw",
+            "engine": "faiss",
+            "parameters": {
+                "ef_construction": 256,
+                "m": 16,
+                "ef_search": 128,
+                "encoder": {"name": "sq", "parameters": {"type": "fp16"}}
+            }
+        }
+    },
+    # Lucene HNSW that quantizes float input to byte-sized (int7) vectors on the node
+    "byte-quantized": {
+        "method": {
+            "name": "hnsw",
+            "engine": "lucene",
+            "parameters": {"ef_construction": 256, "m": 16, "encoder": {"name": "sq"}}
+        }
+    },
+    # faiss IVF with product quantization for large corpora: 16 bytes per
+    # vector; the dimension must be divisible by the PQ m
+    "large-scale": {
+        "train": {
+            "name": "ivf",
+            "engine": "faiss",
+            "parameters": {
+                "nlist": 128,
+                "nprobes": 8,
+                "encoder": {"name": "pq", "parameters": {"m": 16, "code_size": 8}}
+            }
+        }
+    }
+}
+
+
+def get_index_profile(name: str) -> Dict[str, Any]:
+    """Return a copy of a named profile, raising ValueError for unknown names."""
+    if name not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile '{name}', expected one of: {', '.join(INDEX_PROFILES)}")
+    return copy.deepcopy(INDEX_PROFILES[name])
+
+
+def requires_training(name: str) -> bool:
+    """Whether indexes with this profile need a trained k-NN model."""
+    return "train" in get_index_profile(name)
+
+
+def training_body(name: str, dimension: int, training_index: str, training_field: str = "embedding") -> Dict[str, Any]:
+    """
+    Request body for POST /_plugins/_knn/models/{model_id}/_train.
+
+    Args:
+        name: A profile that requires training
+        dimension: Vector dimension
+        training_index: Index whose vectors train the model
+        training_field: Vector field in the training index
+
+    Returns:
+        The training request body
+    """
+    method = get_index_profile(name).get("train")
+    if method is None:
+        raise ValueError(f"Index profile '{name}' does not use a trained model")
+
+    encoder = method["parameters"].get("encoder", {})
+    if encoder.get("name") == "pq" and dimension % encoder["parameters"]["m"]:
+        raise ValueError(f"Dimension {dimension} is not divisible by PQ m={encoder['parameters']['m']}")
+
+    method["space_type"] = SPACE_TYPE
+    return {
+        "training_index": training_index,
+        "training_field": training_field,
+        "dimension": dimension,
+        "description": f"{name} profile model for {training_index}",
+        "method": method
+    }
+
+
+def index_body(name: str, dimension: int, model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Settings and mappings for a vector index with the given profile.
+
+    Args:
+        name: Profile name
+        dimension: Vector dimension
+        model_id: Trained model to use, required by profiles with a training step
+
+    Returns:
+        The create-index request body
+    """
+    profile = get_index_profile(name)
+    if "train" in profile:
+        if not model_id:
+            raise ValueError(
+                f"Index profile '{name}' needs a trained model; load data with another "
+                f"profile and migrate to '{name}' once the index holds enough vectors"
+            )
+        embedding = {"type": "knn_vector", "model_id": model_id}
+    else:
+        method = profile["method"]
+        method["space_type"] = SPACE_TYPE
+        embedding = {"type": "knn_vector", "dimension": dimension, "method": method}
+
+    return {
+        "settings": {
+            "index": {
+                "knn": True,
+                "knn.space_type": SPACE_TYPE
+            }
+        },
+        "mappings": {
+            "properties": {
+                "embedding": embedding,
+                "document": {
+                    "type": "text",
+                    "store": True
+                },
+                "metadata": {
+                    "type": "object"
+                },
+                "timestamp": {
+                    "type": "date"
+                }
+            }
+        }
+    }
@@ -1,35 +1,139 @@
 """OpenSearch client wrapper for the multi-agent RAG system."""
 
 import logging
-from typing import Optional, Dict, Any
-from ..tools.opensearch_vector_store import OpenSearchVectorStore
+import threading
+from typing import Optional, Dict, Any, Tuple
+import boto3
+from opensearchpy import (
+    AsyncHttpConnection,
+    AsyncOpenSearch,
+    AWSV4SignerAsyncAuth,
+    AWSV4SignerAuth,
+    OpenSearch,
+    RequestsHttpConnection,
+)
+from ..config import config as default_config
 
 logger = logging.getLogger(__name__)
 
+# Process-wide clients by (host, region, service); each owns a keep-alive connection pool
+_clients: Dict[Tuple[str, str, str], OpenSearch] = {}
+_async_clients: Dict[Tuple[str, str, str], AsyncOpenSearch] = {}
+_clients_lock = threading.Lock()
+
+
+def _credentials():
+    # Session credentials from IRSA, pod identity or instance roles are refreshable;
+    # the signers read them on every request, so rotated keys are picked up.
+    credentials = boto3.Session().get_credentials()
+    if not credentials:
+        raise ValueError("AWS credentials not found")
+    return credentials
+
+
+def _endpoint(config) -> Tuple[str, str, str]:
+    # Parse endpoint to get host
+    host = config.OPENSEARCH_ENDPOINT
+    if host.startswith('https://'):
+        host = host.replace('https://', '')
+    return host.rstrip('/'), config.AWS_REGION, config.OPENSEARCH_SERVICE
+
+
+def _create_client(host: str, region: str, service: str, pool_maxsize: int) -> OpenSearch:
+    credentials = _credentials()
+    return OpenSearch(
+        hosts=[{'host': host, 'port': 443}],
+        http_auth=AWSV4SignerAuth(credentials, region, service),
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection,
+        pool_maxsize=pool_maxsize
+    )
+
+
+def get_opensearch_client(config=None) -> OpenSearch:
+    """
+    Return the shared OpenSearch client for the configured endpoint.
+    
+    The client is created on first use and reused by every vector store and
+    wrapper in the process, so requests share pooled TLS connections.
+    """
+    config = config or default_config
+    key = _endpoint(config)
+    
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _create_client(*key, config.OPENSEARCH_POOL_MAXSIZE)
+            logger.info(f"OpenSearch client created for {key[0]} (pool size {config.OPENSEARCH_POOL_MAXSIZE})")
+        return client
+
+
+def get_async_opensearch_client(config=None) -> AsyncOpenSearch:
+    """
+    Return the shared AsyncOpenSearch client for the configured endpoint.
+    
+    Its aiohttp session is opened on the first request, so use the client
+    from a single event loop (the server's).
+    """
+    config = config or default_config
+    key = _endpoint(config)
+    
+    with _clients_lock:
+        client = _async_clients.get(key)
+        if client is None:
+            host, region, service = key
+            client = _async_clients[key] = AsyncOpenSearch(
+                hosts=[{'host': host, 'port': 443}],
+                http_auth=AWSV4SignerAsyncAuth(_credentials(), region, service),
+                use_ssl=True,
+                verify_certs=True,
+                connection_class=AsyncHttpConnection,
+                # AsyncHttpConnection sizes its aiohttp pool with maxsize, not pool_maxsize
+                maxsize=config.OPENSEARCH_POOL_MAXSIZE
+            )
+            logger.info(f"Async OpenSearch client created for {host} (pool size {config.OPENSEARCH_POOL_MAXSIZE})")
+        return client
+
+
+async def close_async_opensearch_clients() -> None:
+    """Close every shared AsyncOpenSearch client."""
+    with _clients_lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Error closing async OpenSearch client: {e}")
+
+
+def close_opensearch_clients() -> None:
+    """Close every shared OpenSearch client and its connection pool."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.error(f"Error closing OpenSearch client: {e}")
+    if clients:
+        logger.info(f"Closed {len(clients)} OpenSearch client(s)")
+
 class OpenSearchClient:
     """OpenSearch client wrapper that provides compatibility with server.py expectations."""
     
     def __init__(self, config):
         """Initialize OpenSearch client with configuration."""
         self.config = config
-        self._vector_store = None
         self.client = None
         self._initialize_client()
     
     def _initialize_client(self) -> None:
-        """Initialize OpenSearch client using the existing vector store."""
+        """Attach to the shared OpenSearch client."""
         try:
-            # Use the existing OpenSearchVectorStore implementation
-            self._vector_store = OpenSearchVectorStore()
-            
-            # Expose the underlying client for compatibility
-            if self._vector_store and self._vector_store.client:
-                self.client = self._vector_store.client
-                logger.info("OpenSearch client initialized successfully via vector store")
-            else:
-                logger.warning("OpenSearch vector store client not available")
-                self.client = None
-                
+            self.client = get_opensearch_client(self.config)
         except Exception as e:
             logger.error(f"Failed to initialize OpenSearch client: {e}")
             self.client = None
@@ -81,10 +185,5 @@ class OpenSearchClient:
             return 0
     
     def close(self) -> None:
-        """Close the OpenSearch connection."""
-        if self._vector_store:
-            try:
-                self._vector_store.close()
-                logger.info("OpenSearch connection closed")
-            except Exception as e:
-                logger.error(f"Error closing OpenSearch connection: {e}")
+        """Release this wrapper; the shared client stays open until close_opensearch_clients()."""
+        self.client = None
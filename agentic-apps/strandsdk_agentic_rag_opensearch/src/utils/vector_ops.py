@@ -0,0 +1,60 @@
+"""Vectorized embedding resizing and normalization."""
+
+from functools import lru_cache
+from typing import Tuple
+import numpy as np
+
+
+@lru_cache(maxsize=32)
+def pooling_map(source_dim: int, target_dim: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Segment layout for average-pooling source_dim values into target_dim.
+
+    Output dimension i averages source[int(i * ratio):int((i + 1) * ratio)],
+    the same bounds the original per-element loop used. Consecutive segments
+    share their bounds, so they tile the source and np.add.reduceat can sum
+    all of them in one pass.
+
+    Returns:
+        Segment start offsets, segment lengths, a mask of empty segments, and
+        the end of the last segment (short of source_dim when rounding drops
+        trailing values)
+    """
+    ratio = source_dim / target_dim
+    bounds = np.minimum((np.arange(target_dim + 1) * ratio).astype(np.intp), source_dim)
+    end = int(bounds[-1])
+    counts = np.diff(bounds)
+    empty = counts == 0
+    # reduceat needs in-range offsets even for segments that are masked out
+    starts = np.minimum(bounds[:-1], end - 1)
+    for array in (starts, counts, empty):
+        array.flags.writeable = False
+    return starts, counts, empty, end
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length, leaving all-zero rows unchanged."""
+    magnitudes = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+    nonzero = magnitudes != 0
+    result = vectors.copy()
+    result[nonzero] /= magnitudes[nonzero, None]
+    return result
+
+
+def resize_rows(vectors: np.ndarray, target_dim: int) -> np.ndarray:
+    """
+    Average-pool an (n, d) batch of embeddings to (n, target_dim) and normalize.
+
+    Rows that already have target_dim values are returned as they are, and
+    output dimensions without source values are zero, as before.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    source_dim = vectors.shape[1]
+    if source_dim == target_dim:
+        return vectors
+
+    starts, counts, empty, end = pooling_map(source_dim, target_dim)
+    pooled = np.add.reduceat(vectors[:, :end], starts, axis=1)
+    pooled[:, empty] = 0.0
+    pooled[:, ~empty] /= counts[~empty]
+    return normalize_rows(pooled)
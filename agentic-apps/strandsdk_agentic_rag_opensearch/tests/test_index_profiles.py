@@ -0,0 +1,57 @@
+import pytest
+
+from src.utils.index_profiles import (
+    INDEX_PROFILES,
+    SPACE_TYPE,
+    get_index_profile,
+    index_body,
+    requires_training,
+    training_body,
+)
+
+
+@pytest.mark.parametrize("name", [name for name in INDEX_PROFILES if not requires_training(name)])
+def test_method_profiles_build_a_cosine_knn_mapping(name):
+    body = index_body(name, 384)
+    embedding = body["mappings"]["properties"]["embedding"]
+    assert body["settings"]["index"]["knn"] is True
+    assert embedding["dimension"] == 384
+    assert embedding["method"]["space_type"] == SPACE_TYPE
+    assert embedding["method"]["engine"] == INDEX_PROFILES[name]["method"]["engine"]
+
+
+def test_profiles_are_copied_not_shared():
+    index_body("latency-optimized", 384)["mappings"]["properties"]["embedding"]["method"]["parameters"]["m"] = 1
+    get_index_profile("latency-optimized")["method"]["name"] = "changed"
+    assert INDEX_PROFILES["latency-optimized"]["method"]["parameters"]["m"] == 32
+    assert "space_type" not in INDEX_PROFILES["latency-optimized"]["method"]
+    assert INDEX_PROFILES["latency-optimized"]["method"]["name"] == "hnsw"
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown index profile"):
+        index_body("fastest", 384)
+
+
+def test_trained_profile_maps_to_its_model():
+    assert requires_training("large-scale")
+    with pytest.raises(ValueError, match="needs a trained model"):
+        index_body("large-scale", 384)
+    embedding = index_body("large-scale", 384, model_id="model-1")["mappings"]["properties"]["embedding"]
+    assert embedding == {"type": "knn_vector", "model_id": "model-1"}
+
+
+def test_training_body():
+    body = training_body("large-scale", 384, "source-index")
+    assert body["training_index"] == "source-index"
+    assert body["training_field"] == "embedding"
+    assert body["dimension"] == 384
+    assert body["method"]["space_type"] == SPACE_TYPE
+    assert body["method"]["parameters"]["encoder"]["name"] == "pq"
+
+
+def test_training_body_checks_pq_divisibility_and_profile():
+    with pytest.raises(ValueError, match="not divisible"):
+        training_body("large-scale", 390, "source-index")
+    with pytest.raises(ValueError, match="does not use a trained model"):
+        training_body("default", 384, "source-index")
@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.tools import opensearch_vector_store
+from src.tools.opensearch_vector_store import OpenSearchVectorStore
+
+
+class RecordingClient:
+    """Answers the calls migrate_index makes and records the request bodies."""
+
+    def __init__(self, alias_target=None, counts=(10, 10)):
+        self.alias_target = alias_target
+        self.counts = list(counts)
+        self.calls = []
+        self.indices = SimpleNamespace(
+            exists_alias=lambda name: alias_target is not None,
+            get_alias=lambda name: {alias_target: {"aliases": {name: {}}}},
+            exists=lambda index: index == "docs" and alias_target is None,
+            get_mapping=lambda index: {index: {"mappings": {"properties": {
+                "embedding": {"type": "knn_vector", "dimension": 384}}}}},
+            get_settings=lambda **kwargs: {kwargs["index"]: {"settings": {"index.refresh_interval": "5s"}}},
+            create=self._record("create"),
+            put_settings=self._record("put_settings"),
+            refresh=self._record("refresh"),
+            update_aliases=self._record("update_aliases"),
+            delete=self._record("delete"),
+        )
+        self.tasks = SimpleNamespace(get=lambda task_id: {"completed": True, "response": {"created": 10}})
+
+    def _record(self, name):
+        def call(**kwargs):
+            self.calls.append((name, kwargs))
+            return {}
+        return call
+
+    def reindex(self, body, params):
+        self.calls.append(("reindex", {"body": body, "params": params}))
+        return {"task": "node:1"}
+
+    def count(self, index):
+        return {"count": self.counts.pop(0)}
+
+    def bodies(self, name):
+        return [kwargs.get("body") for call, kwargs in self.calls if call == name]
+
+
+@pytest.fixture
+def make_store(monkeypatch):
+    def make(client):
+        monkeypatch.setattr(opensearch_vector_store, "get_opensearch_client", lambda: client)
+        monkeypatch.setattr(opensearch_vector_store.config, "OPENSEARCH_SERVICE", "es")
+        return OpenSearchVectorStore("docs")
+    return make
+
+
+def test_concrete_index_needs_delete_old(make_store):
+    client = RecordingClient()
+    with pytest.raises(RuntimeError, match="delete_old"):
+        make_store(client).migrate_index("latency-optimized")
+    assert client.calls == []
+
+
+def test_concrete_index_becomes_an_alias(make_store):
+    client = RecordingClient()
+    target = make_store(client).migrate_index("latency-optimized", delete_old=True)
+    assert target.startswith("docs-latency-optimized-")
+
+    create = client.bodies("create")[0]
+    assert create["mappings"]["properties"]["embedding"]["method"]["engine"] == "faiss"
+    reindex = client.bodies("reindex")
+    assert len(reindex) == 2
+    for body in reindex:
+        assert body == {"conflicts": "proceed", "source": {"index": "docs"},
+                        "dest": {"index": target, "version_type": "external"}}
+    # The concrete index is dropped in the same atomic update that adds the alias.
+    assert client.bodies("update_aliases") == [{"actions": [
+        {"remove_index": {"index": "docs"}},
+        {"add": {"index": target, "alias": "docs"}},
+    ]}]
+    settings = client.bodies("put_settings")
+    assert {"index": {"refresh_interval": "-1"}} in settings
+    assert {"index": {"refresh_interval": "5s"}} in settings
+    assert {"index": {"blocks.write": True}} in settings
+
+
+def test_aliased_index_keeps_the_previous_index_unblocked(make_store):
+    client = RecordingClient(alias_target="docs-default-1")
+    target = make_store(client).migrate_index("memory-optimized")
+    assert client.bodies("update_aliases") == [{"actions": [
+        {"remove": {"index": "docs-default-1", "alias": "docs"}},
+        {"add": {"index": target, "alias": "docs"}},
+    ]}]
+    assert client.bodies("put_settings")[-1] == {"index": {"blocks.write": False}}
+    assert client.bodies("delete") == []
+
+
+def test_count_mismatch_lifts_the_write_block(make_store):
+    client = RecordingClient(alias_target="docs-default-1", counts=(10, 9))
+    with pytest.raises(RuntimeError, match="alias not moved"):
+        make_store(client).migrate_index("memory-optimized")
+    assert client.bodies("update_aliases") == []
+    assert client.bodies("put_settings")[-1] == {"index": {"blocks.write": False}}
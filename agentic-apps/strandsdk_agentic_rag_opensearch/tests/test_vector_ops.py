@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.utils.vector_ops import normalize_rows, pooling_map, resize_rows
+
+
+def reference_resize(vector, target_dim):
+    """The per-element pooling loop resize_rows replaced."""
+    ratio = len(vector) / target_dim
+    pooled = []
+    for i in range(target_dim):
+        segment = vector[int(i * ratio):int((i + 1) * ratio)]
+        pooled.append(sum(segment) / len(segment) if len(segment) else 0.0)
+    pooled = np.asarray(pooled)
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm else pooled
+
+
+@pytest.mark.parametrize("source_dim, target_dim", [(1024, 384), (768, 384), (4096, 384), (300, 384), (7, 3)])
+def test_resize_matches_the_per_element_loop(source_dim, target_dim):
+    vectors = np.random.default_rng(0).normal(size=(5, source_dim))
+    resized = resize_rows(vectors, target_dim)
+    assert resized.shape == (5, target_dim)
+    for row, expected in zip(resized, vectors):
+        np.testing.assert_allclose(row, reference_resize(expected, target_dim), atol=1e-12)
+
+
+def test_matching_dimension_is_returned_as_is():
+    vectors = np.random.default_rng(0).normal(size=(2, 384))
+    np.testing.assert_array_equal(resize_rows(vectors, 384), vectors)
+
+
+def test_pooling_map_tiles_the_source():
+    starts, counts, empty, end = pooling_map(1024, 384)
+    assert not empty.any()
+    assert end == 1024
+    assert counts.sum() == 1024
+    np.testing.assert_array_equal(starts[1:], starts[:-1] + counts[:-1])
+    with pytest.raises(ValueError):
+        starts[0] = 1
+
+
+def test_upsampling_leaves_empty_dimensions_zero():
+    _, _, empty, _ = pooling_map(300, 384)
+    assert empty.any()
+    resized = resize_rows(np.ones((1, 300)), 384)
+    assert (resized[0, empty] == 0).all()
+
+
+def test_normalize_rows_keeps_zero_rows():
+    vectors = np.array([[3.0, 4.0], [0.0, 0.0]])
+    normalized = normalize_rows(vectors)
+    np.testing.assert_allclose(normalized, [[0.6, 0.8], [0.0, 0.0]])
+    assert vectors[0, 0] == 3.0
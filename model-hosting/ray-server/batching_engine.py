@@ -0,0 +1,421 @@
+import asyncio
+import codecs
+import logging
+import queue
+import threading
+import time
+
+import llama_cpp
+from llama_cpp import Llama
+from llama_cpp._internals import LlamaBatch, LlamaContext
+from ray.serve import metrics
+
+from inference_executor import InferenceJob, STREAM_END, stop_queue
+from serving_errors import QueueFullError
+
+logger = logging.getLogger("ray.serve")
+
+
+class SamplingConfig:
+    """Per-request sampling settings, defaulting to Llama.create_completion's."""
+
+    def __init__(self, max_tokens: int = 16, temperature: float = 0.8, top_p: float = 0.95,
+                 top_k: int = 40, min_p: float = 0.05, seed: int = None, stop=None, grammar=None):
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.min_p = min_p
+        self.seed = llama_cpp.LLAMA_DEFAULT_SEED if seed is None else seed
+        self.stop = [stop] if isinstance(stop, str) else list(stop or [])
+        self.grammar = grammar
+
+    def build_sampler(self, model):
+        chain = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        if self.grammar is not None:
+            # Masks tokens the grammar cannot accept before any other sampler runs.
+            llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_grammar(
+                model, self.grammar._grammar.encode("utf-8"), self.grammar._root.encode("utf-8")))
+        if self.temperature <= 0:
+            llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_greedy())
+            return chain
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_top_k(self.top_k))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_top_p(self.top_p, 1))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_min_p(self.min_p, 1))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_temp(self.temperature))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_dist(self.seed))
+        return chain
+
+
+class _Slot:
+    """One KV-cache sequence (seq_id) of the shared batch context."""
+
+    def __init__(self, seq_id: int):
+        self.seq_id = seq_id
+        self.job = None
+        self.sampling = None
+        self.sampler = None
+        self.pending = []
+        self.n_past = 0
+        self.last_token = None
+        self.batch_index = -1
+        self.n_prompt = 0
+        self.n_generated = 0
+        self.decoder = None
+        self.text = ""
+        self.sent = 0
+        # Tokens currently held in this sequence's KV cells; kept after release
+        # so the next request with the same prefix can skip its prefill.
+        self.tokens = []
+
+    @property
+    def busy(self) -> bool:
+        return self.job is not None
+
+    def release(self) -> None:
+        if self.sampler is not None:
+            llama_cpp.llama_sampler_free(self.sampler)
+        self.job = None
+        self.sampler = None
+        self.pending = []
+        self.batch_index = -1
+
+
+class ContinuousBatchingEngine:
+    """Continuous batching over llama.cpp's multi-sequence decode API.
+
+    The engine owns a second llama.cpp context with n_seq_max = n_parallel and
+    n_parallel * n_ctx_per_seq KV cells, sharing weights with `llm`. A single
+    thread runs the decode loop: every iteration packs one pending token for
+    each decoding sequence plus prompt chunks for newly admitted ones into one
+    llama_batch, so new requests join the in-flight batch at token boundaries
+    instead of waiting for the running generations to finish.
+
+    Finished sequences keep their KV cells. A new request is placed in the free
+    sequence sharing the longest token prefix with its prompt and only the
+    tokens after that prefix are prefilled, so repeated system prompts cost
+    nothing after the first request.
+
+    submit/submit_stream produce the same chunk dicts as Llama.__call__, so the
+    deployment can swap it in for InferenceExecutor.
+    """
+
+    def __init__(self, llm: Llama, n_parallel: int = 8, n_ctx_per_seq: int = None,
+                 max_queue_size: int = 32, name: str = "llama-batching", model: str = ""):
+        self.llm = llm
+        self.n_parallel = n_parallel
+        self.n_ctx_per_seq = n_ctx_per_seq or llm.n_ctx()
+        self.n_batch = llm.n_batch
+        self.max_queue_size = max_queue_size
+        self.name = name
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = self.n_ctx_per_seq * n_parallel
+        params.n_batch = self.n_batch
+        params.n_ubatch = llm.context_params.n_ubatch
+        params.n_seq_max = n_parallel
+        params.n_threads = llm.context_params.n_threads
+        params.n_threads_batch = llm.context_params.n_threads_batch
+        self._ctx = LlamaContext(model=llm._model, params=params, verbose=llm.verbose)
+        self._batch = LlamaBatch(n_tokens=self.n_batch, embd=0, n_seq_max=n_parallel, verbose=llm.verbose)
+        self._slots = [_Slot(seq_id) for seq_id in range(n_parallel)]
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._generated_tokens = 0
+        self._completed = 0
+        self._rejected = 0
+        self._decode_steps = 0
+        self._reused_tokens = 0
+
+        self._queue_depth = metrics.Gauge(
+            "llama_batching_queue_depth",
+            description="Requests waiting for a free batch slot.",
+            tag_keys=("model",),
+        )
+        self._active_slots = metrics.Gauge(
+            "llama_batching_active_sequences",
+            description="Sequences currently being decoded together.",
+            tag_keys=("model",),
+        )
+        self._tokens_counter = metrics.Counter(
+            "llama_batching_generated_tokens_total",
+            description="Tokens generated by the continuous batching engine.",
+            tag_keys=("model",),
+        )
+        self._rejections = metrics.Counter(
+            "llama_batching_rejected_total",
+            description="Requests rejected by admission control.",
+            tag_keys=("model",),
+        )
+        self._reused_counter = metrics.Counter(
+            "llama_batching_prefix_reused_tokens_total",
+            description="Prompt tokens served from a sequence's retained KV cells.",
+            tag_keys=("model",),
+        )
+
+        for metric in (self._queue_depth, self._active_slots, self._tokens_counter,
+                       self._rejections, self._reused_counter):
+            metric.set_default_tags({"model": model})
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        logger.info(f"{name}: {n_parallel} sequences x {self.n_ctx_per_seq} ctx, n_batch={self.n_batch}")
+
+    def submit_stream(self, prompt, **sampling):
+        """Admit a request and return an async iterator of completion chunks.
+
+        prompt is either text or a list of token ids, as for Llama.__call__.
+        Raises ValueError when a token prompt plus max_tokens does not fit in
+        one sequence's context.
+        """
+        job = InferenceJob(None, asyncio.get_running_loop(), streaming=True)
+        job.prompt = prompt
+        job.sampling = SamplingConfig(**sampling)
+        if isinstance(prompt, list):
+            # Token prompts are checked here so the caller gets the error before streaming starts.
+            self._check_budget(len(prompt), job.sampling.max_tokens)
+        if self._stopping.is_set():
+            raise QueueFullError(f"{self.name} is shutting down")
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._rejected += 1
+            self._rejections.inc()
+            raise QueueFullError(f"{self.name} queue is full ({self.max_queue_size} requests waiting)")
+        self._queue_depth.set(self._queue.qsize())
+        return job.stream()
+
+    async def submit(self, prompt, **sampling) -> dict:
+        """Run a request to completion and return a Llama-style completion dict."""
+        text = []
+        finish_reason = None
+        usage = None
+        async for chunk in self.submit_stream(prompt, **sampling):
+            choice = chunk["choices"][0]
+            text.append(choice["text"])
+            finish_reason = choice["finish_reason"] or finish_reason
+            usage = chunk.get("usage", usage)
+        return {
+            "object": "text_completion",
+            "choices": [{"text": "".join(text), "index": 0, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def _check_budget(self, n_prompt: int, max_tokens: int) -> None:
+        """Reject prompts that leave no room for max_tokens in a sequence's context."""
+        if n_prompt + max_tokens > self.n_ctx_per_seq:
+            raise ValueError(
+                f"Prompt of {n_prompt} tokens plus max_tokens {max_tokens} exceeds "
+                f"the context of {self.n_ctx_per_seq} tokens"
+            )
+
+    def _tokenize(self, job: InferenceJob) -> list:
+        if isinstance(job.prompt, list):
+            tokens = job.prompt
+        else:
+            tokens = self.llm.tokenize(job.prompt.encode("utf-8"), special=True)
+        self._check_budget(len(tokens), job.sampling.max_tokens)
+        return tokens
+
+    def _pick_slot(self, free: list, tokens: list) -> tuple:
+        best, best_len = free[0], -1
+        for slot in free:
+            prefix_len = Llama.longest_token_prefix(slot.tokens, tokens)
+            if prefix_len > best_len:
+                best, best_len = slot, prefix_len
+        # At least one prompt token must be evaluated to get logits to sample from.
+        return best, min(best_len, len(tokens) - 1)
+
+    def _admit(self, slot: _Slot, job: InferenceJob, tokens: list, reused: int) -> None:
+        self._ctx.kv_cache_seq_rm(slot.seq_id, reused, -1)
+        del slot.tokens[reused:]
+        if reused:
+            self._reused_tokens += reused
+            self._reused_counter.inc(reused)
+
+        sampling = job.sampling
+        slot.job = job
+        slot.sampling = sampling
+        slot.sampler = sampling.build_sampler(self.llm._model.model)
+        slot.pending = tokens[reused:]
+        slot.n_past = reused
+        slot.n_prompt = len(tokens)
+        slot.n_generated = 0
+        slot.last_token = None
+        slot.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        slot.text = ""
+        slot.sent = 0
+
+    def _emit(self, slot: _Slot, text: str, finish_reason=None) -> None:
+        chunk = {
+            "object": "text_completion",
+            "created": int(time.time()),
+            "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+        }
+        if finish_reason is not None:
+            chunk["usage"] = {
+                "prompt_tokens": slot.n_prompt,
+                "completion_tokens": slot.n_generated,
+                "total_tokens": slot.n_prompt + slot.n_generated,
+            }
+        slot.job.put_token(chunk)
+
+    def _finish(self, slot: _Slot, finish_reason: str) -> None:
+        self._emit(slot, slot.text[slot.sent:], finish_reason)
+        slot.job.put_token(STREAM_END)
+        self._completed += 1
+        slot.release()
+
+    def _accept_token(self, slot: _Slot, token: int) -> None:
+        slot.n_generated += 1
+        slot.last_token = token
+        if llama_cpp.llama_token_is_eog(self.llm._model.model, token):
+            self._finish(slot, "stop")
+            return
+
+        slot.text += slot.decoder.decode(self.llm.detokenize([token]))
+        stops = slot.sampling.stop
+        if stops:
+            for stop in stops:
+                index = slot.text.find(stop, max(0, slot.sent - len(stop) + 1))
+                if index != -1:
+                    slot.text = slot.text[:index]
+                    self._finish(slot, "stop")
+                    return
+            # Hold back text that could still turn into a stop sequence.
+            safe = len(slot.text) - (max(len(stop) for stop in stops) - 1)
+        else:
+            safe = len(slot.text)
+
+        if slot.n_generated >= slot.sampling.max_tokens or slot.n_past >= self.n_ctx_per_seq:
+            self._finish(slot, "length")
+            return
+        if safe > slot.sent:
+            self._emit(slot, slot.text[slot.sent:safe])
+            slot.sent = safe
+
+    def _fill_batch(self) -> int:
+        batch = self._batch.batch
+        n = 0
+
+        def add(slot: _Slot, token: int, logits: bool):
+            nonlocal n
+            batch.token[n] = token
+            batch.pos[n] = slot.n_past
+            batch.seq_id[n][0] = slot.seq_id
+            batch.n_seq_id[n] = 1
+            batch.logits[n] = logits
+            slot.tokens.append(token)
+            slot.n_past += 1
+            n += 1
+
+        # Sequences that are decoding go first so a long prompt never stalls them.
+        for slot in self._slots:
+            slot.batch_index = -1
+            if slot.busy and not slot.pending and slot.last_token is not None:
+                slot.batch_index = n
+                add(slot, slot.last_token, True)
+
+        # Spend the rest of n_batch on prompt prefill, chunking long prompts.
+        for slot in self._slots:
+            if not (slot.busy and slot.pending) or n >= self.n_batch:
+                continue
+            take = min(len(slot.pending), self.n_batch - n)
+            chunk, slot.pending = slot.pending[:take], slot.pending[take:]
+            for i, token in enumerate(chunk):
+                is_last = not slot.pending and i == take - 1
+                if is_last:
+                    slot.batch_index = n
+                add(slot, token, is_last)
+
+        batch.n_tokens = n
+        return n
+
+    def _run(self) -> None:
+        while True:
+            active = [slot for slot in self._slots if slot.busy]
+            free = [slot for slot in self._slots if not slot.busy]
+
+            # Admit new requests into free sequences at this token boundary.
+            while free:
+                try:
+                    job = self._queue.get(block=not active)
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._close()
+                    return
+                if job.cancelled.is_set():
+                    continue
+                try:
+                    tokens = self._tokenize(job)
+                except Exception as e:
+                    logger.error(f"{self.name} failed to admit request: {str(e)}")
+                    job.fail(e)
+                    continue
+                slot, reused = self._pick_slot(free, tokens)
+                free.remove(slot)
+                self._admit(slot, job, tokens, reused)
+                active.append(slot)
+            self._queue_depth.set(self._queue.qsize())
+
+            for slot in active:
+                if slot.busy and slot.job.cancelled.is_set():
+                    logger.info(f"{self.name} sequence {slot.seq_id} cancelled by consumer")
+                    slot.release()
+            active = [slot for slot in active if slot.busy]
+            self._active_slots.set(len(active))
+            if not active:
+                continue
+
+            if self._fill_batch() == 0:
+                continue
+            try:
+                self._ctx.decode(self._batch)
+            except Exception as e:
+                logger.error(f"{self.name} decode failed: {str(e)}")
+                for slot in active:
+                    slot.job.fail(e)
+                    self._ctx.kv_cache_seq_rm(slot.seq_id, 0, -1)
+                    slot.tokens = []
+                    slot.release()
+                continue
+            self._decode_steps += 1
+
+            sampled = 0
+            for slot in active:
+                if slot.batch_index < 0:
+                    continue
+                token = llama_cpp.llama_sampler_sample(slot.sampler, self._ctx.ctx, slot.batch_index)
+                sampled += 1
+                self._accept_token(slot, token)
+            if sampled:
+                self._generated_tokens += sampled
+                self._tokens_counter.inc(sampled)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "continuous",
+            "queue_depth": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "active_sequences": sum(1 for slot in self._slots if slot.busy),
+            "n_parallel": self.n_parallel,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "generated_tokens": self._generated_tokens,
+            "decode_steps": self._decode_steps,
+            "prefix_reused_tokens": self._reused_tokens,
+        }
+
+    def _close(self) -> None:
+        for slot in self._slots:
+            slot.release()
+        self._batch.close()
+        self._ctx.close()
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._stopping.set()
+        stop_queue(self._queue, self.name)
+        if wait:
+            self._thread.join()
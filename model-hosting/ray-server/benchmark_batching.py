@@ -0,0 +1,114 @@
+"""Tokens/sec benchmark: one-request-at-a-time vs continuous batching.
+
+Loads the same GGUF model the deployment uses and pushes the prompts from
+benchmark/prompts.txt through both execution paths at a fixed concurrency:
+
+    python benchmark_batching.py --concurrency 16 --n-parallel 8 --max-tokens 128
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from functools import partial
+
+import ray
+from llama_cpp import Llama
+
+from batching_engine import ContinuousBatchingEngine
+from inference_executor import InferenceExecutor
+
+DEFAULT_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmark", "prompts.txt")
+
+
+def load_prompts(path: str, total: int) -> list:
+    with open(path) as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    return [("Q: " + prompts[i % len(prompts)] + " A: ") for i in range(total)]
+
+
+async def run_load(submit, prompts: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    completion_tokens = 0
+
+    async def one(prompt: str):
+        nonlocal completion_tokens
+        async with semaphore:
+            start = time.perf_counter()
+            output = await submit(prompt)
+            latencies.append(time.perf_counter() - start)
+            completion_tokens += output["usage"]["completion_tokens"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(prompt) for prompt in prompts))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(prompts),
+        "completion_tokens": completion_tokens,
+        "elapsed_s": elapsed,
+        "tokens_per_s": completion_tokens / elapsed,
+        "p50_latency_s": statistics.median(latencies),
+        "max_latency_s": max(latencies),
+    }
+
+
+def print_result(name: str, result: dict) -> None:
+    print(f"{name:<12} requests={result['requests']:<4} tokens={result['completion_tokens']:<6} "
+          f"elapsed={result['elapsed_s']:.1f}s tokens/s={result['tokens_per_s']:.1f} "
+          f"p50={result['p50_latency_s']:.2f}s max={result['max_latency_s']:.2f}s")
+
+
+async def main(args):
+    llm = Llama.from_pretrained(
+        repo_id=args.model_id,
+        filename=args.filename,
+        n_ctx=args.n_ctx,
+        n_threads=args.n_threads,
+        verbose=False
+    )
+    prompts = load_prompts(args.prompts, args.requests)
+    sampling = {"max_tokens": args.max_tokens, "temperature": args.temperature}
+
+    executor = InferenceExecutor(max_queue_size=len(prompts))
+
+    async def sequential(prompt: str):
+        return await executor.submit(partial(llm, prompt, **sampling))
+
+    engine = ContinuousBatchingEngine(llm, n_parallel=args.n_parallel, n_ctx_per_seq=args.n_ctx,
+                                      max_queue_size=len(prompts))
+
+    async def continuous(prompt: str):
+        return await engine.submit(prompt, **sampling)
+
+    # Warm both paths so page faults and graph allocation are not measured.
+    await sequential(prompts[0])
+    await continuous(prompts[0])
+
+    baseline = await run_load(sequential, prompts, args.concurrency)
+    print_result("sequential", baseline)
+    batched = await run_load(continuous, prompts, args.concurrency)
+    print_result("continuous", batched)
+    print(f"speedup: {batched['tokens_per_s'] / baseline['tokens_per_s']:.2f}x")
+
+    executor.shutdown()
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-id", default=os.getenv("MODEL_ID", "SanctumAI/Llama-3.2-1B-Instruct-GGUF"))
+    parser.add_argument("--filename", default=os.getenv("MODEL_FILENAME", "*Q4_0.gguf"))
+    parser.add_argument("--n-ctx", type=int, default=int(os.getenv("N_CTX", "2048")))
+    parser.add_argument("--n-threads", type=int, default=int(os.getenv("N_THREADS", str(os.cpu_count()))))
+    parser.add_argument("--n-parallel", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--temperature", type=float, default=0.8)
+    parser.add_argument("--prompts", default=DEFAULT_PROMPTS)
+    args = parser.parse_args()
+
+    # Ray Serve metrics used by the executors need a local Ray runtime.
+    ray.init(include_dashboard=False, log_to_driver=False)
+    asyncio.run(main(args))
@@ -0,0 +1,114 @@
+"""Tokens/sec benchmark: a deployment with speculative decoding vs one without.
+
+Sends the prompts from benchmark/prompts.txt as OpenAI chat completions to
+two endpoints, e.g. a LLamaCPPDeployment with SPECULATIVE_MODE=prompt_lookup
+next to a plain one, or two VLLMDeployments with and without
+SPECULATIVE_MODE=ngram:
+
+    python benchmark_speculative.py \\
+        --baseline http://llamacpp:8000/v1/chat/completions \\
+        --candidate http://llamacpp-spec:8000/v1/chat/completions --concurrency 4
+
+Per-request tokens/sec is the number speculation improves. Aggregate
+throughput is shown too, since verification costs extra compute at high
+concurrency. When --candidate-health is given the draft acceptance rate
+reported there is printed as well.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmark", "prompts.txt")
+
+
+def load_prompts(path: str, total: int) -> list:
+    with open(path) as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    return [prompts[i % len(prompts)] for i in range(total)]
+
+
+def run_load(url: str, prompts: list, args) -> dict:
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {args.api_key}"} if args.api_key else {}
+
+    def one(prompt: str) -> tuple:
+        body = {
+            "model": args.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": args.max_tokens,
+            "temperature": args.temperature,
+        }
+        start = time.perf_counter()
+        response = session.post(url, json=body, headers=headers, timeout=args.timeout)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        return elapsed, response.json()["usage"]["completion_tokens"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, prompts))
+    elapsed = time.perf_counter() - start
+
+    completion_tokens = sum(tokens for _, tokens in results)
+    return {
+        "requests": len(results),
+        "completion_tokens": completion_tokens,
+        "elapsed_s": elapsed,
+        "tokens_per_s": completion_tokens / elapsed,
+        "request_tokens_per_s": statistics.median(tokens / latency for latency, tokens in results),
+        "p50_latency_s": statistics.median(latency for latency, _ in results),
+    }
+
+
+def print_result(name: str, result: dict) -> None:
+    print(f"{name:<10} requests={result['requests']:<4} tokens={result['completion_tokens']:<6} "
+          f"elapsed={result['elapsed_s']:.1f}s tokens/s={result['tokens_per_s']:.1f} "
+          f"per-request tokens/s={result['request_tokens_per_s']:.1f} p50={result['p50_latency_s']:.2f}s")
+
+
+def main(args):
+    prompts = load_prompts(args.prompts, args.requests)
+    # One request each to load weights and fill caches before timing.
+    warmup = argparse.Namespace(**{**vars(args), "concurrency": 1})
+    for url in (args.baseline, args.candidate):
+        run_load(url, prompts[:1], warmup)
+
+    baseline = run_load(args.baseline, prompts, args)
+    print_result("baseline", baseline)
+    candidate = run_load(args.candidate, prompts, args)
+    print_result("candidate", candidate)
+    print(f"per-request speedup: {candidate['request_tokens_per_s'] / baseline['request_tokens_per_s']:.2f}x "
+          f"throughput speedup: {candidate['tokens_per_s'] / baseline['tokens_per_s']:.2f}x")
+
+    if args.candidate_health:
+        health = requests.get(args.candidate_health, timeout=args.timeout).json()
+        print("candidate speculative stats:", json.dumps(find_speculative(health), indent=2))
+
+
+def find_speculative(health: dict):
+    """Pull the "speculative" sections out of either deployment's /health body."""
+    if "speculative" in health:
+        return health["speculative"]
+    loaded = health.get("models", {}).get("loaded", {})
+    return {name: model.get("speculative") for name, model in loaded.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", required=True, help="chat completions URL without speculation")
+    parser.add_argument("--candidate", required=True, help="chat completions URL with speculation")
+    parser.add_argument("--candidate-health", help="/health URL of the candidate deployment")
+    parser.add_argument("--model", default=os.getenv("MODEL_ID", ""))
+    parser.add_argument("--api-key", default=os.getenv("LLM_API_KEY"))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=38)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--prompts", default=DEFAULT_PROMPTS)
+    main(parser.parse_args())
@@ -0,0 +1,58 @@
+import logging
+
+from llama_cpp import Llama
+from llama_cpp import llama_chat_format
+
+logger = logging.getLogger("ray.serve")
+
+
+class ChatTemplate:
+    """Renders OpenAI `messages` with the chat template embedded in the GGUF.
+
+    The Jinja template is compiled once when the model is loaded, and the
+    rendered prompt is tokenized here so the caller gets exact prompt token
+    counts and can pass token ids straight to llama.cpp. Models without an
+    embedded template fall back to ChatML.
+    """
+
+    def __init__(self, llm: Llama):
+        self.llm = llm
+        template = llm.metadata.get("tokenizer.chat_template")
+        eos_token_id = llm.token_eos()
+        bos_token_id = llm.token_bos()
+        if template:
+            eos_token = llm._model.token_get_text(eos_token_id) if eos_token_id != -1 else ""
+            bos_token = llm._model.token_get_text(bos_token_id) if bos_token_id != -1 else ""
+        else:
+            logger.warning("GGUF has no tokenizer.chat_template, falling back to ChatML")
+            template = llama_chat_format.CHATML_CHAT_TEMPLATE
+            eos_token = llama_chat_format.CHATML_EOS_TOKEN
+            bos_token = llama_chat_format.CHATML_BOS_TOKEN
+        self.formatter = llama_chat_format.Jinja2ChatFormatter(
+            template=template,
+            eos_token=eos_token,
+            bos_token=bos_token,
+            stop_token_ids=[eos_token_id]
+        )
+
+    @staticmethod
+    def normalize_messages(messages: list) -> list:
+        """Flatten OpenAI content-part lists into the plain strings templates expect."""
+        normalized = []
+        for message in messages:
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+            normalized.append({**message, "content": content})
+        return normalized
+
+    def render(self, messages: list) -> tuple:
+        """Return (prompt_tokens, stop_strings) for a conversation."""
+        result = self.formatter(messages=self.normalize_messages(messages))
+        tokens = self.llm.tokenize(
+            result.prompt.encode("utf-8"),
+            add_bos=not result.added_special,
+            special=True
+        )
+        stop = result.stop if isinstance(result.stop, list) else [result.stop] if result.stop else []
+        return tokens, stop
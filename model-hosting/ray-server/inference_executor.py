@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from ray.serve import metrics
+
+from serving_errors import QueueFullError
+
+logger = logging.getLogger("ray.serve")
+
+STREAM_END = object()
+
+
+def stop_queue(jobs: queue.Queue, name: str) -> None:
+    """Fail every job still waiting in jobs, then enqueue the None stop sentinel.
+
+    Never blocks: draining first makes room for the sentinel in a full
+    bounded queue, and callers waiting on the failed jobs get QueueFullError.
+    """
+    while True:
+        try:
+            job = jobs.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            if job is not None:
+                job.fail(QueueFullError(f"{name} is shutting down"))
+            continue
+        try:
+            jobs.put_nowait(None)
+            return
+        except queue.Full:
+            # A submit raced in after the drain
+            continue
+
+
+class InferenceJob:
+    def __init__(self, fn, loop: asyncio.AbstractEventLoop, streaming: bool):
+        self.fn = fn
+        self.loop = loop
+        self.streaming = streaming
+        self.enqueued_at = time.monotonic()
+        self.cancelled = threading.Event()
+        self.future = loop.create_future()
+        self.tokens = asyncio.Queue() if streaming else None
+
+    def _deliver(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def _resolve(self, value, is_error: bool):
+        if self.future.done():
+            return
+        if is_error:
+            self.future.set_exception(value)
+        else:
+            self.future.set_result(value)
+
+    def set_result(self, value):
+        self._deliver(self._resolve, value, False)
+
+    def fail(self, exc: BaseException):
+        if self.streaming:
+            self._deliver(self.tokens.put_nowait, exc)
+        else:
+            self._deliver(self._resolve, exc, True)
+
+    def put_token(self, item):
+        self._deliver(self.tokens.put_nowait, item)
+
+    def stream(self) -> "TokenStream":
+        return TokenStream(self)
+
+
+class TokenStream:
+    """Async iterator over the items a streaming job produces until STREAM_END.
+
+    Unlike an async generator, aclose() cancels the job even when iteration
+    never started, and it is safe to call more than once.
+    """
+
+    def __init__(self, job: InferenceJob):
+        self.job = job
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.job.cancelled.is_set():
+            raise StopAsyncIteration
+        item = await self.job.tokens.get()
+        if item is STREAM_END:
+            self.job.cancelled.set()
+            raise StopAsyncIteration
+        if isinstance(item, BaseException):
+            self.job.cancelled.set()
+            raise item
+        return item
+
+    async def aclose(self) -> None:
+        self.job.cancelled.set()
+
+
+class InferenceExecutor:
+    """Runs blocking llama.cpp calls on one dedicated thread.
+
+    Requests wait in a bounded FIFO queue; when it is full `submit` raises
+    QueueFullError so the caller can answer 429 immediately. The event loop
+    only awaits futures, so health checks and streaming stay responsive while
+    a generation is running.
+    """
+
+    def __init__(self, max_queue_size: int = 32, max_queue_wait_s: float = None,
+                 name: str = "llama-inference", model: str = ""):
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait_s = max_queue_wait_s
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self._last_wait_s = 0.0
+
+        self._queue_depth = metrics.Gauge(
+            "llama_executor_queue_depth",
+            description="Requests waiting for the inference thread.",
+            tag_keys=("model",),
+        )
+        self._queue_wait = metrics.Histogram(
+            "llama_executor_queue_wait_seconds",
+            description="Time a request spent queued before inference started.",
+            boundaries=[0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60],
+            tag_keys=("model",),
+        )
+        self._rejections = metrics.Counter(
+            "llama_executor_rejected_total",
+            description="Requests rejected by admission control.",
+            tag_keys=("model",),
+        )
+
+        for metric in (self._queue_depth, self._queue_wait, self._rejections):
+            metric.set_default_tags({"model": model})
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, job: InferenceJob) -> None:
+        if self._stopping.is_set():
+            raise QueueFullError(f"{self.name} is shutting down")
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._rejected += 1
+            self._rejections.inc()
+            raise QueueFullError(f"{self.name} queue is full ({self.max_queue_size} requests waiting)")
+        self._queue_depth.set(self._queue.qsize())
+
+    async def submit(self, fn):
+        """Run fn() on the inference thread and return its result."""
+        job = InferenceJob(fn, asyncio.get_running_loop(), streaming=False)
+        self._enqueue(job)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            job.cancelled.set()
+            raise
+
+    def submit_stream(self, fn):
+        """Admit a streaming job and return an async iterator over its items.
+
+        fn() must return a generator; it is iterated on the inference thread and
+        closed as soon as the consumer stops iterating.
+        """
+        job = InferenceJob(fn, asyncio.get_running_loop(), streaming=True)
+        self._enqueue(job)
+        return job.stream()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._queue_depth.set(self._queue.qsize())
+
+            wait_s = time.monotonic() - job.enqueued_at
+            self._last_wait_s = wait_s
+            self._queue_wait.observe(wait_s)
+
+            if job.cancelled.is_set():
+                continue
+            if self.max_queue_wait_s and wait_s > self.max_queue_wait_s:
+                job.fail(QueueFullError(f"Request waited {wait_s:.1f}s in {self.name} queue"))
+                continue
+
+            self._active = 1
+            try:
+                if job.streaming:
+                    self._run_stream(job)
+                else:
+                    job.set_result(job.fn())
+            except Exception as e:
+                logger.error(f"{self.name} job failed: {str(e)}")
+                job.fail(e)
+            finally:
+                self._active = 0
+                self._completed += 1
+
+    def _run_stream(self, job: InferenceJob) -> None:
+        generator = job.fn()
+        try:
+            for item in generator:
+                if job.cancelled.is_set():
+                    logger.info(f"{self.name} stream cancelled by consumer")
+                    break
+                job.put_token(item)
+        except Exception as e:
+            logger.error(f"{self.name} stream failed: {str(e)}")
+            job.fail(e)
+        finally:
+            generator.close()
+            job.put_token(STREAM_END)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "sequential",
+            "queue_depth": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "active": self._active,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "last_queue_wait_s": round(self._last_wait_s, 4),
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._stopping.set()
+        stop_queue(self._queue, self.name)
+        if wait:
+            self._thread.join()
@@ -1,11 +1,14 @@
 
 
 
+import json
 import multiprocessing
 import os
 import logging
 import time
+from functools import partial
 from fastapi import FastAPI
+from starlette.background import BackgroundTask
 from starlette.requests import Request
 from starlette.responses import StreamingResponse, JSONResponse
 
@@ -17,6 +20,12 @@ import logging
 
 from llama_cpp import Llama
 
+from model_loader import GGUFLoader
+from model_registry import LoadedModel, ModelNotFoundError, ModelRegistry, ModelSpec
+from prompt_lookup import MeteredPromptLookupDecoding
+from serving_errors import QueueFullError
+from structured_output import GrammarCache
+from thread_tuner import CpuTopology, ThreadTuner
 
 
 logger = logging.getLogger("ray.serve")
@@ -29,74 +38,281 @@ app = FastAPI()
 @serve.ingress(app)
 class LLamaCPPDeployment:
     def __init__(self, parallelism: str):
-        os.environ["OMP_NUM_THREADS"] = parallelism
+        # The pod's CPU quota and Ray's CPU grant, not the node size, bound useful threads.
+        self.topology = CpuTopology.detect()
+        effective_cpus = self.topology.effective_cpus
+        logger.info(f"CPU topology: {self.topology.as_dict()}")
+        os.environ["OMP_NUM_THREADS"] = str(min(int(parallelism), effective_cpus))
         # Initialize the LLamaCPP model
         self.model_id = os.getenv("MODEL_ID", default="SanctumAI/Llama-3.2-1B-Instruct-GGUF")
         # Get filename from environment variable with default fallback to "*Q4_0.gguf"
         self.filename = os.getenv("MODEL_FILENAME", default="*Q4_0.gguf")
         self.n_ctx = int(os.getenv("N_CTX"))
-        self.n_threads = int(os.getenv("N_THREADS"))
+        self.n_threads = int(os.getenv("N_THREADS", effective_cpus))
+        if self.n_threads > effective_cpus:
+            logger.warning(f"N_THREADS={self.n_threads} oversubscribes the {effective_cpus} CPUs available")
+        # AUTOTUNE_THREADS benchmarks thread and batch settings once per model and CPU
+        # type, caching the winner so later replicas start with the same choice.
+        self.tuner = None
+        if os.getenv("AUTOTUNE_THREADS", default="0") == "1":
+            profile_dir = os.getenv("THREAD_PROFILE_DIR") or os.path.join(
+                os.getenv("MODEL_CACHE_DIR") or os.path.expanduser("~/.cache"), "thread-profiles")
+            self.tuner = ThreadTuner(self.topology, profile_dir)
         # self.n_batch = int(os.getenv("N_BATCH"))
         # self.llama_cpp = Llama(model_path=MODEL_ID, n_ctx=self.n_ctx, n_batch=self.n_batch)
-        self.llm = Llama.from_pretrained(repo_id=self.model_id,filename=self.filename,n_ctx=self.n_ctx,n_threads=self.n_threads)
         #"hugging-quants/Llama-3.2-3B-Instruct-Q8_0-GGUF",
+        # MODEL_REGISTRY lists every GGUF this replica may serve; requests pick one with
+        # their "model" field and idle models are unloaded to fit MODEL_RAM_BUDGET_GB.
+        # MODEL_CACHE_DIR (a hostPath or PVC) lets new replicas start without the hub
+        # when the cached GGUF's checksum still matches.
+        self.loader = GGUFLoader(
+            cache_dir=os.getenv("MODEL_CACHE_DIR"),
+            verify=os.getenv("MODEL_CACHE_VERIFY", default="size"),
+            warmup=os.getenv("MODEL_WARMUP", default="1") == "1",
+            prefault=os.getenv("MODEL_PREFAULT", default="1") == "1"
+        )
+        specs = ModelSpec.from_env(self.model_id, self.model_id, self.filename, self.n_ctx)
+        default_model = os.getenv("DEFAULT_MODEL", default=self.model_id if self.model_id in specs else next(iter(specs)))
+        self.registry = ModelRegistry(
+            specs,
+            default_model,
+            self.load_model,
+            ram_budget_bytes=int(float(os.getenv("MODEL_RAM_BUDGET_GB", "0")) * (1 << 30))
+        )
+        self.registry.preload(self.load_model(specs[default_model]))
+        # response_format grammars are model independent, so one cache serves all models.
+        self.grammars = GrammarCache()
         print("__init__ Complete")
 
+    def load_model(self, spec: ModelSpec) -> LoadedModel:
+        llama_kwargs = {"n_ctx": spec.n_ctx, "n_threads": self.n_threads}
+        batching_mode = os.getenv("BATCHING_MODE", default="sequential")
+        # SPECULATIVE_MODE=prompt_lookup drafts tokens by matching n-grams already in the
+        # prompt; it applies to sequential mode, the batching engine samples on its own.
+        if os.getenv("SPECULATIVE_MODE", default="") == "prompt_lookup":
+            if batching_mode == "continuous":
+                logger.warning("Prompt lookup decoding is not used in continuous batching mode")
+            else:
+                llama_kwargs["draft_model"] = MeteredPromptLookupDecoding(
+                    max_ngram_size=int(os.getenv("NGRAM_PROMPT_LOOKUP_MAX", "2")),
+                    num_pred_tokens=int(os.getenv("NUM_SPECULATIVE_TOKENS", "10")),
+                    model=spec.name
+                )
+        tune = None
+        if self.tuner is not None:
+            llama_kwargs["n_batch"] = max(self.tuner.n_batch_grid)
+            tune = partial(self.tuner.tune, spec.name, spec.repo_id, spec.filename)
+        llm, timings = self.loader.load(
+            spec.name,
+            spec.repo_id,
+            spec.filename,
+            expected_sha256=spec.sha256,
+            tune=tune,
+            **llama_kwargs
+        )
+        max_queue_wait_s = float(os.getenv("MAX_QUEUE_WAIT_S", "0"))
+        return LoadedModel(
+            spec,
+            llm,
+            load_time_s=timings.total,
+            startup_phases=timings.as_dict(),
+            batching_mode=batching_mode,
+            n_parallel=int(os.getenv("N_PARALLEL", "8")),
+            max_queue_size=int(os.getenv("MAX_QUEUE_SIZE", "32")),
+            max_queue_wait_s=max_queue_wait_s or None,
+            # Per loaded model, and counted against MODEL_RAM_BUDGET_GB
+            prefix_cache_mb=int(os.getenv("PREFIX_CACHE_MB", "512")),
+            prefix_cache_min_tokens=int(os.getenv("PREFIX_CACHE_MIN_TOKENS", "32"))
+        )
+
+    def sampling_kwargs(self, body: dict) -> dict:
+        # An explicit null means "no preference"; the batching engine needs a number
+        max_tokens = body.get("max_tokens")
+        kwargs = {"max_tokens": 32 if max_tokens is None else max_tokens}
+        for key in ("temperature", "top_p", "top_k", "seed", "stop"):
+            if body.get(key) is not None:
+                kwargs[key] = body[key]
+        return kwargs
+
+    def overloaded_response(self, error: QueueFullError) -> JSONResponse:
+        logger.warning(f"Rejecting request: {str(error)}")
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "1"},
+            content={"error": str(error)}
+        )
+
+    def sse_chunk(self, completion_id: str, created: int, model: str, delta: dict, finish_reason=None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }]
+        }
+        return "data: " + json.dumps(chunk) + "\n\n"
+
+    def stream_cleanup(self, model: LoadedModel, token_stream):
+        """Return a coroutine function that stops generation and releases the model, once.
+
+        The stream calls it when it ends and the response runs it as a background
+        task, which also covers a body that is never iterated.
+        """
+        done = False
+
+        async def cleanup():
+            nonlocal done
+            if done:
+                return
+            done = True
+            try:
+                # Stops llama.cpp's decode loop on the inference thread at the next token.
+                await token_stream.aclose()
+            finally:
+                model.release()
+
+        return cleanup
+
+    async def stream_llama(self, request: Request, model: LoadedModel, token_stream, cleanup):
+        completion_id = "chatcmpl-" + os.urandom(12).hex()
+        created = int(time.time())
+        finish_reason = "stop"
+        try:
+            yield self.sse_chunk(completion_id, created, model.name, {"role": "assistant"})
+            async for output in token_stream:
+                if await request.is_disconnected():
+                    logger.warning(f"Client disconnected, stopping generation for {completion_id}")
+                    return
+                choice = output["choices"][0]
+                if choice["text"]:
+                    yield self.sse_chunk(completion_id, created, model.name, {"content": choice["text"]})
+                if choice.get("finish_reason"):
+                    finish_reason = choice["finish_reason"]
+
+            yield self.sse_chunk(completion_id, created, model.name, {}, finish_reason)
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            logger.error(f"Error: {str(e)}")
+            yield "data: " + json.dumps({"error": str(e)}) + "\n\n"
+        finally:
+            await cleanup()
+
     @app.post("/v1/chat/completions")
     async def call_llama(self, request: Request):
+        model = None
         try:
             body = await request.json()
 
             # Get the messages array from the body
             messages = body.get("messages", [])
+            if not messages:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": "messages are required"}
+                )
 
-            # Get the content from the last user message
-            prompt = ""
-            if messages:
-                for message in messages:
-                    if message.get("role") == "user":
-                        prompt = message.get("content", "")
-                        break
-        
-            
-            if not prompt:
+            try:
+                grammar = self.grammars.get(body.get("response_format"))
+            except ValueError as e:
                 return JSONResponse(
                     status_code=400,
-                    content={"error": "prompt is required"}
+                    content={"error": str(e)}
                 )
 
-            output = self.llm(
-                "Q: " + prompt + " A: ",
-                max_tokens=body.get("max_tokens", 32)
-            )        
-            
+            model = await self.registry.acquire(body.get("model"))
+
+            # Render system prompt and history through the model's chat template
+            prompt_tokens, template_stop = model.chat_template.render(messages)
+            sampling = self.sampling_kwargs(body)
+            request_stop = sampling.get("stop") or []
+            if isinstance(request_stop, str):
+                request_stop = [request_stop]
+            sampling["stop"] = request_stop + template_stop
+            if grammar is not None:
+                sampling["grammar"] = grammar
+
+            if body.get("stream", False):
+                token_stream = model.generate(prompt_tokens, sampling, stream=True)
+                cleanup = self.stream_cleanup(model, token_stream)
+                response = StreamingResponse(
+                    self.stream_llama(request, model, token_stream, cleanup),
+                    media_type="text/event-stream",
+                    background=BackgroundTask(cleanup)
+                )
+                # The stream or the background task releases the model.
+                model = None
+                return response
+
+            output = await model.generate(prompt_tokens, sampling, stream=False)
+            choice = output["choices"][0]
+            completion_tokens = output["usage"]["completion_tokens"]
+
             return JSONResponse(content={
-                "id": "cmpl-" + os.urandom(12).hex(),
-                "object": "text_completion",
+                "id": "chatcmpl-" + os.urandom(12).hex(),
+                "object": "chat.completion",
                 "created": int(time.time()),
-                "model": self.model_id,
+                "model": model.name,
                 "choices": [{
-                    "text": output["choices"][0]["text"],
                     "index": 0,
-                    "finish_reason": "stop"
+                    "message": {"role": "assistant", "content": choice["text"]},
+                    "text": choice["text"],
+                    "finish_reason": choice["finish_reason"] or "stop"
                 }],
                 "usage": {
-                    "prompt_tokens": len(prompt.split()),
-                    "completion_tokens": len(output["choices"][0]["text"].split()),
-                    "total_tokens": len(prompt.split()) + len(output["choices"][0]["text"].split())
+                    "prompt_tokens": len(prompt_tokens),
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": len(prompt_tokens) + completion_tokens
                 }
             })
 
-            
+        except ModelNotFoundError as e:
+            return JSONResponse(
+                status_code=404,
+                content={"error": f"model {e.args[0]} is not served by this deployment"}
+            )
+        except QueueFullError as e:
+            return self.overloaded_response(e)
+        except ValueError as e:
+            # Prompt and max_tokens do not fit the model's context
+            return JSONResponse(
+                status_code=400,
+                content={"error": str(e)}
+            )
         except Exception as e:
             logger.error(f"Error: {str(e)}")
             return JSONResponse(
                 status_code=500,
                 content={"error": str(e)}
             )
+        finally:
+            if model is not None:
+                model.release()
+
+    @app.get("/v1/models")
+    async def list_models(self):
+        return {
+            "object": "list",
+            "data": [{"id": name, "object": "model", "owned_by": "llamacpp"} for name in self.registry.specs]
+        }
+
+    @app.get("/health")
+    async def health_check(self):
+        return {
+            "status": "healthy",
+            "cpu": {
+                "topology": self.topology.as_dict(),
+                "n_threads": self.n_threads,
+                "thread_profiles": self.tuner.profiles if self.tuner else None
+            },
+            "models": self.registry.stats()
+        }
 
 
 # Get host CPU count
 host_cpu_count = multiprocessing.cpu_count()
 
-model = LLamaCPPDeployment.bind("host_cpu_count")
\ No newline at end of file
+model = LLamaCPPDeployment.bind(str(host_cpu_count))
\ No newline at end of file
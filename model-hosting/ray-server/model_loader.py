@@ -0,0 +1,217 @@
+import fcntl
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from huggingface_hub import HfApi, hf_hub_download
+from llama_cpp import Llama
+from ray.serve import metrics
+
+logger = logging.getLogger("ray.serve")
+
+READ_CHUNK_BYTES = 16 << 20
+
+
+class StartupTimings:
+    """Wall-clock seconds spent in each startup phase, in the order they ran."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def as_dict(self) -> dict:
+        return {name: round(seconds, 3) for name, seconds in self.phases.items()}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prefault(path: str) -> int:
+    """Pull a file into the page cache so llama.cpp's mmap only takes minor faults.
+
+    Readahead is requested up front and the file is then read sequentially,
+    which is far faster than the random faults of the first decode.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        buffer = bytearray(READ_CHUNK_BYTES)
+        total = 0
+        with os.fdopen(os.dup(fd), "rb", buffering=0) as f:
+            while n := f.readinto(buffer):
+                total += n
+        return total
+    finally:
+        os.close(fd)
+
+
+class GGUFLoader:
+    """Loads GGUF models from a node-local or PVC cache before falling back to the hub.
+
+    Models live under cache_dir/<repo_id>/<file> next to a <file>.sha256
+    sidecar recording the digest, size and mtime seen when the file was
+    verified. A file whose size and mtime still match its sidecar is trusted
+    without touching the network; verify="full" re-hashes it on every load.
+    An expected sha256 (MODEL_SHA256 or the registry entry) must match or the
+    file is downloaded again. Replicas sharing a cache serialize downloads with
+    a lock file so only one of them fetches a given model.
+    """
+
+    def __init__(self, cache_dir: str = None, verify: str = "size", warmup: bool = True, prefault: bool = True):
+        self.cache_dir = cache_dir
+        self.verify = verify
+        self.warmup = warmup
+        self.prefault = prefault
+        self.last_timings = {}
+
+        self._phase_seconds = metrics.Histogram(
+            "llama_startup_phase_seconds",
+            description="Time spent in each model startup phase.",
+            boundaries=[0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300],
+            tag_keys=("model", "phase"),
+        )
+        self._cache_lookups = metrics.Counter(
+            "llama_model_cache_lookups_total",
+            description="Local GGUF cache lookups by result.",
+            tag_keys=("model", "result"),
+        )
+
+    def model_dir(self, repo_id: str) -> str:
+        return os.path.join(self.cache_dir, repo_id.replace("/", "--"))
+
+    @staticmethod
+    def _match(names, pattern: str, repo_id: str) -> str:
+        matches = sorted(name for name in names if fnmatch.fnmatch(name, pattern))
+        if len(matches) > 1:
+            raise ValueError(f"Multiple files in {repo_id} match {pattern}: {matches}")
+        return matches[0] if matches else None
+
+    def _read_sidecar(self, path: str) -> dict:
+        try:
+            with open(path + ".sha256") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_sidecar(self, path: str, sha256: str) -> None:
+        stat = os.stat(path)
+        tmp = path + ".sha256.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime}, f)
+        os.replace(tmp, path + ".sha256")
+
+    def _verified(self, path: str, expected_sha256: str = None) -> bool:
+        """Check a cached file against its sidecar, writing one for pre-seeded files."""
+        sidecar = self._read_sidecar(path)
+        stat = os.stat(path)
+        fresh = sidecar is not None and sidecar.get("size") == stat.st_size and sidecar.get("mtime") == stat.st_mtime
+        sha256 = sidecar["sha256"] if fresh and self.verify != "full" else file_sha256(path)
+        if sidecar is not None and sha256 != sidecar.get("sha256"):
+            logger.warning(f"{path} changed since it was last verified")
+            return False
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            logger.warning(f"{path} sha256 {sha256} does not match expected {expected_sha256}")
+            return False
+        if not fresh:
+            self._write_sidecar(path, sha256)
+        return True
+
+    def _cached_path(self, repo_id: str, pattern: str, expected_sha256: str = None) -> str:
+        model_dir = self.model_dir(repo_id)
+        if not os.path.isdir(model_dir):
+            return None
+        names = [name for name in os.listdir(model_dir) if not name.endswith((".sha256", ".tmp"))]
+        filename = self._match(names, pattern, repo_id)
+        if filename is None:
+            return None
+        path = os.path.join(model_dir, filename)
+        if self._verified(path, expected_sha256):
+            return path
+        for stale in (path, path + ".sha256"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        return None
+
+    def _remote_filename(self, repo_id: str, pattern: str) -> str:
+        filename = self._match(HfApi().list_repo_files(repo_id), pattern, repo_id)
+        if filename is None:
+            raise FileNotFoundError(f"No file in {repo_id} matches {pattern}")
+        return filename
+
+    def _download(self, repo_id: str, pattern: str, expected_sha256: str = None) -> str:
+        filename = self._remote_filename(repo_id, pattern)
+        path = hf_hub_download(repo_id=repo_id, filename=filename, local_dir=self.model_dir(repo_id))
+        sha256 = file_sha256(path)
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            os.remove(path)
+            raise ValueError(f"Downloaded {repo_id}/{filename} has sha256 {sha256}, expected {expected_sha256}")
+        self._write_sidecar(path, sha256)
+        return path
+
+    def resolve(self, name: str, repo_id: str, pattern: str, expected_sha256: str = None) -> str:
+        """Return a local path for the model, downloading it only on a cache miss."""
+        if not self.cache_dir:
+            return hf_hub_download(repo_id=repo_id, filename=self._remote_filename(repo_id, pattern))
+
+        model_dir = self.model_dir(repo_id)
+        os.makedirs(model_dir, exist_ok=True)
+        with open(os.path.join(model_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path = self._cached_path(repo_id, pattern, expected_sha256)
+            if path is not None:
+                self._cache_lookups.inc(tags={"model": name, "result": "hit"})
+                return path
+            self._cache_lookups.inc(tags={"model": name, "result": "miss"})
+            logger.info(f"{repo_id}/{pattern} not in {self.cache_dir}, downloading")
+            return self._download(repo_id, pattern, expected_sha256)
+
+    def load(self, name: str, repo_id: str, pattern: str, expected_sha256: str = None, tune=None,
+             **llama_kwargs) -> tuple:
+        """Resolve, pre-fault, load and warm up a model; returns (llm, StartupTimings).
+
+        tune(llm), when given, runs after loading and before the warmup decode.
+        """
+        timings = StartupTimings()
+        with timings.phase("resolve"):
+            path = self.resolve(name, repo_id, pattern, expected_sha256)
+        if self.prefault:
+            with timings.phase("prefault"):
+                prefault(path)
+        with timings.phase("load"):
+            llm = Llama(model_path=path, use_mmap=True, **llama_kwargs)
+        if tune is not None:
+            with timings.phase("autotune"):
+                tune(llm)
+        if self.warmup:
+            # One decode allocates the compute graph and touches every weight page,
+            # so the first real request does not pay for either.
+            with timings.phase("warmup"):
+                llm.create_completion("Hello", max_tokens=1, temperature=0)
+                llm.reset()
+
+        for phase, seconds in timings.phases.items():
+            self._phase_seconds.observe(seconds, tags={"model": name, "phase": phase})
+        self.last_timings = timings.as_dict()
+        logger.info(f"Model {name} ready in {timings.total:.1f}s: {self.last_timings}")
+        return llm, timings
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+
+from llama_cpp import Llama
+from ray.serve import metrics
+
+from batching_engine import ContinuousBatchingEngine
+from chat_template import ChatTemplate
+from inference_executor import InferenceExecutor
+from prefix_cache import PrefixCache
+
+logger = logging.getLogger("ray.serve")
+
+
+class ModelNotFoundError(KeyError):
+    """Raised when a request names a model that is not in the registry."""
+
+
+class ModelSpec:
+    """Where to find one GGUF model and how big a context to give it."""
+
+    def __init__(self, name: str, repo_id: str, filename: str, n_ctx: int, sha256: str = None):
+        self.name = name
+        self.repo_id = repo_id
+        self.filename = filename
+        self.n_ctx = n_ctx
+        self.sha256 = sha256
+
+    @classmethod
+    def from_env(cls, default_name: str, default_repo_id: str, default_filename: str, default_n_ctx: int) -> dict:
+        """Read MODEL_REGISTRY, a JSON object of name -> {repo_id, filename, n_ctx, sha256}.
+
+        Without it the registry holds only the MODEL_ID/MODEL_FILENAME model,
+        checked against MODEL_SHA256 when set.
+        """
+        raw = os.getenv("MODEL_REGISTRY")
+        if not raw:
+            return {default_name: cls(default_name, default_repo_id, default_filename, default_n_ctx,
+                                      sha256=os.getenv("MODEL_SHA256"))}
+        return {
+            name: cls(name, entry["repo_id"], entry["filename"], int(entry.get("n_ctx", default_n_ctx)),
+                      sha256=entry.get("sha256"))
+            for name, entry in json.loads(raw).items()
+        }
+
+
+class LoadedModel:
+    """A resident model with its chat template, prefix cache and inference runner."""
+
+    def __init__(self, spec: ModelSpec, llm: Llama, load_time_s: float, batching_mode: str = "sequential",
+                 n_parallel: int = 8, max_queue_size: int = 32, max_queue_wait_s: float = None,
+                 prefix_cache_mb: int = 512, prefix_cache_min_tokens: int = 32, startup_phases: dict = None):
+        self.spec = spec
+        self.name = spec.name
+        self.llm = llm
+        self.load_time_s = load_time_s
+        self.startup_phases = startup_phases or {}
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self.size_bytes = os.path.getsize(llm.model_path)
+
+        self.chat_template = ChatTemplate(llm)
+        # Snapshot KV state per prompt prefix so repeated agent system prompts skip prefill.
+        # Only the sequential path restores snapshots into llm; continuous mode keeps
+        # prefixes in its per-sequence KV cells instead, so it gets no cache to budget.
+        self.prefix_cache = None
+        if prefix_cache_mb > 0 and batching_mode != "continuous":
+            self.prefix_cache = PrefixCache(
+                capacity_bytes=prefix_cache_mb << 20,
+                min_prefix_tokens=prefix_cache_min_tokens,
+                model=self.name
+            )
+            self.prefix_cache.attach(llm)
+        # The registry's RAM budget covers the weights plus the prefix cache's full capacity.
+        self.memory_bytes = self.size_bytes + (self.prefix_cache.capacity_bytes if self.prefix_cache else 0)
+        # llama.cpp contexts are not thread-safe: every call into llm runs on the
+        # executor's inference thread, and overload is rejected instead of queued forever.
+        self.executor = InferenceExecutor(
+            max_queue_size=max_queue_size,
+            max_queue_wait_s=max_queue_wait_s,
+            name=f"llama-inference-{self.name}",
+            model=self.name
+        )
+        # Continuous mode decodes up to n_parallel requests together, each with its
+        # own n_ctx-sized KV sequence.
+        self.engine = None
+        if batching_mode == "continuous":
+            self.engine = ContinuousBatchingEngine(
+                llm,
+                n_parallel=n_parallel,
+                n_ctx_per_seq=spec.n_ctx,
+                max_queue_size=max_queue_size,
+                name=f"llama-batching-{self.name}",
+                model=self.name
+            )
+
+    def generate(self, prompt, sampling: dict, stream: bool):
+        """Route a completion to the batching engine or the sequential executor.
+
+        Returns an async iterator of chunks when streaming, otherwise an awaitable
+        completion; both raise QueueFullError when the model is saturated.
+        """
+        if self.engine is not None:
+            if stream:
+                return self.engine.submit_stream(prompt, **sampling)
+            return self.engine.submit(prompt, **sampling)
+
+        completion = partial(self.llm, prompt, stream=stream, **sampling)
+        if stream:
+            return self.executor.submit_stream(completion)
+        return self.executor.submit(completion)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        """Stop the runner threads and free the context; blocks until they exit."""
+        if self.engine is not None:
+            self.engine.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+        self.llm.close()
+
+    def stats(self) -> dict:
+        runner = self.engine or self.executor
+        return {
+            "repo_id": self.spec.repo_id,
+            "filename": self.spec.filename,
+            "size_bytes": self.size_bytes,
+            "memory_bytes": self.memory_bytes,
+            "load_time_s": round(self.load_time_s, 3),
+            "startup_phases": self.startup_phases,
+            "resident_s": round(time.time() - self.loaded_at, 1),
+            "in_flight": self.in_flight,
+            "executor": runner.stats(),
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+            "speculative": self.llm.draft_model.stats() if hasattr(self.llm.draft_model, "stats") else None,
+        }
+
+
+class ModelRegistry:
+    """Routes requests to models by name, loading them on first use.
+
+    Models are loaded off the event loop with mmap'd weights. When loading one
+    would push resident bytes (GGUF weights plus prefix cache capacity) over
+    ram_budget_bytes, idle models are unloaded least-recently-used first;
+    models with requests in flight are never unloaded.
+    """
+
+    def __init__(self, specs: dict, default_model: str, load_model, ram_budget_bytes: int = 0):
+        """load_model(spec) -> LoadedModel runs on a worker thread."""
+        self.specs = specs
+        self.default_model = default_model
+        self.ram_budget_bytes = ram_budget_bytes
+        self._load_model = load_model
+        self._loaded: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._load_locks = {name: asyncio.Lock() for name in specs}
+        self._unloads = 0
+
+        self._load_seconds = metrics.Histogram(
+            "llama_model_load_seconds",
+            description="Time to load a model into the replica.",
+            boundaries=[0.5, 1, 2, 5, 10, 30, 60, 120, 300],
+            tag_keys=("model",),
+        )
+        self._resident = metrics.Gauge(
+            "llama_model_resident",
+            description="1 while a model is loaded in the replica, 0 otherwise.",
+            tag_keys=("model",),
+        )
+        self._resident_bytes = metrics.Gauge(
+            "llama_model_resident_bytes",
+            description="GGUF and prefix cache bytes of all models loaded in the replica.",
+        )
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(model.memory_bytes for model in self._loaded.values())
+
+    async def acquire(self, name: str = None) -> LoadedModel:
+        """Return the named model, loading it if needed, with one request leased.
+
+        The caller must call release() on the returned model when done. A
+        single-model registry serves every request whatever model it names,
+        which keeps clients that send gateway aliases working.
+        """
+        name = name or self.default_model
+        if name not in self.specs:
+            if len(self.specs) > 1:
+                raise ModelNotFoundError(name)
+            name = self.default_model
+
+        async with self._load_locks[name]:
+            model = self._loaded.get(name)
+            if model is None:
+                model = await self._load(self.specs[name])
+            model.in_flight += 1
+            model.last_used = time.monotonic()
+            self._loaded.move_to_end(name)
+        return model
+
+    def preload(self, model: LoadedModel) -> None:
+        """Register a model that was loaded synchronously, e.g. in __init__."""
+        self._loaded[model.name] = model
+        self._load_seconds.observe(model.load_time_s, tags={"model": model.name})
+        self._resident.set(1, tags={"model": model.name})
+        self._resident_bytes.set(self.resident_bytes)
+
+    async def _load(self, spec: ModelSpec) -> LoadedModel:
+        estimated_bytes = max((m.memory_bytes for m in self._loaded.values()), default=0)
+        await self._evict_for(estimated_bytes)
+
+        logger.info(f"Loading model {spec.name} from {spec.repo_id}/{spec.filename}")
+        model = await asyncio.to_thread(self._load_model, spec)
+        self.preload(model)
+        logger.info(f"Model {spec.name} loaded in {model.load_time_s:.1f}s ({model.size_bytes >> 20} MiB)")
+
+        # The estimate above may have been low; re-check now the real size is known.
+        await self._evict_for(0, keep=spec.name)
+        return model
+
+    async def _evict_for(self, incoming_bytes: int, keep: str = None) -> None:
+        if not self.ram_budget_bytes:
+            return
+        for name, model in list(self._loaded.items()):
+            if self.resident_bytes + incoming_bytes <= self.ram_budget_bytes:
+                return
+            if model.in_flight > 0 or name == keep:
+                continue
+            logger.info(f"Unloading idle model {name} to stay within the RAM budget")
+            del self._loaded[name]
+            await asyncio.to_thread(model.close)
+            self._unloads += 1
+            self._resident.set(0, tags={"model": name})
+            self._resident_bytes.set(self.resident_bytes)
+        if self.resident_bytes + incoming_bytes > self.ram_budget_bytes:
+            logger.warning(f"RAM budget exceeded: {self.resident_bytes >> 20} MiB resident, all models busy")
+
+    def stats(self) -> dict:
+        return {
+            "default_model": self.default_model,
+            "available": list(self.specs),
+            "ram_budget_bytes": self.ram_budget_bytes,
+            "resident_bytes": self.resident_bytes,
+            "unloads": self._unloads,
+            "loaded": {name: model.stats() for name, model in self._loaded.items()},
+        }
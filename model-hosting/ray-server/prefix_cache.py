@@ -0,0 +1,137 @@
+import logging
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from llama_cpp import Llama
+from llama_cpp.llama_cache import BaseLlamaCache
+from llama_cpp.llama import LlamaState
+from ray.serve import metrics
+
+logger = logging.getLogger("ray.serve")
+
+
+class PrefixCache(BaseLlamaCache):
+    """LRU cache of llama.cpp KV snapshots looked up by longest token prefix.
+
+    Llama._create_completion consults the cache before prefill and stores a
+    save_state() snapshot after every completion. A lookup returns the snapshot
+    sharing the longest prefix with the new prompt; Llama restores it only when
+    that prefix is longer than what its context already holds, then evaluates
+    just the tokens after it, so a repeated system prompt is not prefilled
+    again. Hits and reused tokens are counted when a snapshot is actually
+    restored (see attach); lookups the live context already covered count as
+    "resident". Snapshots are evicted least-recently-used once their total
+    size exceeds capacity_bytes.
+    """
+
+    def __init__(self, capacity_bytes: int, min_prefix_tokens: int = 32, model: str = ""):
+        super().__init__(capacity_bytes)
+        self.min_prefix_tokens = min_prefix_tokens
+        self.cache_state: "OrderedDict[Tuple[int, ...], LlamaState]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.resident = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        # Snapshot handed out by the last lookup and its prefix length, until Llama restores it or moves on.
+        self._pending: Optional[Tuple[LlamaState, int]] = None
+
+        self._lookups = metrics.Counter(
+            "llama_prefix_cache_lookups_total",
+            description="Prefix cache lookups by result.",
+            tag_keys=("model", "result"),
+        )
+        self._reused = metrics.Counter(
+            "llama_prefix_cache_reused_tokens_total",
+            description="Prompt tokens whose prefill was skipped via the prefix cache.",
+            tag_keys=("model",),
+        )
+        self._bytes = metrics.Gauge(
+            "llama_prefix_cache_bytes",
+            description="Bytes of KV state held by the prefix cache.",
+            tag_keys=("model",),
+        )
+        for metric in (self._lookups, self._reused, self._bytes):
+            metric.set_default_tags({"model": model})
+
+    def attach(self, llm: Llama) -> None:
+        """Install the cache on llm and count hits when llm restores one of its snapshots."""
+        llm.set_cache(self)
+        load_state = llm.load_state
+
+        def restore(state: LlamaState) -> None:
+            load_state(state)
+            pending, self._pending = self._pending, None
+            if pending is not None and pending[0] is state:
+                self._record_hit(pending[1])
+
+        llm.load_state = restore
+
+    def _record_hit(self, prefix_len: int) -> None:
+        self.hits += 1
+        self.reused_tokens += prefix_len
+        self._lookups.inc(tags={"result": "hit"})
+        self._reused.inc(prefix_len)
+
+    def _settle_pending(self) -> None:
+        # The previous lookup's snapshot was never restored: the context already held that prefix.
+        if self._pending is not None:
+            self._pending = None
+            self.resident += 1
+            self._lookups.inc(tags={"result": "resident"})
+
+    @property
+    def cache_size(self) -> int:
+        return self._size
+
+    def _longest_prefix(self, key: Tuple[int, ...]) -> Tuple[Optional[Tuple[int, ...]], int]:
+        best_key, best_len = None, 0
+        for cached_key in self.cache_state:
+            prefix_len = Llama.longest_token_prefix(cached_key, key)
+            if prefix_len > best_len:
+                best_key, best_len = cached_key, prefix_len
+        return best_key, best_len
+
+    def __getitem__(self, key: Sequence[int]) -> LlamaState:
+        self._settle_pending()
+        key = tuple(key)
+        best_key, best_len = self._longest_prefix(key)
+        if best_key is None or best_len < self.min_prefix_tokens:
+            self.misses += 1
+            self._lookups.inc(tags={"result": "miss"})
+            raise KeyError("No cached prefix")
+        self.cache_state.move_to_end(best_key)
+        state = self.cache_state[best_key]
+        self._pending = (state, best_len)
+        return state
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        return self._longest_prefix(tuple(key))[1] >= self.min_prefix_tokens
+
+    def __setitem__(self, key: Sequence[int], value: LlamaState) -> None:
+        self._settle_pending()
+        key = tuple(key)
+        if key in self.cache_state:
+            self._size -= self.cache_state.pop(key).llama_state_size
+        self.cache_state[key] = value
+        self._size += value.llama_state_size
+        while self._size > self.capacity_bytes and self.cache_state:
+            _, evicted = self.cache_state.popitem(last=False)
+            self._size -= evicted.llama_state_size
+            self.evictions += 1
+        self._bytes.set(self._size)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.resident
+        return {
+            "entries": len(self.cache_state),
+            "bytes": self._size,
+            "capacity_bytes": self.capacity_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "resident": self.resident,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "reused_tokens": self.reused_tokens,
+        }
@@ -0,0 +1,81 @@
+import logging
+
+import numpy as np
+import numpy.typing as npt
+from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+from ray.serve import metrics
+
+logger = logging.getLogger("ray.serve")
+
+
+class MeteredPromptLookupDecoding(LlamaPromptLookupDecoding):
+    """Prompt lookup decoding that measures how many drafted tokens are accepted.
+
+    Llama.generate calls the draft model once per decode round with the whole
+    sequence so far. When it verifies k drafted tokens and keeps j of them,
+    the next call's sequence is j + 1 tokens longer (the accepted drafts plus
+    the token sampled after them), so acceptance is read from the growth of
+    consecutive calls. A call that does not continue the previous sequence
+    starts a new request and is not counted.
+    """
+
+    def __init__(self, max_ngram_size: int = 2, num_pred_tokens: int = 10, model: str = ""):
+        super().__init__(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+        self.rounds = 0
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        self._last_len = 0
+        self._last_token = None
+        self._last_drafted = 0
+
+        self._draft = metrics.Counter(
+            "llama_spec_decode_draft_tokens_total",
+            description="Tokens proposed by prompt lookup decoding.",
+            tag_keys=("model",),
+        )
+        self._accepted = metrics.Counter(
+            "llama_spec_decode_accepted_tokens_total",
+            description="Prompt lookup draft tokens accepted by the model.",
+            tag_keys=("model",),
+        )
+        self._acceptance_rate = metrics.Gauge(
+            "llama_spec_decode_acceptance_rate",
+            description="Fraction of prompt lookup draft tokens accepted by the model.",
+            tag_keys=("model",),
+        )
+        for metric in (self._draft, self._accepted, self._acceptance_rate):
+            metric.set_default_tags({"model": model})
+
+    def _settle_previous_round(self, input_ids: npt.NDArray[np.intc]) -> None:
+        if not self._last_drafted:
+            return
+        grown = len(input_ids) - self._last_len
+        continues = 0 < grown <= self._last_drafted + 1 and input_ids[self._last_len - 1] == self._last_token
+        if not continues:
+            return
+        self.draft_tokens += self._last_drafted
+        self._draft.inc(self._last_drafted)
+        accepted = grown - 1
+        if accepted:
+            self.accepted_tokens += accepted
+            self._accepted.inc(accepted)
+        self._acceptance_rate.set(self.accepted_tokens / self.draft_tokens)
+
+    def __call__(self, input_ids: npt.NDArray[np.intc], /, **kwargs) -> npt.NDArray[np.intc]:
+        self._settle_previous_round(input_ids)
+        draft = super().__call__(input_ids, **kwargs)
+        self.rounds += 1
+        self._last_len = len(input_ids)
+        self._last_token = input_ids[-1]
+        self._last_drafted = len(draft)
+        return draft
+
+    def stats(self) -> dict:
+        return {
+            "max_ngram_size": self.max_ngram_size,
+            "num_pred_tokens": self.num_pred_tokens,
+            "rounds": self.rounds,
+            "draft_tokens": self.draft_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "acceptance_rate": round(self.accepted_tokens / self.draft_tokens, 4) if self.draft_tokens else 0.0,
+        }
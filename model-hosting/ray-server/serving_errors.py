@@ -0,0 +1,2 @@
+class QueueFullError(Exception):
+    """Raised when a deployment is at capacity and a request is rejected."""
@@ -0,0 +1,58 @@
+import json
+import logging
+from collections import OrderedDict
+
+from llama_cpp.llama_grammar import JSON_GBNF, LlamaGrammar
+
+logger = logging.getLogger("ray.serve")
+
+
+class GrammarCache:
+    """Compiles OpenAI `response_format` values into llama.cpp grammars.
+
+    {"type": "json_object"} uses the generic JSON grammar and
+    {"type": "json_schema", "json_schema": {"schema": ...}} is converted to
+    GBNF once per distinct schema; agents send the same few schemas on every
+    call, so conversions are kept in a small LRU keyed by the canonical schema.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._json_object = None
+        self._schemas: "OrderedDict[str, LlamaGrammar]" = OrderedDict()
+
+    def get(self, response_format) -> LlamaGrammar:
+        """Return the grammar for a response_format, or None for plain text.
+
+        Raises ValueError for unsupported or malformed formats.
+        """
+        if not response_format:
+            return None
+        if not isinstance(response_format, dict):
+            raise ValueError("response_format must be an object")
+        kind = response_format.get("type", "text")
+        if kind == "text":
+            return None
+        if kind == "json_object":
+            if self._json_object is None:
+                self._json_object = LlamaGrammar.from_string(JSON_GBNF, verbose=False)
+            return self._json_object
+        if kind != "json_schema":
+            raise ValueError(f"Unsupported response_format type {kind}")
+
+        schema = (response_format.get("json_schema") or {}).get("schema")
+        if not isinstance(schema, dict):
+            raise ValueError("response_format.json_schema.schema must be a JSON schema object")
+        key = json.dumps(schema, sort_keys=True)
+        grammar = self._schemas.get(key)
+        if grammar is None:
+            try:
+                grammar = LlamaGrammar.from_json_schema(json.dumps(schema), verbose=False)
+            except Exception as e:
+                raise ValueError(f"Invalid JSON schema: {str(e)}") from e
+            self._schemas[key] = grammar
+            if len(self._schemas) > self.max_entries:
+                self._schemas.popitem(last=False)
+        else:
+            self._schemas.move_to_end(key)
+        return grammar
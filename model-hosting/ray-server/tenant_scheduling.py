@@ -0,0 +1,321 @@
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import time
+
+from ray.serve import metrics
+
+from serving_errors import QueueFullError
+
+logger = logging.getLogger("ray.serve")
+
+PRIORITIES = ("interactive", "standard", "batch")
+
+
+class RateLimitedError(QueueFullError):
+    """Raised when a tenant has used up its token rate; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TenantPolicy:
+    def __init__(self, name: str, weight: float = 1.0, priority: str = "standard", max_concurrency: int = None,
+                 tokens_per_minute: int = None, api_keys=()):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority} for tenant {name}, expected one of {PRIORITIES}")
+        self.name = name
+        self.weight = weight
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.api_keys = list(api_keys)
+
+
+class TokenBucket:
+    """Tokens refill continuously at tokens_per_minute up to one minute's worth."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: int) -> float:
+        """Charge cost and return 0, or return the seconds until it could be charged.
+
+        A request larger than the whole bucket only needs a full bucket.
+        """
+        self._refill()
+        needed = min(cost, self.capacity)
+        if self.tokens < needed:
+            return (needed - self.tokens) / self.rate
+        self.tokens -= cost
+        return 0.0
+
+    def refund(self, tokens: int) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class _TenantState:
+    def __init__(self, policy: TenantPolicy):
+        self.policy = policy
+        self.bucket = TokenBucket(policy.tokens_per_minute) if policy.tokens_per_minute else None
+        self.running = 0
+        self.waiting = 0
+        self.last_finish = 0.0
+        self.completed = 0
+
+
+class TenantTicket:
+    """A scheduled request; release() frees its slot and settles its token charge."""
+
+    def __init__(self, scheduler: "TenantScheduler", tenant: _TenantState, priority: str, cost: int,
+                 start_tag: float, seq: int):
+        self.scheduler = scheduler
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.start_tag = start_tag
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.future = None
+        self.released = False
+
+    @property
+    def name(self) -> str:
+        return self.tenant.policy.name
+
+    def release(self, used_tokens: int = None) -> None:
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self, used_tokens)
+
+
+class TenantScheduler:
+    """Orders requests across tenants before they reach the engine.
+
+    A request's tenant comes from its API key (Authorization: Bearer or
+    x-api-key); unknown callers share the "default" tenant. The tenant and
+    priority headers are client-controlled, so they are honoured only with
+    trust_headers, for deployments behind a gateway that authenticates
+    callers and sets them. At most max_inflight requests run at once. Waiting
+    requests are served by strict priority class, then by start-time fair
+    queuing: each request's virtual start tag advances its tenant's clock by
+    cost / weight, so a tenant with weight 4 gets four times the tokens of a
+    weight-1 tenant when both are backlogged. Tenants are capped at
+    max_concurrency running requests, and those with tokens_per_minute are
+    rejected with a Retry-After once their bucket is empty. Costs are
+    estimated as prompt plus max_tokens and refunded down to the real usage.
+    """
+
+    def __init__(self, policies: list, max_inflight: int, max_queue_size: int = 1024,
+                 tenant_header: str = "x-tenant-id", priority_header: str = "x-priority",
+                 trust_headers: bool = False):
+        self.max_inflight = max_inflight
+        self.max_queue_size = max_queue_size
+        self.tenant_header = tenant_header
+        self.priority_header = priority_header
+        self.trust_headers = trust_headers
+        if not any(policy.name == "default" for policy in policies):
+            policies = list(policies) + [TenantPolicy("default")]
+        self.tenants = {policy.name: _TenantState(policy) for policy in policies}
+        self.api_keys = {key: policy.name for policy in policies for key in policy.api_keys}
+        self.running = 0
+        self.vtime = 0.0
+        self._waiting = []
+        self._seq = itertools.count()
+
+        self._latency = metrics.Histogram(
+            "vllm_tenant_request_latency_seconds",
+            description="End-to-end request latency, including queueing, by tenant and priority.",
+            boundaries=[0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300],
+            tag_keys=("tenant", "priority"),
+        )
+        self._queue_wait = metrics.Histogram(
+            "vllm_tenant_queue_wait_seconds",
+            description="Time a request waited for a scheduling slot, by tenant and priority.",
+            boundaries=[0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60],
+            tag_keys=("tenant", "priority"),
+        )
+        self._queue_depth = metrics.Gauge(
+            "vllm_tenant_queue_depth",
+            description="Requests waiting for a scheduling slot, by tenant.",
+            tag_keys=("tenant",),
+        )
+        self._rejections = metrics.Counter(
+            "vllm_tenant_rejected_total",
+            description="Requests rejected by the tenant scheduler, by tenant and reason.",
+            tag_keys=("tenant", "reason"),
+        )
+
+    @classmethod
+    def from_env(cls, max_inflight: int) -> "TenantScheduler":
+        """Read tenant policies from TENANTS_CONFIG (JSON) or the file at TENANTS_CONFIG_FILE.
+
+        The JSON maps tenant name -> {weight, priority, max_concurrency,
+        tokens_per_minute, api_keys}. TRUST_TENANT_HEADERS=1 honours the
+        tenant and priority headers; set it only behind a trusted gateway.
+        """
+        raw = os.getenv("TENANTS_CONFIG")
+        path = os.getenv("TENANTS_CONFIG_FILE")
+        if not raw and path:
+            with open(path) as f:
+                raw = f.read()
+        config = json.loads(raw) if raw else {}
+        policies = [TenantPolicy(name, **entry) for name, entry in config.items()]
+        return cls(
+            policies,
+            max_inflight=int(os.getenv("MAX_INFLIGHT_REQUESTS", str(max_inflight))),
+            max_queue_size=int(os.getenv("TENANT_QUEUE_SIZE", "1024")),
+            tenant_header=os.getenv("TENANT_HEADER", "x-tenant-id"),
+            trust_headers=os.getenv("TRUST_TENANT_HEADERS", "0") == "1",
+        )
+
+    def identify(self, headers) -> tuple:
+        """Return (tenant state, priority) for a request's headers."""
+        api_key = headers.get("x-api-key")
+        authorization = headers.get("authorization", "")
+        if not api_key and authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+        name = self.api_keys.get(api_key)
+        if name is None and self.trust_headers:
+            name = headers.get(self.tenant_header)
+        tenant = self.tenants.get(name) or self.tenants["default"]
+
+        # Callers may lower their priority (e.g. batch jobs) but never raise it above their tenant's.
+        priority = tenant.policy.priority
+        requested = headers.get(self.priority_header) if self.trust_headers else None
+        if requested in PRIORITIES and PRIORITIES.index(requested) > PRIORITIES.index(priority):
+            priority = requested
+        return tenant, priority
+
+    @staticmethod
+    def _has_room(tenant: _TenantState) -> bool:
+        limit = tenant.policy.max_concurrency
+        return limit is None or tenant.running < limit
+
+    def _ticket(self, tenant: _TenantState, priority: str, cost: int) -> TenantTicket:
+        # Start-time fair queuing: the tenant's virtual clock advances by cost / weight.
+        start_tag = max(self.vtime, tenant.last_finish)
+        tenant.last_finish = start_tag + cost / tenant.policy.weight
+        return TenantTicket(self, tenant, priority, cost, start_tag, next(self._seq))
+
+    def _start(self, ticket: TenantTicket) -> None:
+        self.running += 1
+        ticket.tenant.running += 1
+        ticket.started_at = time.monotonic()
+        self.vtime = max(self.vtime, ticket.start_tag)
+        self._queue_wait.observe(ticket.started_at - ticket.enqueued_at,
+                                 tags={"tenant": ticket.name, "priority": ticket.priority})
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_inflight:
+            candidates = [t for t in self._waiting if not t.future.done() and self._has_room(t.tenant)]
+            if not candidates:
+                break
+            ticket = min(candidates, key=lambda t: (PRIORITIES.index(t.priority), t.start_tag, t.seq))
+            self._remove(ticket)
+            self._start(ticket)
+            ticket.future.set_result(ticket)
+
+    def _remove(self, ticket: TenantTicket) -> None:
+        self._waiting.remove(ticket)
+        ticket.tenant.waiting -= 1
+        self._queue_depth.set(ticket.tenant.waiting, tags={"tenant": ticket.name})
+
+    def _reject(self, tenant: _TenantState, reason: str, error: Exception):
+        self._rejections.inc(tags={"tenant": tenant.policy.name, "reason": reason})
+        raise error
+
+    async def acquire(self, headers, cost: int) -> TenantTicket:
+        """Wait for this request's turn; the caller must release() the ticket."""
+        tenant, priority = self.identify(headers)
+        if tenant.bucket is not None:
+            retry_after = tenant.bucket.take(cost)
+            if retry_after:
+                self._reject(tenant, "rate_limit", RateLimitedError(
+                    f"tenant {tenant.policy.name} exceeded {tenant.policy.tokens_per_minute} tokens/minute",
+                    retry_after=retry_after))
+
+        if self._waiting or self.running >= self.max_inflight or not self._has_room(tenant):
+            if len(self._waiting) >= self.max_queue_size:
+                if tenant.bucket is not None:
+                    tenant.bucket.refund(cost)
+                self._reject(tenant, "queue_full", QueueFullError(
+                    f"scheduler queue is full ({self.max_queue_size} requests waiting)"))
+        else:
+            ticket = self._ticket(tenant, priority, cost)
+            self._start(ticket)
+            return ticket
+
+        ticket = self._ticket(tenant, priority, cost)
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._waiting.append(ticket)
+        tenant.waiting += 1
+        self._queue_depth.set(tenant.waiting, tags={"tenant": tenant.policy.name})
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.started_at is not None:
+                ticket.release(0)
+            elif ticket in self._waiting:
+                self._remove(ticket)
+                self._settle(ticket, 0)
+            raise
+        return ticket
+
+    def _settle(self, ticket: TenantTicket, used_tokens: int = None) -> None:
+        if ticket.tenant.bucket is not None and used_tokens is not None and used_tokens < ticket.cost:
+            ticket.tenant.bucket.refund(ticket.cost - used_tokens)
+
+    def _release(self, ticket: TenantTicket, used_tokens: int = None) -> None:
+        self.running -= 1
+        ticket.tenant.running -= 1
+        ticket.tenant.completed += 1
+        self._settle(ticket, used_tokens)
+        self._latency.observe(time.monotonic() - ticket.enqueued_at,
+                              tags={"tenant": ticket.name, "priority": ticket.priority})
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "running": self.running,
+            "waiting": len(self._waiting),
+            "tenants": {
+                name: {
+                    "priority": state.policy.priority,
+                    "weight": state.policy.weight,
+                    "running": state.running,
+                    "waiting": state.waiting,
+                    "completed": state.completed,
+                    "tokens_available": math.floor(state.bucket.tokens) if state.bucket else None,
+                }
+                for name, state in self.tenants.items()
+            },
+        }
+
+
+class RequestLease:
+    """The tenant ticket and KV lease held by one running request."""
+
+    def __init__(self, ticket: TenantTicket, kv_lease):
+        self.ticket = ticket
+        self.kv_lease = kv_lease
+
+    def release(self, used_tokens: int = None) -> None:
+        self.kv_lease.release()
+        self.ticket.release(used_tokens)
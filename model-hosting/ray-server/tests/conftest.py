@@ -0,0 +1,8 @@
+"""Run from model-hosting/ray-server with `python -m pytest tests` (needs pytest and pyyaml
+on top of local-requirements.txt)."""
+
+import os
+import sys
+
+# The deployment modules import each other by bare name, as Ray Serve loads them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,90 @@
+"""DiskEmbeddingTier lives in the embedding service's ConfigMap; it is compiled from there."""
+
+import ast
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+import numpy as np
+import pytest
+import yaml
+
+MANIFEST = os.path.join(os.path.dirname(__file__), "..", "..", "ray-services",
+                        "ray-service-llamacpp-with-embedding.yaml")
+
+
+def load_disk_tier():
+    with open(MANIFEST) as f:
+        source = next(doc["data"]["app.py"] for doc in yaml.safe_load_all(f)
+                      if doc and doc.get("kind") == "ConfigMap")
+    tree = ast.parse(source)
+    cls = next(node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == "DiskEmbeddingTier")
+    namespace = {"fcntl": fcntl, "json": json, "np": np, "os": os, "zlib": zlib,
+                 "logger": logging.getLogger("test")}
+    exec(compile(ast.Module(body=[cls], type_ignores=[]), MANIFEST, "exec"), namespace)
+    return namespace["DiskEmbeddingTier"]
+
+
+DiskEmbeddingTier = load_disk_tier()
+
+
+def key(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+@pytest.fixture
+def tier(tmp_path):
+    return DiskEmbeddingTier(str(tmp_path), "model-a", dim=4, capacity=8)
+
+
+def test_round_trip_and_sharing(tier, tmp_path):
+    vector = np.arange(4, dtype=np.float32)
+    tier.put(key("hello"), vector, 3)
+    found, tokens = tier.get(key("hello"))
+    assert np.array_equal(found, vector) and tokens == 3
+
+    # Another replica on the node maps the same files.
+    other = DiskEmbeddingTier(str(tmp_path), "model-a", dim=4, capacity=8)
+    assert other.get(key("hello"))[1] == 3
+    assert other.get(key("missing")) is None
+
+
+def test_torn_slot_is_a_miss(tier):
+    k = key("hello")
+    tier.put(k, np.ones(4, dtype=np.float32), 3)
+    slot = tier._slot(k)
+    # Another writer's vector landed in the slot while the key still reads as ours.
+    tier.vectors[slot] = np.full(4, 2.0, dtype=np.float32)
+    assert tier.get(k) is None
+    # So did its token count.
+    tier.put(k, np.ones(4, dtype=np.float32), 3)
+    tier.aux[slot, 1] = 7
+    assert tier.get(k) is None
+
+
+def test_checksum_binds_key_vector_and_tokens():
+    vector = np.ones(4, dtype=np.float32)
+    crc = DiskEmbeddingTier._checksum(key("a"), vector, 3)
+    assert crc != DiskEmbeddingTier._checksum(key("b"), vector, 3)
+    assert crc != DiskEmbeddingTier._checksum(key("a"), vector * 2, 3)
+    assert crc != DiskEmbeddingTier._checksum(key("a"), vector, 4)
+
+
+def test_invalidate_clears_entries_and_bumps_generation(tier, tmp_path):
+    tier.put(key("hello"), np.ones(4, dtype=np.float32), 3)
+    other = DiskEmbeddingTier(str(tmp_path), "model-a", dim=4, capacity=8)
+    before = int(other.generation[0])
+
+    tier.invalidate()
+    assert tier.get(key("hello")) is None
+    assert int(other.generation[0]) == before + 1
+
+
+def test_new_fingerprint_recreates_the_files(tier, tmp_path):
+    tier.put(key("hello"), np.ones(4, dtype=np.float32), 3)
+    replaced = DiskEmbeddingTier(str(tmp_path), "model-b", dim=4, capacity=8)
+    assert replaced.get(key("hello")) is None
+    assert json.loads((tmp_path / "meta.json").read_text())["fingerprint"] == "model-b"
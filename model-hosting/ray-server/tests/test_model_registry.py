@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from model_registry import ModelNotFoundError, ModelRegistry, ModelSpec
+
+MIB = 1 << 20
+
+
+class StubModel:
+    """Stands in for LoadedModel: just the fields the registry budgets and evicts by."""
+
+    def __init__(self, spec: ModelSpec, memory_bytes: int):
+        self.name = spec.name
+        self.size_bytes = memory_bytes
+        self.memory_bytes = memory_bytes
+        self.load_time_s = 0.0
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.closed = False
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def make_registry(budget_mib, sizes_mib):
+    specs = {name: ModelSpec(name, "repo", f"{name}.gguf", 2048) for name in sizes_mib}
+    loaded = []
+
+    def load_model(spec):
+        model = StubModel(spec, sizes_mib[spec.name] * MIB)
+        loaded.append(model)
+        return model
+
+    registry = ModelRegistry(specs, default_model=next(iter(specs)), load_model=load_model,
+                             ram_budget_bytes=budget_mib * MIB)
+    return registry, loaded
+
+
+def test_loads_lazily_and_reuses_resident_models():
+    async def run():
+        registry, loaded = make_registry(0, {"a": 100, "b": 100})
+        model = await registry.acquire("a")
+        model.release()
+        again = await registry.acquire("a")
+        again.release()
+        assert again is model
+        assert [m.name for m in loaded] == ["a"]
+
+    asyncio.run(run())
+
+
+def test_unknown_model_is_rejected_only_with_several_models():
+    async def run():
+        single, _ = make_registry(0, {"a": 100})
+        model = await single.acquire("some-gateway-alias")
+        assert model.name == "a"
+        model.release()
+
+        several, _ = make_registry(0, {"a": 100, "b": 100})
+        with pytest.raises(ModelNotFoundError):
+            await several.acquire("c")
+
+    asyncio.run(run())
+
+
+def test_evicts_least_recently_used_idle_model():
+    async def run():
+        registry, loaded = make_registry(250, {"a": 100, "b": 100, "c": 100})
+        for name in ("a", "b", "a"):
+            (await registry.acquire(name)).release()
+
+        (await registry.acquire("c")).release()
+        a, b, c = loaded
+        assert b.closed and not a.closed
+        assert set(registry._loaded) == {"a", "c"}
+        assert registry.resident_bytes == 200 * MIB
+        assert registry._unloads == 1
+
+    asyncio.run(run())
+
+
+def test_models_in_flight_are_never_evicted():
+    async def run():
+        registry, loaded = make_registry(150, {"a": 100, "b": 100, "c": 100})
+        busy = await registry.acquire("a")
+        (await registry.acquire("b")).release()
+        # Over budget, but "a" is serving a request and "b" was just loaded.
+        assert not any(model.closed for model in loaded)
+        assert registry.resident_bytes == 200 * MIB
+
+        # The next load evicts the idle "b" and leaves the busy "a" alone.
+        (await registry.acquire("c")).release()
+        assert loaded[1].closed and not loaded[0].closed
+        assert set(registry._loaded) == {"a", "c"}
+        busy.release()
+
+    asyncio.run(run())
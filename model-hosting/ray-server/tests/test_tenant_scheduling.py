@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from serving_errors import QueueFullError
+from tenant_scheduling import RateLimitedError, TenantPolicy, TenantScheduler, TokenBucket
+
+
+def make_scheduler(max_inflight=1, **kwargs):
+    policies = [
+        TenantPolicy("heavy", weight=4.0, api_keys=["heavy-key"]),
+        TenantPolicy("light", weight=1.0, api_keys=["light-key"]),
+        TenantPolicy("vip", priority="interactive", api_keys=["vip-key"]),
+        TenantPolicy("capped", max_concurrency=1, api_keys=["capped-key"]),
+        TenantPolicy("metered", tokens_per_minute=600, api_keys=["metered-key"]),
+    ]
+    return TenantScheduler(policies, max_inflight=max_inflight, **kwargs)
+
+
+def bearer(key):
+    return {"authorization": f"Bearer {key}"}
+
+
+def test_tenant_comes_from_the_api_key():
+    scheduler = make_scheduler()
+    tenant, priority = scheduler.identify(bearer("vip-key"))
+    assert (tenant.policy.name, priority) == ("vip", "interactive")
+    tenant, _ = scheduler.identify({"x-api-key": "light-key"})
+    assert tenant.policy.name == "light"
+    tenant, _ = scheduler.identify({"authorization": "Bearer unknown"})
+    assert tenant.policy.name == "default"
+
+
+def test_headers_are_ignored_unless_trusted():
+    headers = {"x-tenant-id": "vip", "x-priority": "batch"}
+    tenant, priority = make_scheduler().identify(headers)
+    assert (tenant.policy.name, priority) == ("default", "standard")
+
+    tenant, priority = make_scheduler(trust_headers=True).identify(headers)
+    assert (tenant.policy.name, priority) == ("vip", "batch")
+    # A trusted header may lower the priority but never raise it.
+    _, priority = make_scheduler(trust_headers=True).identify({"x-priority": "interactive"})
+    assert priority == "standard"
+
+
+def test_priority_class_goes_first():
+    async def run():
+        scheduler = make_scheduler()
+        running = await scheduler.acquire(bearer("light-key"), 10)
+        standard = asyncio.ensure_future(scheduler.acquire(bearer("light-key"), 10))
+        interactive = asyncio.ensure_future(scheduler.acquire(bearer("vip-key"), 10))
+        await asyncio.sleep(0)
+
+        running.release()
+        await asyncio.sleep(0)
+        assert interactive.done() and not standard.done()
+        interactive.result().release()
+        (await asyncio.wait_for(standard, 1)).release()
+
+    asyncio.run(run())
+
+
+def test_backlogged_tenants_share_by_weight():
+    async def run():
+        scheduler = make_scheduler()
+        blocker = await scheduler.acquire(bearer("light-key"), 100)
+        order = []
+
+        async def request(key):
+            ticket = await scheduler.acquire(bearer(key), 100)
+            order.append(ticket.name)
+            await asyncio.sleep(0)
+            ticket.release()
+
+        tasks = [asyncio.ensure_future(request(key)) for key in ["heavy-key"] * 8 + ["light-key"] * 2]
+        await asyncio.sleep(0)
+        blocker.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        # Start tags advance by cost / weight: heavy 0, 25, ..., 175; light 100 and 200 after the
+        # blocker. Ties go to the earlier request.
+        assert order == ["heavy"] * 5 + ["light"] + ["heavy"] * 3 + ["light"]
+
+    asyncio.run(run())
+
+
+def test_max_concurrency_holds_a_tenant_back():
+    async def run():
+        scheduler = make_scheduler(max_inflight=4)
+        first = await scheduler.acquire(bearer("capped-key"), 10)
+        second = asyncio.ensure_future(scheduler.acquire(bearer("capped-key"), 10))
+        other = await asyncio.wait_for(scheduler.acquire(bearer("light-key"), 10), 1)
+        await asyncio.sleep(0)
+        assert not second.done()
+        first.release()
+        (await asyncio.wait_for(second, 1)).release()
+        other.release()
+        assert scheduler.running == 0
+
+    asyncio.run(run())
+
+
+def test_rate_limit_and_refund():
+    async def run():
+        scheduler = make_scheduler(max_inflight=4)
+        ticket = await scheduler.acquire(bearer("metered-key"), 600)
+        with pytest.raises(RateLimitedError) as error:
+            await scheduler.acquire(bearer("metered-key"), 100)
+        assert error.value.retry_after > 0
+        # Only 200 of the 600 estimated tokens were used; the rest go back in the bucket.
+        ticket.release(200)
+        (await scheduler.acquire(bearer("metered-key"), 300)).release(300)
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects():
+    async def run():
+        scheduler = make_scheduler(max_queue_size=1)
+        running = await scheduler.acquire(bearer("light-key"), 10)
+        waiting = asyncio.ensure_future(scheduler.acquire(bearer("light-key"), 10))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await scheduler.acquire(bearer("heavy-key"), 10)
+        running.release()
+        (await asyncio.wait_for(waiting, 1)).release()
+
+    asyncio.run(run())
+
+
+def test_token_bucket_caps_oversized_requests_at_a_full_bucket():
+    bucket = TokenBucket(60)
+    assert bucket.take(1000) == 0.0
+    assert bucket.take(1) > 0
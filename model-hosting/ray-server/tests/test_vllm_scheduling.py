@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import pytest
+
+from serving_errors import QueueFullError
+from vllm_scheduling import ContextTooLongError, KVAdmissionScheduler, parse_tiers
+
+
+def make_scheduler(total_blocks=100, **kwargs):
+    tiers = parse_tiers("4096,8192", 16384)
+    return KVAdmissionScheduler(tiers, block_size=16, total_blocks=total_blocks, target_utilization=1.0,
+                                poll_interval_s=0.01, **kwargs)
+
+
+def test_parse_tiers_caps_at_max_model_len():
+    tiers = parse_tiers("4096,8192,32768", 16384)
+    assert [tier.max_tokens for tier in tiers] == [4096, 8192, 16384]
+    assert [tier.name for tier in tiers] == ["4k", "8k", "16k"]
+
+
+def test_classify_and_estimate():
+    scheduler = make_scheduler()
+    assert scheduler.classify(100).max_tokens == 4096
+    assert scheduler.classify(100, context_length=6000).max_tokens == 8192
+    with pytest.raises(ContextTooLongError):
+        scheduler.classify(20000)
+    # Prompt blocks are shared across samples; each sample gets its own tail plus one block.
+    assert scheduler.estimate_blocks(32, 32, n=2) == 2 + 2 * 3
+
+
+def test_admits_while_blocks_fit_and_queues_the_rest():
+    async def run():
+        scheduler = make_scheduler()
+        tier = scheduler.tiers[0]
+        first = await scheduler.admit(tier, 60)
+        second = asyncio.ensure_future(scheduler.admit(tier, 60))
+        await asyncio.sleep(0.02)
+        assert not second.done()
+        assert tier.waiting == 1
+
+        first.release()
+        lease = await asyncio.wait_for(second, 1)
+        assert scheduler.reserved_blocks == 60
+        lease.release()
+        lease.release()
+        assert scheduler.reserved_blocks == 0
+        assert tier.running == 0
+
+    asyncio.run(run())
+
+
+def test_idle_engine_takes_an_oversized_request():
+    async def run():
+        scheduler = make_scheduler(total_blocks=10)
+        lease = await scheduler.admit(scheduler.tiers[-1], 500)
+        assert scheduler.reserved_blocks == 500
+        lease.release()
+
+    asyncio.run(run())
+
+
+def test_without_kv_budget_everything_is_admitted():
+    async def run():
+        scheduler = make_scheduler(total_blocks=None)
+        leases = [await scheduler.admit(scheduler.tiers[0], 1000) for _ in range(5)]
+        assert scheduler.capacity_blocks is None
+        assert scheduler.reserved_blocks == 5000
+        for lease in leases:
+            lease.release()
+
+    asyncio.run(run())
+
+
+def test_small_requests_bypass_until_the_head_starves():
+    async def run():
+        scheduler = make_scheduler(starvation_s=0.05)
+        tier = scheduler.tiers[0]
+        running = await scheduler.admit(tier, 50)
+        large = asyncio.ensure_future(scheduler.admit(tier, 80))
+        await asyncio.sleep(0)
+
+        # Within the bypass window a request that fits passes the waiting large one.
+        small = await asyncio.wait_for(scheduler.admit(tier, 10), 1)
+        small.release()
+
+        time.sleep(0.06)
+        blocked = asyncio.ensure_future(scheduler.admit(tier, 10))
+        await asyncio.sleep(0.03)
+        assert not blocked.done()
+
+        running.release()
+        (await asyncio.wait_for(large, 1)).release()
+        (await asyncio.wait_for(blocked, 1)).release()
+        assert scheduler.reserved_blocks == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects():
+    async def run():
+        scheduler = make_scheduler(max_queue_size=1)
+        tier = scheduler.tiers[0]
+        running = await scheduler.admit(tier, 100)
+        waiting = asyncio.ensure_future(scheduler.admit(tier, 100))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await scheduler.admit(tier, 100)
+        running.release()
+        (await asyncio.wait_for(waiting, 1)).release()
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = make_scheduler()
+        tier = scheduler.tiers[0]
+        running = await scheduler.admit(tier, 100)
+        waiting = asyncio.ensure_future(scheduler.admit(tier, 100))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert tier.waiting == 0
+        running.release()
+        assert scheduler.reserved_blocks == 0
+
+    asyncio.run(run())
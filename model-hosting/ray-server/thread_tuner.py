@@ -0,0 +1,245 @@
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+
+import llama_cpp
+from llama_cpp import Llama
+
+logger = logging.getLogger("ray.serve")
+
+
+def parse_cpulist(cpulist: str) -> set:
+    """Parse a kernel cpulist such as "0-31,64-95" into a set of CPU ids."""
+    cpus = set()
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def read_cgroup_cpu_limit() -> float:
+    """CPUs granted by the cgroup CFS quota, or None when unlimited."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    for base in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+        try:
+            with open(os.path.join(base, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(base, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+            return None if quota <= 0 else quota / period
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def read_cpu_model() -> str:
+    """Identify the CPU, e.g. "0x41:0xd40" (Neoverse V1, Graviton3) on arm64."""
+    fields = {}
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return "unknown"
+    if "model name" in fields:
+        return fields["model name"]
+    if "CPU part" in fields:
+        return f"{fields.get('CPU implementer', '?')}:{fields['CPU part']}"
+    return "unknown"
+
+
+def read_ray_cpus() -> float:
+    try:
+        import ray
+        return ray.get_runtime_context().get_assigned_resources().get("CPU")
+    except Exception:
+        return None
+
+
+class CpuTopology:
+    """The CPUs this replica can actually use, from affinity, cgroup quota and Ray."""
+
+    def __init__(self, host_cpus: int, affinity: set, cgroup_limit: float, ray_cpus: float,
+                 numa_nodes: list, cpu_model: str):
+        self.host_cpus = host_cpus
+        self.affinity = affinity
+        self.cgroup_limit = cgroup_limit
+        self.ray_cpus = ray_cpus
+        self.numa_nodes = numa_nodes
+        self.cpu_model = cpu_model
+
+    @classmethod
+    def detect(cls) -> "CpuTopology":
+        affinity = os.sched_getaffinity(0)
+        numa_nodes = []
+        for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+            with open(path) as f:
+                cpus = parse_cpulist(f.read()) & affinity
+            if cpus:
+                numa_nodes.append(cpus)
+        return cls(
+            host_cpus=os.cpu_count(),
+            affinity=affinity,
+            cgroup_limit=read_cgroup_cpu_limit(),
+            ray_cpus=read_ray_cpus(),
+            numa_nodes=numa_nodes or [affinity],
+            cpu_model=read_cpu_model()
+        )
+
+    @property
+    def effective_cpus(self) -> int:
+        """Whole CPUs available: the tightest of affinity, cgroup quota and Ray's grant."""
+        limits = [len(self.affinity)] + [limit for limit in (self.cgroup_limit, self.ray_cpus) if limit]
+        return max(1, math.floor(min(limits)))
+
+    @property
+    def signature(self) -> str:
+        return f"{self.cpu_model}-{self.effective_cpus}cpu-{len(self.numa_nodes)}numa"
+
+    def thread_candidates(self) -> list:
+        """Thread counts worth trying: all CPUs, a NUMA node, and a few fractions."""
+        effective = self.effective_cpus
+        candidates = {effective, max(1, effective * 3 // 4), max(1, effective // 2)}
+        candidates.update(min(effective, len(node)) for node in self.numa_nodes)
+        return sorted(candidates, reverse=True)
+
+    def as_dict(self) -> dict:
+        return {
+            "host_cpus": self.host_cpus,
+            "affinity_cpus": len(self.affinity),
+            "cgroup_limit": self.cgroup_limit,
+            "ray_cpus": self.ray_cpus,
+            "numa_nodes": [len(node) for node in self.numa_nodes],
+            "cpu_model": self.cpu_model,
+            "effective_cpus": self.effective_cpus,
+        }
+
+
+class ThreadTuner:
+    """Picks n_threads, n_threads_batch and n_batch for a loaded model by measurement.
+
+    Single-token decode only uses n_threads and prefill only uses
+    n_threads_batch and n_batch, so the two are tuned independently: decode
+    tokens/sec over the thread candidates, then prefill tokens/sec over threads
+    x n_batch. The model must be loaded with n_batch >= max(n_batch_grid).
+    Results are cached as JSON profiles keyed by model file and CPU signature,
+    so every replica on the same instance type reuses the first one's choice.
+    """
+
+    def __init__(self, topology: CpuTopology, profile_dir: str, n_batch_grid=(128, 256, 512),
+                 decode_tokens: int = 32, prefill_tokens: int = 512, repeats: int = 2):
+        self.topology = topology
+        self.profile_dir = profile_dir
+        self.n_batch_grid = sorted(n_batch_grid)
+        self.decode_tokens = decode_tokens
+        self.prefill_tokens = prefill_tokens
+        self.repeats = repeats
+        self.profiles = {}
+
+    def profile_path(self, repo_id: str, filename: str) -> str:
+        key = hashlib.sha256(f"{repo_id}/{filename}/{self.topology.signature}".encode()).hexdigest()[:16]
+        return os.path.join(self.profile_dir, f"{repo_id.replace('/', '--')}-{key}.json")
+
+    def load_profile(self, path: str) -> dict:
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return profile if profile.get("cpu_signature") == self.topology.signature else None
+
+    def save_profile(self, path: str, profile: dict) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(profile, f, indent=2)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def apply(llm: Llama, n_threads: int, n_threads_batch: int, n_batch: int) -> None:
+        llama_cpp.llama_set_n_threads(llm._ctx.ctx, n_threads, n_threads_batch)
+        llm.n_threads = llm.context_params.n_threads = n_threads
+        llm.n_threads_batch = llm.context_params.n_threads_batch = n_threads_batch
+        # Llama.eval chunks prompts by n_batch; it must not exceed the context's.
+        llm.n_batch = min(n_batch, llm.context_params.n_batch)
+
+    def _time_decode(self, llm: Llama, token: int) -> float:
+        llm.reset()
+        llm.eval([token])
+        start = time.perf_counter()
+        for _ in range(self.decode_tokens):
+            llm.eval([token])
+        return self.decode_tokens / (time.perf_counter() - start)
+
+    def _time_prefill(self, llm: Llama, tokens: list) -> float:
+        llm.reset()
+        start = time.perf_counter()
+        llm.eval(tokens)
+        return len(tokens) / (time.perf_counter() - start)
+
+    def _benchmark(self, llm: Llama) -> dict:
+        n_prefill = min(self.prefill_tokens, llm.n_ctx() - self.decode_tokens - 2)
+        text = b"The quick brown fox jumps over the lazy dog. "
+        tokens = llm.tokenize(text * (n_prefill // 8 + 1), add_bos=True)[:n_prefill]
+        threads = self.topology.thread_candidates()
+        n_batches = [n for n in self.n_batch_grid if n <= llm.context_params.n_batch] or [llm.n_batch]
+
+        decode = {}
+        for n_threads in threads:
+            self.apply(llm, n_threads, threads[0], n_batches[-1])
+            decode[n_threads] = max(self._time_decode(llm, tokens[-1]) for _ in range(self.repeats))
+        prefill = {}
+        for n_threads_batch in threads:
+            for n_batch in n_batches:
+                self.apply(llm, threads[0], n_threads_batch, n_batch)
+                prefill[(n_threads_batch, n_batch)] = max(self._time_prefill(llm, tokens) for _ in range(self.repeats))
+        llm.reset()
+
+        best_threads = max(decode, key=decode.get)
+        best_threads_batch, best_batch = max(prefill, key=prefill.get)
+        logger.info(f"Decode tokens/s by n_threads: { {n: round(v, 1) for n, v in decode.items()} }")
+        logger.info(f"Prefill tokens/s by (n_threads_batch, n_batch): { {k: round(v, 1) for k, v in prefill.items()} }")
+        return {
+            "n_threads": best_threads,
+            "n_threads_batch": best_threads_batch,
+            "n_batch": best_batch,
+            "decode_tokens_per_s": round(decode[best_threads], 1),
+            "prefill_tokens_per_s": round(prefill[(best_threads_batch, best_batch)], 1),
+        }
+
+    def tune(self, name: str, repo_id: str, filename: str, llm: Llama) -> dict:
+        """Apply the cached profile for this model and CPU, benchmarking on a miss."""
+        path = self.profile_path(repo_id, filename)
+        profile = self.load_profile(path)
+        if profile is None:
+            logger.info(f"Auto-tuning threads for {name} on {self.topology.signature}")
+            profile = {
+                **self._benchmark(llm),
+                "model": f"{repo_id}/{filename}",
+                "cpu_signature": self.topology.signature,
+                "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            self.save_profile(path, profile)
+        else:
+            logger.info(f"Using cached thread profile {path}")
+        self.apply(llm, profile["n_threads"], profile["n_threads_batch"], profile["n_batch"])
+        logger.info(f"{name}: n_threads={profile['n_threads']} n_threads_batch={profile['n_threads_batch']} "
+                    f"n_batch={profile['n_batch']}")
+        self.profiles[name] = profile
+        return profile
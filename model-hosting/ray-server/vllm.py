@@ -1,11 +1,15 @@
+import asyncio
 import json
+import math
+import time
 from typing import AsyncGenerator
-from fastapi import BackgroundTasks
+from fastapi import BackgroundTasks, FastAPI
+from starlette.background import BackgroundTask
 from starlette.requests import Request
 from starlette.responses import StreamingResponse, Response, JSONResponse
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
-from vllm.sampling_params import SamplingParams
+from vllm.sampling_params import GuidedDecodingParams, SamplingParams
 from vllm.utils import random_uuid
 from ray import serve
 import os
@@ -13,13 +17,21 @@ import logging
 
 from huggingface_hub import login
 
+from serving_errors import QueueFullError
+from tenant_scheduling import RequestLease, TenantScheduler
+from vllm_scheduling import ContextTooLongError, KVAdmissionScheduler, parse_tiers
+from vllm_speculative import SpecDecodeStatLogger, speculative_engine_args
+
 # Environment and configuration setup
 logger = logging.getLogger("ray.serve")
 
+app = FastAPI()
+
 @serve.deployment(name="mistral-deployment", route_prefix="/vllm",
     ray_actor_options={"num_gpus": 1},
     autoscaling_config={"min_replicas": 1, "max_replicas": 2},
 )
+@serve.ingress(app)
 class VLLMDeployment:
     def __init__(self, **kwargs):
         hf_token = os.getenv("HUGGING_FACE_HUB_TOKEN")
@@ -29,12 +41,14 @@ class VLLMDeployment:
         login(token=hf_token)
         logger.info("Successfully logged in to Hugging Face Hub")
 
+        self.model_id = os.getenv("MODEL_ID", "mistralai/Mistral-7B-Instruct-v0.2")
+        self.max_num_seqs = int(os.getenv("MAX_NUM_SEQ", "512"))
         args = AsyncEngineArgs(
-            model=os.getenv("MODEL_ID", "mistralai/Mistral-7B-Instruct-v0.2"),  # Model identifier from Hugging Face Hub or local path.
+            model=self.model_id,  # Model identifier from Hugging Face Hub or local path.
             dtype="auto",  # Automatically determine the data type (e.g., float16 or float32) for model weights and computations.
             gpu_memory_utilization=float(os.getenv("GPU_MEMORY_UTILIZATION", "0.8")),  # Percentage of GPU memory to utilize, reserving some for overhead.
             max_model_len=int(os.getenv("MAX_MODEL_LEN", "4096")),  # Maximum sequence length (in tokens) the model can handle, including both input and output tokens.
-            max_num_seqs=int(os.getenv("MAX_NUM_SEQ", "512")),  # Maximum number of sequences (requests) to process in parallel.
+            max_num_seqs=self.max_num_seqs,  # Maximum number of sequences (requests) to process in parallel.
             max_num_batched_tokens=int(os.getenv("MAX_NUM_BATCHED_TOKENS", "32768")),  # Maximum number of tokens processed in a single batch across all sequences (max_model_len * max_num_seqs).
             trust_remote_code=True,  # Allow execution of untrusted code from the model repository (use with caution).
             enable_chunked_prefill=False,  # Disable chunked prefill to avoid compatibility issues with prefix caching.
@@ -46,86 +60,408 @@ class VLLMDeployment:
             enable_prefix_caching=True,  # Enable prefix caching to improve performance for similar prompt prefixes.
             enforce_eager=True,
             disable_log_requests=True,
+            disable_log_stats=False,  # Keep engine stats flowing so speculative acceptance can be exported.
+            **speculative_engine_args(),  # Opt-in draft-model or n-gram speculation via SPECULATIVE_MODE.
         )
 
         self.engine = AsyncLLMEngine.from_engine_args(args)
+        self.spec_logger = None
+        if args.speculative_config:
+            self.spec_logger = SpecDecodeStatLogger(model=self.model_id)
+            self.engine.engine.add_logger("spec_decode", self.spec_logger)
         self.max_model_len = args.max_model_len
+        # Fetched from the engine once, on the first request, instead of per request.
+        self.tokenizer = None
+        self.model_config = None
+        # Concurrent first requests must not build two schedulers or see a half-set state.
+        self.engine_info_lock = asyncio.Lock()
+        # Prompts longer than this are tokenized on a worker thread so a big RAG
+        # context does not stall every other stream on the event loop.
+        self.inline_tokenize_chars = int(os.getenv("INLINE_TOKENIZE_CHARS", "4096"))
+        # Requests that name neither context_length nor max_tokens get this context.
+        self.default_context_length = int(os.getenv("DEFAULT_CONTEXT_LENGTH", "8192"))
+        self.scheduler = None
+        # Tenant fair-share queue in front of KV admission; see TENANTS_CONFIG.
+        self.tenants = TenantScheduler.from_env(max_inflight=self.max_num_seqs)
         logger.info(f"VLLM Engine initialized with max_model_len: {self.max_model_len}")
 
-    async def stream_results(self, results_generator) -> AsyncGenerator[bytes, None]:
+    async def engine_info(self):
+        if self.tokenizer is None:
+            async with self.engine_info_lock:
+                if self.tokenizer is None:
+                    self.model_config = await self.engine.get_model_config()
+                    self.max_model_len = self.model_config.max_model_len
+                    tokenizer = await self.engine.get_tokenizer()
+                    self.scheduler = self.build_scheduler()
+                    # Set last: a non-None tokenizer means the scheduler is ready too.
+                    self.tokenizer = tokenizer
+        return self.tokenizer, self.model_config
+
+    def build_scheduler(self) -> KVAdmissionScheduler:
+        """Size KV admission from the engine's profiled cache (KV_CACHE_BLOCKS overrides).
+
+        The cache layout is read from V0 engine internals; engines that do not
+        expose them get a scheduler without a KV budget, so only tiering and
+        the queue limit apply.
+        """
+        tiers = parse_tiers(os.getenv("CONTEXT_TIERS", "4096,8192,32768"), self.max_model_len)
+        try:
+            llm_engine = self.engine.engine
+            block_size = llm_engine.cache_config.block_size
+            total_blocks = int(os.getenv("KV_CACHE_BLOCKS", "0")) or llm_engine.cache_config.num_gpu_blocks
+            engine_free_blocks = None
+            if total_blocks:
+                block_managers = [scheduler.block_manager for scheduler in llm_engine.scheduler]
+
+                def engine_free_blocks():
+                    return sum(block_manager.get_num_free_gpu_blocks() for block_manager in block_managers)
+            else:
+                total_blocks = math.ceil(self.max_model_len * self.max_num_seqs / block_size)
+                logger.warning(f"Engine did not report num_gpu_blocks, assuming {total_blocks}")
+        except AttributeError as e:
+            logger.warning(f"Engine does not expose its KV cache layout ({e}); admitting without a KV budget")
+            block_size, total_blocks, engine_free_blocks = 16, None, None
+
+        logger.info(f"KV admission: {total_blocks} blocks of {block_size} tokens, "
+                    f"tiers {[tier.max_tokens for tier in tiers]}")
+        return KVAdmissionScheduler(
+            tiers,
+            block_size=block_size,
+            total_blocks=total_blocks,
+            engine_free_blocks=engine_free_blocks,
+            target_utilization=float(os.getenv("KV_TARGET_UTILIZATION", "0.9")),
+            max_queue_size=int(os.getenv("MAX_QUEUE_SIZE", "256")),
+            starvation_s=float(os.getenv("ADMISSION_STARVATION_S", "2.0"))
+        )
+
+    async def reserve(self, request: Request, body: dict, input_tokens: int):
+        """Pick the request's context tier, wait for its tenant's turn, then for its KV blocks.
+
+        Returns (sampling_params, lease); the lease must be released with the
+        tokens used when the request finishes. Raises ValueError for requests
+        that cannot be served (ContextTooLongError, bad sampling settings or
+        response_format) and QueueFullError (RateLimitedError for tenants over
+        their token rate) when overloaded.
+        """
+        if input_tokens + 1 > self.max_model_len:
+            raise ContextTooLongError(
+                f"Prompt of {input_tokens} tokens leaves no room to generate within max_model_len {self.max_model_len}")
+        requested = body.get("max_tokens")
+        context_length = body.get("context_length")
+        if context_length is None and requested is None:
+            context_length = self.default_context_length
+        # Oversized requests are clamped to the model's context, as sampling_params does.
+        if context_length is not None:
+            context_length = min(context_length, self.max_model_len)
+        tier = self.scheduler.classify(min(input_tokens + (requested or 1), self.max_model_len), context_length)
+        sampling_params = self.sampling_params(body, input_tokens, tier.max_tokens)
+        blocks = self.scheduler.estimate_blocks(input_tokens, sampling_params.max_tokens, sampling_params.n)
+        cost = input_tokens + sampling_params.max_tokens * sampling_params.n
+        ticket = await self.tenants.acquire(request.headers, cost)
+        try:
+            kv_lease = await self.scheduler.admit(tier, blocks)
+        except BaseException:
+            ticket.release(0)
+            raise
+        return sampling_params, RequestLease(ticket, kv_lease)
+
+    def rejection_response(self, error: Exception) -> JSONResponse:
+        if isinstance(error, QueueFullError):
+            logger.warning(f"Rejecting request: {str(error)}")
+            retry_after = math.ceil(getattr(error, "retry_after", 1))
+            return JSONResponse(status_code=429, headers={"Retry-After": str(retry_after)},
+                                content={"error": str(error)})
+        return JSONResponse(status_code=400, content={"error": str(error)})
+
+    async def tokenize(self, fn, *args, size: int, **kwargs) -> list:
+        """Run a tokenizer call, off the event loop when the input is large."""
+        if size > self.inline_tokenize_chars:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    async def stream_results(self, results_generator, lease) -> AsyncGenerator[bytes, None]:
         num_returned = 0
-        async for request_output in results_generator:
-            text_outputs = [output.text for output in request_output.outputs]
-            assert len(text_outputs) == 1
-            text_output = text_outputs[0][num_returned:]
-            ret = {"text": text_output}
-            yield (json.dumps(ret) + "\n").encode("utf-8")
-            num_returned += len(text_output)
+        final_output = None
+        try:
+            async for request_output in results_generator:
+                final_output = request_output
+                text_outputs = [output.text for output in request_output.outputs]
+                assert len(text_outputs) == 1
+                text_output = text_outputs[0][num_returned:]
+                ret = {"text": text_output}
+                yield (json.dumps(ret) + "\n").encode("utf-8")
+                num_returned += len(text_output)
+        finally:
+            lease.release(self.used_tokens(final_output))
 
     async def may_abort_request(self, request_id) -> None:
         await self.engine.abort(request_id)
 
-    async def __call__(self, request: Request) -> Response:
+    async def finish_stream(self, request_id, lease) -> None:
+        """Background task for streaming responses: abort the request and release its lease.
+
+        Runs even when the body was never iterated, so the stream's own finally
+        never ran; both steps are no-ops for a request that already finished.
+        """
         try:
-            request_dict = await request.json()
+            await self.may_abort_request(request_id)
+        finally:
+            lease.release()
+
+    def sampling_params(self, body: dict, input_tokens: int, context_length: int) -> SamplingParams:
+        max_possible_new_tokens = min(context_length, self.max_model_len) - input_tokens
+        return SamplingParams(
+            n=body.get("n", 1),
+            max_tokens=min(body.get("max_tokens") or max_possible_new_tokens, max_possible_new_tokens),
+            temperature=body.get("temperature", 0.7),
+            top_p=body.get("top_p", 0.9),
+            top_k=body.get("top_k", 50),
+            stop=body.get("stop", None),
+            seed=body.get("seed", None),
+            guided_decoding=self.guided_decoding(body.get("response_format")),
+        )
+
+    @staticmethod
+    def guided_decoding(response_format) -> GuidedDecodingParams:
+        """Map an OpenAI response_format onto vLLM guided decoding, None for plain text."""
+        if not response_format:
+            return None
+        if not isinstance(response_format, dict):
+            raise ValueError("response_format must be an object")
+        if response_format.get("type", "text") == "text":
+            return None
+        if response_format["type"] == "json_object":
+            return GuidedDecodingParams(json_object=True)
+        if response_format["type"] == "json_schema":
+            schema = (response_format.get("json_schema") or {}).get("schema")
+            if not isinstance(schema, dict):
+                raise ValueError("response_format.json_schema.schema must be a JSON schema object")
+            return GuidedDecodingParams(json=schema)
+        raise ValueError(f"Unsupported response_format type {response_format['type']}")
+
+    @classmethod
+    def used_tokens(cls, final_output) -> int:
+        return cls.usage(final_output)["total_tokens"] if final_output is not None else None
+
+    @staticmethod
+    def usage(final_output) -> dict:
+        prompt_tokens = len(final_output.prompt_token_ids)
+        completion_tokens = sum(len(output.token_ids) for output in final_output.outputs)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    async def stream_openai(self, request_id: str, results_generator, lease, chat: bool, n: int,
+                            include_usage: bool) -> AsyncGenerator[str, None]:
+        """Yield OpenAI SSE chunks, one event per engine step covering every choice.
+
+        The id/object/created/model envelope is serialized once per request, so
+        each step only encodes the new deltas; with n>1 all choices that advanced
+        in a step share a single event.
+        """
+        object_type = "chat.completion.chunk" if chat else "text_completion"
+        envelope = (
+            'data: {"id":' + json.dumps(request_id) + ',"object":"' + object_type + '","created":'
+            + str(int(time.time())) + ',"model":' + json.dumps(self.model_id) + ',"choices":'
+        )
+        sent = [0] * n
+        final_output = None
+        finished = False
+        try:
+            if chat:
+                roles = [{"index": i, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}
+                         for i in range(n)]
+                yield envelope + json.dumps(roles, separators=(",", ":")) + "}\n\n"
+
+            async for request_output in results_generator:
+                final_output = request_output
+                choices = []
+                for output in request_output.outputs:
+                    delta = output.text[sent[output.index]:]
+                    if not delta and output.finish_reason is None:
+                        continue
+                    sent[output.index] = len(output.text)
+                    if chat:
+                        choices.append({
+                            "index": output.index,
+                            "delta": {"content": delta} if delta else {},
+                            "finish_reason": output.finish_reason
+                        })
+                    else:
+                        choices.append({"index": output.index, "text": delta, "finish_reason": output.finish_reason})
+                if choices:
+                    yield envelope + json.dumps(choices, separators=(",", ":")) + "}\n\n"
+            finished = True
+
+            if include_usage and final_output is not None:
+                yield envelope + '[],"usage":' + json.dumps(self.usage(final_output)) + "}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            if not finished:
+                # Client went away mid-stream: free the sequence's KV blocks.
+                await self.engine.abort(request_id)
+            lease.release(self.used_tokens(final_output))
+
+    async def generate_openai(self, request: Request, body: dict, prompt_token_ids: list, chat: bool) -> Response:
+        input_tokens = len(prompt_token_ids)
+        try:
+            sampling_params, lease = await self.reserve(request, body, input_tokens)
+        except (ValueError, QueueFullError) as e:
+            return self.rejection_response(e)
+
+        prefix = "chatcmpl-" if chat else "cmpl-"
+        request_id = prefix + random_uuid()
+        logger.info(f"Processing request {request_id} with {input_tokens} input tokens")
+        # Pre-tokenized, so vLLM does not encode the prompt a second time.
+        results_generator = self.engine.generate({"prompt_token_ids": prompt_token_ids}, sampling_params, request_id)
+
+        if body.get("stream", False):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self.stream_openai(request_id, results_generator, lease, chat, sampling_params.n, include_usage),
+                media_type="text/event-stream",
+                background=BackgroundTask(self.finish_stream, request_id, lease)
+            )
+
+        final_output = None
+        try:
+            async for request_output in results_generator:
+                if await request.is_disconnected():
+                    await self.engine.abort(request_id)
+                    logger.warning(f"Client disconnected for request {request_id}")
+                    return Response(status_code=499)
+                final_output = request_output
+        finally:
+            lease.release(self.used_tokens(final_output))
+
+        if final_output is None:
+            logger.error(f"Request {request_id} produced no output")
+            return JSONResponse(status_code=500, content={"error": "The engine returned no output"})
+        if chat:
+            choices = [{
+                "index": output.index,
+                "message": {"role": "assistant", "content": output.text},
+                "finish_reason": output.finish_reason
+            } for output in final_output.outputs]
+        else:
+            choices = [{
+                "index": output.index,
+                "text": output.text,
+                "finish_reason": output.finish_reason
+            } for output in final_output.outputs]
+        logger.info(f"Completed request {request_id}")
+        return JSONResponse(content={
+            "id": request_id,
+            "object": "chat.completion" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": self.model_id,
+            "choices": choices,
+            "usage": self.usage(final_output)
+        })
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(self, request: Request) -> Response:
+        try:
+            body = await request.json()
         except json.JSONDecodeError:
             return JSONResponse(status_code=400, content={"error": "Invalid JSON in request body"})
+        messages = body.get("messages")
+        if not messages:
+            return JSONResponse(status_code=400, content={"error": "messages are required"})
 
-        context_length = request_dict.pop("context_length", 8192)  # Default to 8k
+        tokenizer, _ = await self.engine_info()
+        size = sum(len(str(message.get("content") or "")) for message in messages)
+        try:
+            # Tokenizing the rendered template directly avoids a second BOS from encode().
+            prompt_token_ids = await self.tokenize(
+                tokenizer.apply_chat_template, messages, size=size, tokenize=True, add_generation_prompt=True
+            )
+        except Exception as e:
+            return JSONResponse(status_code=400, content={"error": f"Invalid messages: {str(e)}"})
+        return await self.generate_openai(request, body, prompt_token_ids, chat=True)
+
+    @app.post("/v1/completions")
+    async def completions(self, request: Request) -> Response:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return JSONResponse(status_code=400, content={"error": "Invalid JSON in request body"})
+        prompt = body.get("prompt")
+        if isinstance(prompt, list) and len(prompt) == 1:
+            prompt = prompt[0]
+        if not isinstance(prompt, str):
+            return JSONResponse(status_code=400, content={"error": "prompt must be a single string"})
+        tokenizer, _ = await self.engine_info()
+        prompt_token_ids = await self.tokenize(tokenizer.encode, prompt, size=len(prompt))
+        return await self.generate_openai(request, body, prompt_token_ids, chat=False)
+
+    @app.post("/")
+    async def generate(self, request: Request) -> Response:
+        try:
+            request_dict = await request.json()
+        except json.JSONDecodeError:
+            return JSONResponse(status_code=400, content={"error": "Invalid JSON in request body"})
 
-        # Ensure context length is either 8k or 32k
-        if context_length not in [8192, 32768]:
-            context_length = 8192  # Default to 8k if invalid
         prompt = request_dict.pop("prompt")
         stream = request_dict.pop("stream", False)
 
-        # Get model config and tokenizer
-        model_config = await self.engine.get_model_config()
-        tokenizer = await self.engine.get_tokenizer()
+        tokenizer, _ = await self.engine_info()
 
-        input_token_ids = tokenizer.encode(prompt)
+        input_token_ids = await self.tokenize(tokenizer.encode, prompt, size=len(prompt))
         input_tokens = len(input_token_ids)
-        max_possible_new_tokens = min(context_length, model_config.max_model_len) - input_tokens
-        max_new_tokens = min(request_dict.get("max_tokens", 8192), max_possible_new_tokens)
-
-        sampling_params = SamplingParams(
-            max_tokens=max_new_tokens,
-            temperature=request_dict.get("temperature", 0.7),
-            top_p=request_dict.get("top_p", 0.9),
-            top_k=request_dict.get("top_k", 50),
-            stop=request_dict.get("stop", None),
-        )
+        # context_length picks the tier; any size up to the largest tier is accepted now.
+        try:
+            sampling_params, lease = await self.reserve(request, request_dict, input_tokens)
+        except (ValueError, QueueFullError) as e:
+            return self.rejection_response(e)
 
         request_id = random_uuid()
         logger.info(f"Processing request {request_id} with {input_tokens} input tokens")
 
-        results_generator = self.engine.generate(prompt, sampling_params, request_id)
+        results_generator = self.engine.generate({"prompt_token_ids": input_token_ids}, sampling_params, request_id)
 
         if stream:
             background_tasks = BackgroundTasks()
-            # Using background_tasks to abort the request
-            # if the client disconnects.
-            background_tasks.add_task(self.may_abort_request, request_id)
+            # Using background_tasks to abort the request and free its
+            # lease if the client disconnects.
+            background_tasks.add_task(self.finish_stream, request_id, lease)
             return StreamingResponse(
-                self.stream_results(results_generator), background=background_tasks
+                self.stream_results(results_generator, lease), background=background_tasks
             )
 
         # Non-streaming case
         final_output = None
-        async for request_output in results_generator:
-            if await request.is_disconnected():
-                # Abort the request if the client disconnects.
-                await self.engine.abort(request_id)
-                logger.warning(f"Client disconnected for request {request_id}")
-                return Response(status_code=499)
-            final_output = request_output
+        try:
+            async for request_output in results_generator:
+                if await request.is_disconnected():
+                    # Abort the request if the client disconnects.
+                    await self.engine.abort(request_id)
+                    logger.warning(f"Client disconnected for request {request_id}")
+                    return Response(status_code=499)
+                final_output = request_output
+        finally:
+            lease.release(self.used_tokens(final_output))
 
-        assert final_output is not None
-        prompt = final_output.prompt
+        if final_output is None:
+            logger.error(f"Request {request_id} produced no output")
+            return JSONResponse(status_code=500, content={"error": "The engine returned no output"})
         text_outputs = [prompt + output.text for output in final_output.outputs]
         ret = {"text": text_outputs}
         logger.info(f"Completed request {request_id}")
         return Response(content=json.dumps(ret))
 
 
+    @app.get("/health")
+    async def health_check(self):
+        return {
+            "status": "healthy",
+            "model": self.model_id,
+            "admission": self.scheduler.stats() if self.scheduler else None,
+            "tenants": self.tenants.stats(),
+            "speculative": self.spec_logger.stats() if self.spec_logger else None
+        }
+
+
 deployment = VLLMDeployment.bind()
\ No newline at end of file
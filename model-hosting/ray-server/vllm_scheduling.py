@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import math
+import time
+
+from ray.serve import metrics
+
+from serving_errors import QueueFullError
+
+logger = logging.getLogger("ray.serve")
+
+
+class ContextTooLongError(ValueError):
+    """Raised when a request needs more context than the largest tier."""
+
+
+class ContextTier:
+    def __init__(self, name: str, max_tokens: int):
+        self.name = name
+        self.max_tokens = max_tokens
+        self.running = 0
+        self.waiting = 0
+
+
+def parse_tiers(spec: str, max_model_len: int) -> list:
+    """Build tiers from "4096,8192,32768", dropping any beyond max_model_len.
+
+    max_model_len always becomes the top tier so every admissible request
+    has a tier.
+    """
+    sizes = sorted({int(size) for size in spec.split(",") if size.strip()} | {max_model_len})
+    return [ContextTier(f"{size // 1024}k" if size % 1024 == 0 else str(size), size)
+            for size in sizes if size <= max_model_len]
+
+
+class KVLease:
+    """KV blocks reserved for one admitted request; release() returns them."""
+
+    def __init__(self, scheduler: "KVAdmissionScheduler", tier: ContextTier, blocks: int):
+        self.scheduler = scheduler
+        self.tier = tier
+        self.blocks = blocks
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+
+class _Waiter:
+    def __init__(self, tier: ContextTier, blocks: int, future: asyncio.Future):
+        self.tier = tier
+        self.blocks = blocks
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class KVAdmissionScheduler:
+    """Admits requests only while their worst-case KV blocks fit in the cache.
+
+    Each request is classified into the smallest context tier that holds its
+    prompt plus max_tokens, and reserves the prompt's blocks once plus a
+    max_tokens-sized tail for each of its n samples. A request starts when
+    reserved blocks stay under target_utilization of the cache and the engine's
+    own block usage is below that mark too; otherwise it waits, so vLLM is never
+    pushed into preempting running sequences. Waiters are served FIFO; smaller
+    requests may pass one that does not fit yet, but only until it has waited
+    starvation_s, after which it holds the line so long contexts still start.
+    With total_blocks None there is no KV budget and every request is admitted.
+    """
+
+    def __init__(self, tiers: list, block_size: int, total_blocks: int, engine_free_blocks=None,
+                 target_utilization: float = 0.9, max_queue_size: int = 256, starvation_s: float = 2.0,
+                 poll_interval_s: float = 0.05):
+        self.tiers = tiers
+        self.block_size = block_size
+        self.total_blocks = total_blocks
+        self.engine_free_blocks = engine_free_blocks
+        self.target_utilization = target_utilization
+        self.max_queue_size = max_queue_size
+        self.starvation_s = starvation_s
+        self.poll_interval_s = poll_interval_s
+        self.reserved_blocks = 0
+        self._waiters = []
+        self._poller = None
+        self._rejected = 0
+
+        self._queue_depth = metrics.Gauge(
+            "vllm_tier_queue_depth",
+            description="Requests waiting for KV cache admission, by context tier.",
+            tag_keys=("tier",),
+        )
+        self._running = metrics.Gauge(
+            "vllm_tier_running",
+            description="Admitted requests, by context tier.",
+            tag_keys=("tier",),
+        )
+        self._wait = metrics.Histogram(
+            "vllm_admission_wait_seconds",
+            description="Time a request waited for KV cache admission.",
+            boundaries=[0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60],
+            tag_keys=("tier",),
+        )
+        self._rejections = metrics.Counter(
+            "vllm_admission_rejected_total",
+            description="Requests rejected because the admission queue was full.",
+            tag_keys=("tier",),
+        )
+        self._reserved = metrics.Gauge(
+            "vllm_kv_reserved_blocks",
+            description="KV cache blocks reserved by admitted requests.",
+        )
+
+    @property
+    def capacity_blocks(self) -> int:
+        if self.total_blocks is None:
+            return None
+        return int(self.total_blocks * self.target_utilization)
+
+    def classify(self, tokens: int, context_length: int = None) -> ContextTier:
+        """Smallest tier holding both the request's tokens and its requested context."""
+        needed = max(tokens, context_length or 0)
+        for tier in self.tiers:
+            if needed <= tier.max_tokens:
+                return tier
+        raise ContextTooLongError(f"{needed} tokens exceeds the largest context tier ({self.tiers[-1].max_tokens})")
+
+    def estimate_blocks(self, prompt_tokens: int, max_new_tokens: int, n: int = 1) -> int:
+        prompt_blocks = math.ceil(prompt_tokens / self.block_size)
+        # With n>1 the prompt blocks are shared; each sample grows its own tail.
+        output_blocks = math.ceil(max_new_tokens / self.block_size) + 1
+        return prompt_blocks + n * output_blocks
+
+    def _engine_saturated(self) -> bool:
+        if self.engine_free_blocks is None:
+            return False
+        try:
+            free = self.engine_free_blocks()
+        except Exception:
+            return False
+        return (self.total_blocks - free) / self.total_blocks > self.target_utilization
+
+    def _fits(self, blocks: int) -> bool:
+        if self.total_blocks is None or self.reserved_blocks == 0:
+            # An idle engine always takes one request, however large.
+            return True
+        return self.reserved_blocks + blocks <= self.capacity_blocks and not self._engine_saturated()
+
+    def _grant(self, tier: ContextTier, blocks: int) -> KVLease:
+        self.reserved_blocks += blocks
+        tier.running += 1
+        self._reserved.set(self.reserved_blocks)
+        self._running.set(tier.running, tags={"tier": tier.name})
+        return KVLease(self, tier, blocks)
+
+    def _dispatch(self) -> None:
+        for waiter in list(self._waiters):
+            if waiter.future.done():
+                self._remove(waiter)
+                continue
+            if self._fits(waiter.blocks):
+                self._remove(waiter)
+                waiter.future.set_result(self._grant(waiter.tier, waiter.blocks))
+            elif time.monotonic() - waiter.enqueued_at > self.starvation_s:
+                break
+
+    def _remove(self, waiter: _Waiter) -> None:
+        self._waiters.remove(waiter)
+        waiter.tier.waiting -= 1
+        self._queue_depth.set(waiter.tier.waiting, tags={"tier": waiter.tier.name})
+
+    def _release(self, lease: KVLease) -> None:
+        self.reserved_blocks -= lease.blocks
+        lease.tier.running -= 1
+        self._reserved.set(self.reserved_blocks)
+        self._running.set(lease.tier.running, tags={"tier": lease.tier.name})
+        self._dispatch()
+
+    async def _poll(self) -> None:
+        # Engine block usage changes without any release here; re-check while anyone waits.
+        while self._waiters:
+            await asyncio.sleep(self.poll_interval_s)
+            self._dispatch()
+        self._poller = None
+
+    async def admit(self, tier: ContextTier, blocks: int) -> KVLease:
+        """Wait until the request's blocks fit, then return its lease."""
+        if not self._waiters and self._fits(blocks):
+            self._wait.observe(0.0, tags={"tier": tier.name})
+            return self._grant(tier, blocks)
+        if len(self._waiters) >= self.max_queue_size:
+            self._rejected += 1
+            self._rejections.inc(tags={"tier": tier.name})
+            raise QueueFullError(f"KV admission queue is full ({self.max_queue_size} requests waiting)")
+
+        waiter = _Waiter(tier, blocks, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        tier.waiting += 1
+        self._queue_depth.set(tier.waiting, tags={"tier": tier.name})
+        # It may fit behind a head-of-line request that is still within its bypass window.
+        self._dispatch()
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            lease = await waiter.future
+        except asyncio.CancelledError:
+            # Client went away while queued; hand back blocks granted in the meantime.
+            if waiter.future.done() and not waiter.future.cancelled():
+                waiter.future.result().release()
+            elif waiter in self._waiters:
+                self._remove(waiter)
+            raise
+        self._wait.observe(time.monotonic() - waiter.enqueued_at, tags={"tier": tier.name})
+        return lease
+
+    def stats(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "total_blocks": self.total_blocks,
+            "reserved_blocks": self.reserved_blocks,
+            "target_utilization": self.target_utilization,
+            "rejected": self._rejected,
+            "tiers": {
+                tier.name: {"max_tokens": tier.max_tokens, "running": tier.running, "waiting": tier.waiting}
+                for tier in self.tiers
+            },
+        }
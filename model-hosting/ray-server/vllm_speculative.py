@@ -0,0 +1,114 @@
+import logging
+import math
+import os
+
+from ray.serve import metrics
+
+logger = logging.getLogger("ray.serve")
+
+
+def speculative_engine_args() -> dict:
+    """AsyncEngineArgs for SPECULATIVE_MODE: "ngram" (prompt lookup) or "draft".
+
+    ngram proposes continuations copied from earlier in the prompt, which suits
+    RAG answers and code edits and needs no extra weights. draft runs the small
+    SPECULATIVE_MODEL (same tokenizer as the target) ahead of the target model.
+    Uses the speculative_config dict (vLLM 0.8+); the older speculative_model
+    and ngram_prompt_lookup_* engine arguments have been removed.
+    """
+    mode = os.getenv("SPECULATIVE_MODE", "").lower()
+    if not mode:
+        return {}
+    speculative_config = {"num_speculative_tokens": int(os.getenv("NUM_SPECULATIVE_TOKENS", "4"))}
+    if mode == "ngram":
+        speculative_config.update(
+            method="ngram",
+            prompt_lookup_max=int(os.getenv("NGRAM_PROMPT_LOOKUP_MAX", "4")),
+            prompt_lookup_min=int(os.getenv("NGRAM_PROMPT_LOOKUP_MIN", "1")),
+        )
+    elif mode == "draft":
+        draft_model = os.getenv("SPECULATIVE_MODEL")
+        if not draft_model:
+            raise ValueError("SPECULATIVE_MODE=draft requires SPECULATIVE_MODEL")
+        speculative_config["model"] = draft_model
+    else:
+        raise ValueError(f"Unknown SPECULATIVE_MODE {mode}, expected ngram or draft")
+    logger.info(f"Speculative decoding enabled: {speculative_config}")
+    return {"speculative_config": speculative_config}
+
+
+class SpecDecodeStatLogger:
+    """vLLM stat logger exporting speculative decoding acceptance to Ray metrics.
+
+    The engine reports cumulative draft/accepted/emitted token counts in
+    Stats.spec_decode_metrics; they are turned into counters here alongside
+    the draft acceptance rate and system efficiency gauges.
+    """
+
+    def __init__(self, model: str = ""):
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        self.emitted_tokens = 0
+        self.acceptance_rate = 0.0
+        self.system_efficiency = 0.0
+
+        self._draft = metrics.Counter(
+            "vllm_spec_decode_draft_tokens_total",
+            description="Tokens proposed by the speculative draft.",
+            tag_keys=("model",),
+        )
+        self._accepted = metrics.Counter(
+            "vllm_spec_decode_accepted_tokens_total",
+            description="Draft tokens accepted by the target model.",
+            tag_keys=("model",),
+        )
+        self._emitted = metrics.Counter(
+            "vllm_spec_decode_emitted_tokens_total",
+            description="Tokens emitted by speculative decoding steps.",
+            tag_keys=("model",),
+        )
+        self._acceptance_rate = metrics.Gauge(
+            "vllm_spec_decode_acceptance_rate",
+            description="Fraction of draft tokens accepted by the target model.",
+            tag_keys=("model",),
+        )
+        self._efficiency = metrics.Gauge(
+            "vllm_spec_decode_system_efficiency",
+            description="Emitted tokens over the maximum a speculative step could emit.",
+            tag_keys=("model",),
+        )
+        for metric in (self._draft, self._accepted, self._emitted, self._acceptance_rate, self._efficiency):
+            metric.set_default_tags({"model": model})
+
+    def _advance(self, counter, previous: int, current: int) -> int:
+        if current > previous:
+            counter.inc(current - previous)
+        return current
+
+    def log(self, stats) -> None:
+        spec = getattr(stats, "spec_decode_metrics", None)
+        if spec is None:
+            return
+        self.draft_tokens = self._advance(self._draft, self.draft_tokens, spec.draft_tokens)
+        self.accepted_tokens = self._advance(self._accepted, self.accepted_tokens, spec.accepted_tokens)
+        self.emitted_tokens = self._advance(self._emitted, self.emitted_tokens, spec.emitted_tokens)
+        if not self.draft_tokens:
+            return
+        # vLLM reports NaN rates until the first draft; derive them from the counts instead.
+        self.acceptance_rate = self.accepted_tokens / self.draft_tokens
+        if not math.isnan(spec.system_efficiency):
+            self.system_efficiency = spec.system_efficiency
+        self._acceptance_rate.set(self.acceptance_rate)
+        self._efficiency.set(self.system_efficiency)
+
+    def info(self, type: str, obj) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "draft_tokens": self.draft_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "emitted_tokens": self.emitted_tokens,
+            "acceptance_rate": round(self.acceptance_rate, 4),
+            "system_efficiency": round(self.system_efficiency, 4),
+        }